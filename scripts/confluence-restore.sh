@@ -1,15 +1,18 @@
 #!/usr/bin/env bash
 # ═══════════════════════════════════════════════════════════════
-# CONFLUENCE-RESTORE.SH — Restore Confluence page from local backup
+# CONFLUENCE-RESTORE.SH — Restore Confluence page from local history
 # ═══════════════════════════════════════════════════════════════
 # Usage:
 #   ./scripts/confluence-restore.sh --page-id 83951683                  # restore latest backup
-#   ./scripts/confluence-restore.sh --page-id 83951683 --list           # list available backups
-#   ./scripts/confluence-restore.sh --page-id 83951683 --backup FILE    # restore specific backup
+#   ./scripts/confluence-restore.sh --page-id 83951683 --list           # list known versions
+#   ./scripts/confluence-restore.sh --page-id 83951683 --backup ID      # restore specific backup
+#   ./scripts/confluence-restore.sh --page-id 83951683 --version 41     # restore version 41
+#   ./scripts/confluence-restore.sh --page-id 83951683 --at 2026-02-19T10:00  # restore state at time
+#   ./scripts/confluence-restore.sh --page-id 83951683 --diff 41 42     # diff two versions
 #   ./scripts/confluence-restore.sh --page-id 83951683 --dry-run        # show what would be restored
 #
-# Backups are created by confluence_utils.py before every PUT.
-# Stored in: src/.confluence_backups/<page_id>/v<N>_<timestamp>.json
+# Thin wrapper over src/fm_review/confluence_history.py, which joins the
+# audit log (.audit_log/) with the backup store index (.backups/<page_id>/).
 
 set -euo pipefail
 
@@ -20,8 +23,9 @@ source "${SCRIPT_DIR}/lib/secrets.sh"
 
 # Defaults
 PAGE_ID=""
-BACKUP_FILE=""
-LIST_MODE=false
+TARGET_ARGS=()
+ACTION="restore"
+DIFF_ARGS=()
 DRY_RUN=false
 
 # Colors
@@ -32,12 +36,15 @@ BOLD='\033[1m'
 NC='\033[0m'
 
 usage() {
-    echo "Usage: $0 --page-id ID [--backup FILE] [--list] [--dry-run]"
+    echo "Usage: $0 --page-id ID [--backup ID | --version N | --at TIME] [--list | --diff OLD NEW] [--dry-run]"
     echo ""
     echo "Options:"
     echo "  --page-id ID    Confluence page ID (required)"
-    echo "  --backup FILE   Specific backup file to restore (default: latest)"
-    echo "  --list          List available backups and exit"
+    echo "  --backup ID     Specific backup to restore (default: latest)"
+    echo "  --version N     Restore page version N"
+    echo "  --at TIME       Restore the version that was live at TIME (ISO 8601)"
+    echo "  --list          List known versions and exit"
+    echo "  --diff OLD NEW  Show diff between two versions and exit"
     echo "  --dry-run       Show what would be restored without making changes"
 }
 
@@ -45,8 +52,9 @@ usage() {
 while [[ $# -gt 0 ]]; do
     case "$1" in
         --page-id) PAGE_ID="$2"; shift 2 ;;
-        --backup) BACKUP_FILE="$2"; shift 2 ;;
-        --list) LIST_MODE=true; shift ;;
+        --backup|--version|--at) TARGET_ARGS=("$1" "$2"); shift 2 ;;
+        --list) ACTION="list"; shift ;;
+        --diff) ACTION="diff"; DIFF_ARGS=("$2" "$3"); shift 3 ;;
         --dry-run) DRY_RUN=true; shift ;;
         -h|--help) usage; exit 0 ;;
         *) echo "Unknown option: $1"; usage; exit 1 ;;
@@ -55,97 +63,43 @@ done
 
 [[ -z "$PAGE_ID" ]] && { echo -e "${RED}ERROR: --page-id is required${NC}"; usage; exit 1; }
 
-BACKUP_DIR="${PROJECT_DIR}/src/.confluence_backups/${PAGE_ID}"
-
-if [[ ! -d "$BACKUP_DIR" ]]; then
-    echo -e "${RED}No backups found for page ${PAGE_ID}${NC}"
-    echo "  Expected directory: ${BACKUP_DIR}"
-    exit 1
-fi
-
-# List mode
-if $LIST_MODE; then
-    echo -e "${BOLD}Available backups for page ${PAGE_ID}:${NC}"
-    echo ""
-    # shellcheck disable=SC2012
-    ls -lt "$BACKUP_DIR"/*.json 2>/dev/null | while read -r line; do
-        file=$(echo "$line" | awk '{print $NF}')
-        basename=$(basename "$file")
-        size=$(echo "$line" | awk '{print $5}')
-        date=$(echo "$line" | awk '{print $6, $7, $8}')
-        echo -e "  ${GREEN}${basename}${NC}  (${size} bytes, ${date})"
-    done
-    count=$(find "$BACKUP_DIR" -name "*.json" 2>/dev/null | wc -l)
-    echo ""
-    echo -e "  Total: ${BOLD}${count}${NC} backup(s)"
-    exit 0
-fi
+run_history() {
+    PYTHONPATH="${PROJECT_DIR}/src" python3 -m fm_review.confluence_history --page-id "$PAGE_ID" "$@"
+}
 
-# Resolve backup file
-if [[ -n "$BACKUP_FILE" ]]; then
-    # If relative path, look in backup dir
-    if [[ ! -f "$BACKUP_FILE" && -f "$BACKUP_DIR/$BACKUP_FILE" ]]; then
-        BACKUP_FILE="$BACKUP_DIR/$BACKUP_FILE"
-    fi
-    if [[ ! -f "$BACKUP_FILE" ]]; then
-        echo -e "${RED}Backup file not found: ${BACKUP_FILE}${NC}"
-        exit 1
-    fi
-else
-    # Use latest backup
-    BACKUP_FILE=$(find "$BACKUP_DIR" -name "*.json" -printf '%T@ %p\n' 2>/dev/null | sort -rn | head -1 | cut -d' ' -f2-)
-    if [[ -z "$BACKUP_FILE" || ! -f "$BACKUP_FILE" ]]; then
-        echo -e "${RED}No backup files found in ${BACKUP_DIR}${NC}"
-        exit 1
-    fi
-fi
+case "$ACTION" in
+    list)
+        echo -e "${BOLD}Known versions of page ${PAGE_ID}:${NC}"
+        run_history --list
+        exit 0
+        ;;
+    diff)
+        run_history --diff "${DIFF_ARGS[@]}"
+        exit 0
+        ;;
+esac
 
 echo -e "${BOLD}═══════════════════════════════════════════${NC}"
 echo -e "  ${BOLD}Confluence Page Restore${NC}"
 echo -e "${BOLD}═══════════════════════════════════════════${NC}"
 echo ""
-echo -e "  Page ID:     ${PAGE_ID}"
-echo -e "  Backup file: $(basename "$BACKUP_FILE")"
-
-# Extract backup info
-BACKUP_VERSION=$(python3 -c "
-import json, sys
-with open(sys.argv[1]) as f:
-    data = json.load(f)
-v = data.get('version', {}).get('number', '?')
-t = data.get('title', 'unknown')
-print(f'{v}|{t}')
-" "$BACKUP_FILE" 2>/dev/null || echo "?|unknown")
-
-BACKUP_VER=$(echo "$BACKUP_VERSION" | cut -d'|' -f1)
-BACKUP_TITLE=$(echo "$BACKUP_VERSION" | cut -d'|' -f2-)
-
-echo -e "  Version:     ${BACKUP_VER}"
-echo -e "  Title:       ${BACKUP_TITLE}"
-echo ""
 
 if $DRY_RUN; then
     echo -e "${YELLOW}DRY RUN — no changes will be made${NC}"
-    echo ""
-    echo -e "Would restore page ${PAGE_ID} to version ${BACKUP_VER}"
-    echo -e "Backup body size: $(python3 -c "
-import json
-with open('${BACKUP_FILE}') as f:
-    data = json.load(f)
-print(len(data.get('body', {}).get('storage', {}).get('value', '')))
-" 2>/dev/null || echo '?') characters"
+    run_history "${TARGET_ARGS[@]}" --restore --dry-run
     exit 0
 fi
 
+# Show target before asking for confirmation
+run_history "${TARGET_ARGS[@]}" || exit 1
+echo ""
+
 # Load secrets for Confluence access
 echo -e "  Loading secrets..."
 # shellcheck disable=SC1091
 source "${SCRIPT_DIR}/load-secrets.sh" 2>/dev/null || true
 
-CONFLUENCE_URL="${CONFLUENCE_URL:-https://confluence.ekf.su}"
-CONFLUENCE_TOKEN="${CONFLUENCE_TOKEN:-}"
-
-if [[ -z "$CONFLUENCE_TOKEN" ]]; then
+if [[ -z "${CONFLUENCE_TOKEN:-}" ]]; then
     echo -e "${RED}ERROR: CONFLUENCE_TOKEN not available${NC}"
     echo "  Run: source scripts/load-secrets.sh"
     exit 1
@@ -160,18 +114,9 @@ if [[ "$confirm" != "y" && "$confirm" != "Y" ]]; then
     exit 0
 fi
 
-# Execute restore via Python
 echo ""
 echo -e "  Restoring..."
-if PYTHONPATH="${PROJECT_DIR}/src" python3 -c "
-import sys, json
-from fm_review.confluence_utils import ConfluenceClient
-
-client = ConfluenceClient('${CONFLUENCE_URL}', '${CONFLUENCE_TOKEN}', '${PAGE_ID}')
-from pathlib import Path
-result = client.rollback(backup_path=Path('${BACKUP_FILE}'))
-print(f'  Restored to version: {result.get(\"version\", {}).get(\"number\", \"?\")}')
-" 2>&1; then
+if run_history "${TARGET_ARGS[@]}" --restore; then
     echo ""
     echo -e "${GREEN}${BOLD}  RESTORE COMPLETE${NC}"
 else
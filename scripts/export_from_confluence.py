@@ -3,19 +3,44 @@
 FM Exporter from Confluence v1.0
 - Confluence XHTML -> PDF (WeasyPrint)
 - Confluence XHTML -> Word (.docx, python-docx)
+- Confluence XHTML -> HTML (written progressively, chunk by chunk)
 - Полный контроль шрифтов и форматирования
+- Several formats from one fetch: the page is converted once into a document
+  model and PDF / Word / HTML are rendered concurrently in a process pool
+- Batch / tree export: every CONFLUENCE_PAGE_ID* of a project and/or all
+  descendants of a page, fetched concurrently through the shared rate limiter,
+  rendered in a process pool, with a manifest.json per batch
+- Images: attachments are prefetched concurrently into a local content-addressed
+  cache (keyed by attachment id and version) and served to WeasyPrint through a
+  URL fetcher and to Word from disk; repeat exports download nothing new
+- Large pages: storage XHTML is split into top-level chunks that are parsed and
+  converted one at a time, so no single parse holds the whole page tree
 """
+import hashlib
 import json
+import mimetypes
 import os
 import re
 import sys
+import threading
+import urllib.parse
 import urllib.request
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
+from html import unescape
+from pathlib import Path
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer, Tag
 from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
 
-from fm_review.confluence_utils import _get_page_id, _make_ssl_context
+from fm_review.confluence_utils import (
+    THROTTLE_CODES,
+    _get_page_id,
+    _get_project_page_ids,
+    _make_ssl_context,
+    _parse_retry_after,
+    _rate_limiter,
+)
 
 # Config - safe module-level defaults (no side effects; validation in main())
 CONFLUENCE_URL = os.environ.get("CONFLUENCE_URL", "https://confluence.ekf.su")
@@ -39,6 +64,32 @@ PAGE_ID = None
 # Output directory (default; can be overridden before calling main)
 OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "exports")
 
+# Concurrent page downloads in batch / tree export
+EXPORT_BATCH_WORKERS = int(os.environ.get("EXPORT_BATCH_WORKERS", "4"))
+CHILD_PAGE_LIMIT = 100
+
+# Attachment / image cache (content-addressed, shared by all exports)
+ATTACHMENT_CACHE_DIR = os.environ.get("EXPORT_ATTACHMENT_CACHE") or os.path.join(OUTPUT_DIR, ".attachment_cache")
+ATTACHMENT_PAGE_LIMIT = 200
+
+# <img src> scheme for attachments of the exported page, resolved by the renderers
+ATTACHMENT_SCHEME = "attachment:"
+
+# Target size of one parse chunk (characters of storage XHTML)
+EXPORT_CHUNK_CHARS = int(os.environ.get("EXPORT_CHUNK_CHARS", "65536"))
+
+# Tokens that matter for top-level splitting: CDATA and comments are skipped whole,
+# tags are matched with quoted attribute values (which may contain '>')
+_TOKEN_RE = re.compile(
+    r"<!\[CDATA\[.*?\]\]>|<!--.*?-->|"
+    r"<(/?)([A-Za-z][\w:.-]*)(?:\s(?:[^>\"']|\"[^\"]*\"|'[^']*')*?)?\s*(/?)>",
+    re.S,
+)
+_VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+}
+
 
 @retry(
     stop=stop_after_attempt(3),
@@ -47,8 +98,25 @@ OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "exp
     reraise=True,
 )
 def _urlopen_with_retry(req):
-    """urllib.urlopen with tenacity retry on transient errors."""
-    return urllib.request.urlopen(req, timeout=30, context=_make_ssl_context())
+    """urllib.urlopen with tenacity retry on transient errors.
+
+    Every attempt at Confluence goes through the shared rate limiter, so concurrent
+    exports and publishers back off together on 429/503. Other hosts (external
+    images) only get the retries: their throttling must not slow Confluence traffic.
+    """
+    limited = _is_confluence_url(req.full_url)
+    if limited:
+        _rate_limiter.acquire()
+    try:
+        resp = urllib.request.urlopen(req, timeout=30, context=_make_ssl_context())
+    except urllib.error.HTTPError as e:
+        if limited and e.code in THROTTLE_CODES:
+            headers = e.headers or {}
+            _rate_limiter.on_throttle(_parse_retry_after(headers.get("Retry-After")))
+        raise
+    if limited:
+        _rate_limiter.on_success()
+    return resp
 
 
 def api_request(method, endpoint):
@@ -59,89 +127,403 @@ def api_request(method, endpoint):
     req.add_header("Content-Type", "application/json")
     try:
         with _urlopen_with_retry(req) as resp:
-            return json.loads(resp.read().decode("utf-8"))
+            # json.loads decodes UTF-8 bytes itself: no second full-size str copy
+            return json.loads(resp.read())
     except Exception as e:
         print(f"API error: {e}")
         return None
 
 
-def fetch_page(page_id=None):
-    """Fetch page content and metadata from Confluence"""
-    pid = page_id or PAGE_ID
-    data = api_request("GET", f"content/{pid}?expand=body.storage,version")
+def _fetch_page_data(page_id):
+    """Fetch page content and metadata; None if the request failed."""
+    data = api_request("GET", f"content/{page_id}?expand=body.storage,version")
     if not data:
-        print("Failed to fetch page")
-        sys.exit(1)
+        return None
     return {
+        "id": str(page_id),
         "title": data["title"],
         "version": data["version"]["number"],
         "html": data["body"]["storage"]["value"],
     }
 
 
-def confluence_to_clean_html(raw_html, title):
-    """Convert Confluence XHTML storage format to clean HTML for rendering"""
-    soup = BeautifulSoup(raw_html, "html.parser")
-
-    # Expand Confluence macros
-    for macro in soup.find_all("ac:structured-macro"):
-        macro_name = macro.get("ac:name", "")
-        body = macro.find("ac:rich-text-body")
-        body_html = body.decode_contents() if body else ""
-
-        if macro_name == "warning":
-            # Red panel
-            new_tag = soup.new_tag("div")
-            new_tag["class"] = "panel-warning"
-            new_tag["style"] = (
-                "background-color: #ffebe6; border-left: 4px solid #de350b; "
-                "padding: 12px 16px; margin: 12px 0; border-radius: 3px;"
-            )
-            new_tag.append(BeautifulSoup(body_html, "html.parser"))
-            macro.replace_with(new_tag)
-
-        elif macro_name == "note":
-            # Yellow panel
-            new_tag = soup.new_tag("div")
-            new_tag["class"] = "panel-note"
-            new_tag["style"] = (
-                "background-color: #fffae6; border-left: 4px solid #ff991f; "
-                "padding: 12px 16px; margin: 12px 0; border-radius: 3px;"
-            )
-            new_tag.append(BeautifulSoup(body_html, "html.parser"))
-            macro.replace_with(new_tag)
-
-        elif macro_name == "info":
-            new_tag = soup.new_tag("div")
-            new_tag["class"] = "panel-info"
-            new_tag["style"] = (
-                "background-color: #deebff; border-left: 4px solid #0065ff; "
-                "padding: 12px 16px; margin: 12px 0; border-radius: 3px;"
-            )
-            new_tag.append(BeautifulSoup(body_html, "html.parser"))
-            macro.replace_with(new_tag)
-
-        elif macro_name == "toc":
-            macro.decompose()
+def fetch_page(page_id=None):
+    """Fetch page content and metadata from Confluence"""
+    page = _fetch_page_data(page_id or PAGE_ID)
+    if not page:
+        print("Failed to fetch page")
+        sys.exit(1)
+    return page
+
+
+def _is_confluence_url(url):
+    """True if url has the scheme and host of CONFLUENCE_URL (a prefix match would
+    also accept https://confluence.ekf.su.evil.example)."""
+    target, own = urllib.parse.urlsplit(url), urllib.parse.urlsplit(CONFLUENCE_URL)
+    return (target.scheme.lower(), target.netloc.lower()) == (own.scheme.lower(), own.netloc.lower())
+
+
+def _download(url):
+    """GET raw bytes from Confluence (auth header only for the Confluence host)."""
+    req = urllib.request.Request(url, method="GET")
+    if _is_confluence_url(url):
+        req.add_header("Authorization", f"Bearer {TOKEN}")
+    with _urlopen_with_retry(req) as resp:
+        return resp.read()
+
+
+def list_attachments(page_id):
+    """Attachments of a page: {filename: {"id", "version", "download", "media_type"}}."""
+    attachments = {}
+    start = 0
+    while True:
+        data = api_request(
+            "GET", f"content/{page_id}/child/attachment?limit={ATTACHMENT_PAGE_LIMIT}&start={start}&expand=version"
+        )
+        results = (data or {}).get("results", [])
+        for att in results:
+            attachments[att["title"]] = {
+                "id": str(att["id"]),
+                "version": att.get("version", {}).get("number", 1),
+                "download": att.get("_links", {}).get("download", ""),
+                "media_type": att.get("extensions", {}).get("mediaType"),
+            }
+        if len(results) < ATTACHMENT_PAGE_LIMIT:
+            return attachments
+        start += len(results)
+
+
+class AttachmentCache:
+    """Content-addressed local store for attachments and remote images.
+
+    blobs/<sha256><ext> holds the bytes; index.json maps a key to its blob:
+    "<attachment id>@<version>" for Confluence attachments, "url:<url>" for
+    external images. A new attachment version is a new key, so stale bytes are
+    never served; identical bytes are stored once.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or ATTACHMENT_CACHE_DIR
+        self.blob_dir = os.path.join(self.cache_dir, "blobs")
+        self.index_path = os.path.join(self.cache_dir, "index.json")
+        self._lock = threading.Lock()
+        self._index = None
+
+    def _load_index(self):
+        if self._index is None:
+            try:
+                with open(self.index_path, encoding="utf-8") as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def path_for(self, key):
+        """Local path of a cached key, or None."""
+        with self._lock:
+            entry = self._load_index().get(key)
+        if entry:
+            path = os.path.join(self.blob_dir, entry["blob"])
+            if os.path.exists(path):
+                return path
+        return None
+
+    def store(self, key, data, filename=""):
+        """Store bytes under key. Returns the blob path."""
+        ext = os.path.splitext(filename)[1].lower()
+        blob = hashlib.sha256(data).hexdigest() + ext
+        path = os.path.join(self.blob_dir, blob)
+        os.makedirs(self.blob_dir, exist_ok=True)
+        if not os.path.exists(path):
+            tmp = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        with self._lock:
+            index = self._load_index()
+            index[key] = {"blob": blob, "size": len(data), "cached_at": datetime.now().isoformat()}
+            tmp = f"{self.index_path}.tmp{os.getpid()}"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(index, f, ensure_ascii=False)
+            os.replace(tmp, self.index_path)
+        return path
+
+    def fetch(self, key, url, filename=""):
+        """Cached path for key, downloading url on a miss."""
+        return self.path_for(key) or self.store(key, _download(url), filename)
+
+    def prefetch_page(self, page_id, filenames, max_workers=None):
+        """Make the named attachments of a page local. Returns {filename: path}.
+
+        One attachment listing per page; downloads of cache misses run
+        concurrently. Missing or failed attachments are left out.
+        """
+        if not filenames:
+            return {}
+        listing = list_attachments(page_id)
+        wanted = {name: listing[name] for name in filenames if name in listing}
+        paths = {}
+
+        def get(name):
+            att = wanted[name]
+            return self.fetch(f"{att['id']}@{att['version']}", CONFLUENCE_URL + att["download"], name)
+
+        with ThreadPoolExecutor(max_workers=max_workers or EXPORT_BATCH_WORKERS) as pool:
+            futures = {pool.submit(get, name): name for name in wanted}
+            for future in as_completed(futures):
+                try:
+                    paths[futures[future]] = future.result()
+                except Exception as e:
+                    print(f"  Вложение {futures[future]}: ошибка загрузки ({e})")
+        return paths
+
+
+def image_attachment_names(raw_html):
+    """Filenames of the page's own attachments shown with ac:image, in order.
+
+    Only ac:image elements are parsed; names are the ones _image_tag emits.
+    """
+    if "ri:attachment" not in raw_html:
+        return []
+    soup = BeautifulSoup(raw_html, "html.parser", parse_only=SoupStrainer("ac:image"))
+    names = (_own_attachment_name(node) for node in soup.find_all("ac:image"))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def prefetch_attachments(page, cache=None):
+    """Cache the images a page embeds. Returns {filename: local path}."""
+    names = image_attachment_names(page["html"])
+    if not names or not page.get("id"):
+        return {}
+    return (cache or AttachmentCache()).prefetch_page(page["id"], names)
+
+
+def make_url_fetcher(attachments, cache=None):
+    """WeasyPrint url_fetcher: attachment: from the prefetched map, http(s) via the cache."""
+    def fetcher(url):
+        if url.startswith(ATTACHMENT_SCHEME):
+            name = urllib.parse.unquote(url[len(ATTACHMENT_SCHEME):])
+            path = attachments.get(name)
+            if not path:
+                raise ValueError(f"Attachment not cached: {name}")
+        elif url.startswith(("http://", "https://")):
+            path = (cache or AttachmentCache()).fetch(f"url:{url}", url, urllib.parse.urlsplit(url).path)
         else:
-            # Unknown macro - just keep body
-            if body:
-                macro.replace_with(BeautifulSoup(body_html, "html.parser"))
+            from weasyprint import default_url_fetcher
+            return default_url_fetcher(url)
+        with open(path, "rb") as f:
+            return {"string": f.read(), "mime_type": mimetypes.guess_type(path)[0]}
+    return fetcher
+
+
+def list_child_pages(page_id):
+    """Direct child page ids of a page (all result pages of the REST listing)."""
+    children = []
+    start = 0
+    while True:
+        data = api_request("GET", f"content/{page_id}/child/page?limit={CHILD_PAGE_LIMIT}&start={start}")
+        results = (data or {}).get("results", [])
+        children.extend(str(child["id"]) for child in results)
+        if len(results) < CHILD_PAGE_LIMIT:
+            return children
+        start += len(results)
+
+
+def collect_page_tree(root_ids, max_workers=None):
+    """Root pages and all their descendants as [(page_id, parent_id)], breadth-first.
+
+    Child listings of one tree level are requested concurrently.
+    """
+    seen = set()
+    tree = []
+    level = [(str(pid), None) for pid in root_ids]
+    with ThreadPoolExecutor(max_workers=max_workers or EXPORT_BATCH_WORKERS) as pool:
+        while level:
+            fresh = []
+            for pid, parent in level:
+                if pid not in seen:
+                    seen.add(pid)
+                    fresh.append((pid, parent))
+            level = fresh
+            tree.extend(level)
+            children = pool.map(list_child_pages, [pid for pid, _ in level])
+            level = [(child, pid) for (pid, _), kids in zip(level, children) for child in kids]
+    return tree
+
+
+def iter_chunks(raw_html, chunk_chars=None):
+    """Split storage XHTML at top-level element boundaries.
+
+    Yields consecutive slices of raw_html, each at least chunk_chars long (except
+    the last) and each made of whole top-level nodes, so every chunk can be parsed
+    on its own. Malformed markup that never returns to depth 0 ends up in one chunk.
+    """
+    chunk_chars = chunk_chars or EXPORT_CHUNK_CHARS
+    depth = 0
+    start = 0
+    for match in _TOKEN_RE.finditer(raw_html):
+        closing, name, self_closing = match.group(1), match.group(2), match.group(3)
+        if name is None:
+            continue  # CDATA / comment
+        if closing:
+            depth = max(depth - 1, 0)
+        elif not self_closing and name.lower() not in _VOID_ELEMENTS:
+            depth += 1
+            continue
+        if depth == 0 and match.end() - start >= chunk_chars:
+            yield raw_html[start:match.end()]
+            start = match.end()
+    if start < len(raw_html):
+        yield raw_html[start:]
+
+
+# Panel macros: name -> (background, border colour); shared by the CSS and DOCX renderers
+PANELS = {
+    "warning": ("#ffebe6", "#de350b"),  # red
+    "note": ("#fffae6", "#ff991f"),     # yellow
+    "info": ("#deebff", "#0065ff"),     # blue
+}
+_PANEL_STYLES = {
+    name: (
+        f"background-color: {background}; border-left: 4px solid {border}; "
+        "padding: 12px 16px; margin: 12px 0; border-radius: 3px;"
+    )
+    for name, (background, border) in PANELS.items()
+}
+
+# Macro name -> handler(soup, macro, body) returning the nodes that replace the macro.
+# body is the macro's ac:rich-text-body (or None); handlers move its children
+# instead of re-parsing them. Unregistered macros keep their body.
+MACRO_HANDLERS = {}
+
+
+def macro_handler(*names):
+    """Register a handler for one or more Confluence macro names."""
+    def register(func):
+        for name in names:
+            MACRO_HANDLERS[name] = func
+        return func
+    return register
+
+
+@macro_handler(*PANELS)
+def _panel_macro(soup, macro, body):
+    name = macro.get("ac:name")
+    panel = soup.new_tag("div", attrs={"class": f"panel-{name}", "style": _PANEL_STYLES[name]})
+    if body:
+        panel.extend(list(body.contents))
+    return [panel]
+
+
+@macro_handler("toc")
+def _drop_macro(soup, macro, body):
+    return []
+
+
+def _keep_body(soup, macro, body):
+    return list(body.contents) if body else []
+
+
+def _own_attachment_name(node):
+    """Filename of an ac:image's attachment on this page (a nested ri:page means
+    another page's attachment), or None."""
+    attachment = node.find("ri:attachment")
+    if attachment is not None and attachment.get("ri:filename") and attachment.find(True) is None:
+        return attachment["ri:filename"]
+    return None
+
+
+def _image_tag(soup, node):
+    """<img> for an ac:image: own attachment (attachment:NAME) or external ri:url; else None."""
+    name = _own_attachment_name(node)
+    url = node.find("ri:url")
+    if name:
+        src = ATTACHMENT_SCHEME + name
+    elif url is not None and url.get("ri:value"):
+        src = url["ri:value"]
+    else:
+        return None
+    image = soup.new_tag("img", attrs={"src": src})
+    for attr in ("width", "height", "alt"):
+        if node.get(f"ac:{attr}"):
+            image[attr] = node[f"ac:{attr}"]
+    return image
+
+
+def _transform(soup):
+    """Clean a parsed chunk in one pre-order pass (in place).
+
+    Macros are replaced through MACRO_HANDLERS and the walk continues into the
+    replacement, so nested macros are handled in the same pass. Other ac:
+    elements are unwrapped when they hold only text, otherwise dropped (images
+    become <img>); ri: elements are dropped.
+    """
+    stack = list(reversed(soup.contents))
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, Tag):
+            continue
+        name = node.name
+        if name == "ac:structured-macro":
+            handler = MACRO_HANDLERS.get(node.get("ac:name", ""), _keep_body)
+            children = handler(soup, node, node.find("ac:rich-text-body"))
+            if children:
+                node.replace_with(*children)
             else:
-                macro.decompose()
+                node.decompose()
+        elif name == "ac:image":
+            image = _image_tag(soup, node)
+            if image is not None:
+                node.replace_with(image)
+            else:
+                node.decompose()
+            continue
+        elif name.startswith("ri:"):
+            node.decompose()
+            continue
+        elif name.startswith("ac:"):
+            if not node.string:
+                node.decompose()
+                continue
+            children = list(node.contents)
+            node.unwrap()
+        else:
+            children = node.contents
+        stack.extend(reversed(children))
+
+
+def iter_clean_body(raw_html, chunk_chars=None):
+    """Yield clean HTML for raw_html chunk by chunk (macros expanded, ac:/ri: removed)."""
+    for chunk in iter_chunks(raw_html, chunk_chars):
+        soup = BeautifulSoup(chunk, "html.parser")
+        _transform(soup)
+        yield str(soup)
+        soup.decompose()
 
-    # Remove ac: namespace elements that aren't macros
-    for tag in soup.find_all(re.compile(r"^ac:")):
-        tag.unwrap() if tag.string else tag.decompose()
 
-    # Remove ri: namespace elements
-    for tag in soup.find_all(re.compile(r"^ri:")):
-        tag.decompose()
+def clean_body_html(raw_html):
+    """Clean HTML body content (no document wrapper) for raw_html."""
+    return "".join(iter_clean_body(raw_html))
 
-    content_html = str(soup)
 
-    # Build full HTML document with CSS
-    full_html = f"""<!DOCTYPE html>
+def confluence_to_clean_html(raw_html, title):
+    """Convert Confluence XHTML storage format to clean HTML for rendering"""
+    return _document_head(title) + clean_body_html(raw_html) + _DOCUMENT_TAIL
+
+
+def write_clean_html(raw_html, title, output_path):
+    """Write the clean HTML document to output_path chunk by chunk."""
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(_document_head(title))
+        for part in iter_clean_body(raw_html):
+            f.write(part)
+        f.write(_DOCUMENT_TAIL)
+    return True
+
+
+def _document_head(title):
+    """HTML document prologue with print CSS, up to and including <body>."""
+    return f"""<!DOCTYPE html>
 <html lang="ru">
 <head>
 <meta charset="utf-8">
@@ -257,17 +639,22 @@ def confluence_to_clean_html(raw_html, title):
 </style>
 </head>
 <body>
-{content_html}
+"""
+
+
+_DOCUMENT_TAIL = """
 </body>
 </html>"""
-    return full_html
 
 
-def export_pdf(html, output_path):
-    """Export HTML to PDF using WeasyPrint"""
+def export_pdf(html, output_path, url_fetcher=None):
+    """Export HTML to PDF using WeasyPrint (images through url_fetcher, if given)"""
     try:
         from weasyprint import HTML
-        HTML(string=html).write_pdf(output_path)
+        if url_fetcher:
+            HTML(string=html, url_fetcher=url_fetcher).write_pdf(output_path)
+        else:
+            HTML(string=html).write_pdf(output_path)
         return True
     except ImportError:
         print("WeasyPrint not installed. Run: pip3 install weasyprint")
@@ -277,8 +664,11 @@ def export_pdf(html, output_path):
         return False
 
 
-def export_docx(raw_html, title, output_path):
-    """Export Confluence HTML to Word .docx using python-docx"""
+def export_docx(raw_html, title, output_path, attachments=None):
+    """Export Confluence HTML to Word .docx using python-docx
+
+    attachments maps attachment filenames to local files for attachment: images.
+    """
     from docx import Document
     from docx.enum.table import WD_TABLE_ALIGNMENT
     from docx.shared import Cm, Pt, RGBColor
@@ -299,8 +689,6 @@ def export_docx(raw_html, title, output_path):
         section.left_margin = Cm(1.5)
         section.right_margin = Cm(1.5)
 
-    soup = BeautifulSoup(raw_html, "html.parser")
-
     def add_text_with_formatting(paragraph, element):
         """Add text from an HTML element preserving bold/italic"""
         if isinstance(element, str):
@@ -325,6 +713,8 @@ def export_docx(raw_html, title, output_path):
                     add_text_with_formatting(paragraph, child)
         elif element.name == "br":
             paragraph.add_run("\n")
+        elif element.name == "img":
+            add_image(paragraph, element)
         elif element.name in ("span", "a", "u"):
             for child in element.children:
                 add_text_with_formatting(paragraph, child)
@@ -332,6 +722,23 @@ def export_docx(raw_html, title, output_path):
             for child in element.children:
                 add_text_with_formatting(paragraph, child)
 
+    def add_image(paragraph, element):
+        """Inline picture from the attachment cache, scaled down to the text width"""
+        src = element.get("src", "")
+        if not src.startswith(ATTACHMENT_SCHEME):
+            return
+        path = (attachments or {}).get(src[len(ATTACHMENT_SCHEME):])
+        if not path:
+            return
+        try:
+            picture = paragraph.add_run().add_picture(path)
+        except Exception:
+            return  # format python-docx cannot embed (e.g. SVG)
+        max_width = Cm(17)
+        if picture.width > max_width:
+            picture.height = int(picture.height * max_width / picture.width)
+            picture.width = max_width
+
     def process_element(element):
         """Process an HTML element and add to Word document"""
         if isinstance(element, str):
@@ -355,7 +762,7 @@ def export_docx(raw_html, title, output_path):
         # Paragraphs
         if tag == "p":
             text = element.get_text(strip=True)
-            if not text:
+            if not text and not element.find("img"):
                 return
             p = doc.add_paragraph()
             add_text_with_formatting(p, element)
@@ -421,13 +828,7 @@ def export_docx(raw_html, title, output_path):
             if isinstance(cls, str):
                 cls = [cls]
 
-            panel_type = None
-            if "panel-warning" in cls:
-                panel_type = "warning"
-            elif "panel-note" in cls:
-                panel_type = "note"
-            elif "panel-info" in cls:
-                panel_type = "info"
+            panel_type = next((name for name in PANELS if f"panel-{name}" in cls), None)
 
             if panel_type:
                 # Create a single-cell table for the panel
@@ -445,13 +846,8 @@ def export_docx(raw_html, title, output_path):
                 from docx.oxml import OxmlElement
                 from docx.oxml.ns import qn
 
-                colors = {
-                    "warning": "FFEBE6",
-                    "note": "FFFAE6",
-                    "info": "DEEBFF",
-                }
                 shading = OxmlElement("w:shd")
-                shading.set(qn("w:fill"), colors.get(panel_type, "F4F5F7"))
+                shading.set(qn("w:fill"), PANELS[panel_type][0].lstrip("#").upper())
                 shading.set(qn("w:val"), "clear")
                 cell._tc.get_or_add_tcPr().append(shading)
 
@@ -471,6 +867,11 @@ def export_docx(raw_html, title, output_path):
                 add_text_with_formatting(p, item)
             return
 
+        # Images outside paragraphs
+        if tag == "img":
+            add_image(doc.add_paragraph(), element)
+            return
+
         # HR
         if tag == "hr":
             p = doc.add_paragraph()
@@ -484,14 +885,180 @@ def export_docx(raw_html, title, output_path):
                 process_element(child)
             return
 
-    # Process all top-level elements
-    for element in soup.children:
-        process_element(element)
+    # Process top-level elements chunk by chunk
+    for chunk in iter_chunks(raw_html):
+        soup = BeautifulSoup(chunk, "html.parser")
+        for element in soup.children:
+            process_element(element)
+        soup.decompose()
 
     doc.save(output_path)
     return True
 
 
+# Output formats in rendering order, with (section header, result label)
+FORMATS = {
+    "pdf": ("PDF", "PDF"),
+    "docx": ("WORD", "Word"),
+    "html": ("HTML", "HTML"),
+}
+
+
+def build_document(page, attachments=None):
+    """Intermediate document model: page metadata, clean body HTML and local images.
+
+    Built once per fetch and shared by all renderers (picklable, so it can be
+    sent to worker processes). attachments is {filename: local path} from
+    prefetch_attachments.
+    """
+    return {
+        "title": page["title"],
+        "version": page["version"],
+        "body_html": clean_body_html(page["html"]),
+        "attachments": attachments or {},
+    }
+
+
+def _local_image_sources(document):
+    """Body HTML with attachment: image sources pointing at the cached files."""
+    attachments = document.get("attachments", {})
+
+    def local(match):
+        path = attachments.get(unescape(match.group(2)))
+        return f'{match.group(1)}"{Path(path).as_uri()}"' if path else match.group(0)
+
+    return re.sub(r'(<img[^>]*?\ssrc=)"' + ATTACHMENT_SCHEME + r'([^"]*)"', local, document["body_html"])
+
+
+def render_document(fmt, document, output_path):
+    """Render the document model to one format. Returns True on success."""
+    attachments = document.get("attachments", {})
+    if fmt == "pdf":
+        html = _document_head(document["title"]) + document["body_html"] + _DOCUMENT_TAIL
+        return export_pdf(html, output_path, url_fetcher=make_url_fetcher(attachments))
+    if fmt == "docx":
+        return export_docx(document["body_html"], document["title"], output_path, attachments)
+    if fmt == "html":
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(_document_head(document["title"]))
+            f.write(_local_image_sources(document))
+            f.write(_DOCUMENT_TAIL)
+        return True
+    raise ValueError(f"Unknown export format: {fmt}")
+
+
+def render_formats(document, outputs):
+    """Render the document to every {format: path} in outputs.
+
+    A single format renders in-process; several formats render concurrently in
+    a process pool (WeasyPrint and python-docx are CPU-bound). Returns
+    {format: True/False}; a renderer that raises counts as a failure.
+    """
+    if len(outputs) == 1:
+        (fmt, path), = outputs.items()
+        try:
+            return {fmt: render_document(fmt, document, path)}
+        except Exception as e:
+            print(f"{FORMATS[fmt][1]} error: {e}")
+            return {fmt: False}
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=len(outputs)) as pool:
+        futures = {fmt: pool.submit(render_document, fmt, document, path) for fmt, path in outputs.items()}
+        for fmt, future in futures.items():
+            try:
+                results[fmt] = future.result()
+            except Exception as e:
+                print(f"{FORMATS[fmt][1]} error: {e}")
+                results[fmt] = False
+    return results
+
+
+def _export_page_job(page, outputs, attachments=None):
+    """Process-pool job: convert one page once and render it to every output.
+
+    Returns {format: None on success or an error message}.
+    """
+    document = build_document(page, attachments)
+    errors = {}
+    for fmt, path in outputs.items():
+        try:
+            errors[fmt] = None if render_document(fmt, document, path) else "render failed"
+        except Exception as e:
+            errors[fmt] = str(e)
+    return errors
+
+
+def export_batch(pages, formats, output_dir, max_workers=None):
+    """Export many pages: concurrent fetch, rendering in a process pool, manifest.json.
+
+    pages is [(page_id, parent_id)] (see collect_page_tree). Each page goes to
+    the process pool as soon as it is downloaded. Returns the manifest dict,
+    also written to output_dir/manifest.json.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    parents = dict(pages)
+    entries = {pid: {"page_id": pid, "parent_id": parent, "title": None, "version": None,
+                     "status": "error", "error": None, "files": {}}
+               for pid, parent in pages}
+
+    cache = AttachmentCache()
+
+    def fetch(pid):
+        page = _fetch_page_data(pid)
+        return page, (prefetch_attachments(page, cache) if page else {})
+
+    with ThreadPoolExecutor(max_workers=max_workers or EXPORT_BATCH_WORKERS) as fetch_pool, \
+            ProcessPoolExecutor() as render_pool:
+        fetches = {fetch_pool.submit(fetch, pid): pid for pid in parents}
+        renders = {}
+        for future in as_completed(fetches):
+            pid = fetches[future]
+            try:
+                page, attachments = future.result()
+            except Exception as e:
+                page, attachments, entries[pid]["error"] = None, {}, str(e)
+            if not page:
+                entries[pid]["error"] = entries[pid]["error"] or "fetch failed"
+                print(f"  {pid}: ОШИБКА загрузки")
+                continue
+            safe_title = re.sub(r"[^\w\-]", "_", page["title"])
+            outputs = {fmt: os.path.join(output_dir, f"{pid}_{safe_title}_v{page['version']}.{fmt}")
+                       for fmt in formats}
+            entries[pid].update(title=page["title"], version=page["version"])
+            renders[render_pool.submit(_export_page_job, page, outputs, attachments)] = (pid, outputs)
+
+        for done, future in enumerate(as_completed(renders), 1):
+            pid, outputs = renders[future]
+            entry = entries[pid]
+            try:
+                errors = future.result()
+            except Exception as e:
+                errors = {fmt: str(e) for fmt in outputs}
+            for fmt, path in outputs.items():
+                if errors[fmt] is None:
+                    entry["files"][fmt] = {"path": os.path.basename(path), "size": os.path.getsize(path)}
+            failed = {fmt: err for fmt, err in errors.items() if err}
+            entry["status"] = "error" if failed else "ok"
+            entry["error"] = "; ".join(f"{fmt}: {err}" for fmt, err in failed.items()) or None
+            print(f"  [{done}/{len(renders)}] {entry['title']} v{entry['version']}: "
+                  f"{', '.join(entry['files']) or 'ОШИБКА'}")
+
+    manifest = {
+        "created_at": datetime.now().isoformat(),
+        "formats": list(formats),
+        "pages": [entries[pid] for pid in parents],
+        "summary": {
+            "pages": len(entries),
+            "ok": sum(1 for e in entries.values() if e["status"] == "ok"),
+            "failed": sum(1 for e in entries.values() if e["status"] != "ok"),
+        },
+    }
+    with open(os.path.join(output_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
 def main():
     global PAGE_ID, TOKEN, CONFLUENCE_URL
 
@@ -505,12 +1072,18 @@ def main():
 
     # Handle --help before any validation (no side effects)
     if "--help" in sys.argv or "-h" in sys.argv:
-        print("Usage: export_from_confluence.py [--pdf|--docx|--both] [--page=ID] [--project=PROJECT_NAME]")
-        print("  --pdf      Export PDF only")
-        print("  --docx     Export Word only")
-        print("  --both     Export both (default)")
-        print("  --page=ID  Page ID (overrides project file)")
+        print("Usage: export_from_confluence.py [--pdf] [--docx] [--html] [--both|--all] [--page=ID] [--project=PROJECT_NAME]")
+        print("  --pdf      Export PDF")
+        print("  --docx     Export Word")
+        print("  --html     Export clean HTML")
+        print("  --both     Export PDF and Word (default)")
+        print("  --all      Export PDF, Word and HTML")
+        print("  Several formats are rendered in parallel from a single fetch")
+        print("  --page=ID  Page ID, or comma-separated IDs (overrides project file)")
         print("  --project  Read PAGE_ID from projects/PROJECT_NAME/CONFLUENCE_PAGE_ID")
+        print("  --batch    Export every projects/PROJECT_NAME/CONFLUENCE_PAGE_ID* page")
+        print("  --tree     Also export all child pages (recursively)")
+        print("  Several pages are exported concurrently into exports/batch_<timestamp>/ with manifest.json")
         print("  Env: CONFLUENCE_PAGE_ID, CONFLUENCE_TOKEN, CONFLUENCE_URL")
         sys.exit(0)
 
@@ -521,26 +1094,44 @@ def main():
     PAGE_ID = _get_page_id(os.environ.get("PROJECT"))
 
     # Parse arguments
-    fmt = "both"  # pdf, docx, both
-    page_id = PAGE_ID
+    requested = set()
+    page_ids = [PAGE_ID]
     project_arg = None
+    batch = tree = False
 
     for arg in sys.argv[1:]:
         if arg in ("--pdf", "-p"):
-            fmt = "pdf"
+            requested.add("pdf")
         elif arg in ("--docx", "-w", "--word"):
-            fmt = "docx"
+            requested.add("docx")
         elif arg in ("--both", "-b"):
-            fmt = "both"
+            requested.update(("pdf", "docx"))
+        elif arg == "--html":
+            requested.add("html")
+        elif arg == "--all":
+            requested.update(FORMATS)
         elif arg.startswith("--page="):
-            page_id = arg.split("=")[1]
+            page_ids = [pid for pid in arg.split("=")[1].split(",") if pid]
+        elif arg == "--batch":
+            batch = True
+        elif arg == "--tree":
+            tree = True
         elif arg.startswith("--project="):
             project_arg = arg.split("=")[1]
         elif arg in ("--help", "-h"):
             pass  # handled before TOKEN/PAGE_ID checks at start of main()
 
+    formats = [fmt for fmt in FORMATS if fmt in requested] or ["pdf", "docx"]
+
     if project_arg:
-        page_id = _get_page_id(project_arg)
+        page_ids = [_get_page_id(project_arg)]
+    if batch:
+        project = project_arg or os.environ.get("PROJECT")
+        project_pages = _get_project_page_ids(project) if project else {}
+        if not project_pages:
+            print("ERROR: --batch needs --project=NAME with CONFLUENCE_PAGE_ID* files")
+            sys.exit(1)
+        page_ids = list(project_pages.values())
 
     print("=" * 60)
     print("FM EXPORTER - CONFLUENCE v1.0")
@@ -549,44 +1140,48 @@ def main():
     # Create output dir
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    if tree or len(page_ids) > 1:
+        print("\n=== ПАКЕТНЫЙ ЭКСПОРТ ===")
+        pages = collect_page_tree(page_ids) if tree else [(pid, None) for pid in page_ids]
+        print(f"  Страниц: {len(pages)}")
+        batch_dir = os.path.join(OUTPUT_DIR, f"batch_{timestamp}")
+        manifest = export_batch(pages, formats, batch_dir)
+        summary = manifest["summary"]
+        print(f"\n  Успешно: {summary['ok']}, с ошибками: {summary['failed']}")
+        print(f"  Манифест: {os.path.join(batch_dir, 'manifest.json')}")
+        print(f"\nГОТОВО! Файлы в: {batch_dir}")
+        return
+
     # Fetch page
     print("\n=== ЗАГРУЗКА СТРАНИЦЫ ===")
-    page = fetch_page(page_id)
+    page = fetch_page(page_ids[0])
     print(f"  Название: {page['title']}")
     print(f"  Версия: {page['version']}")
     print(f"  HTML: {len(page['html'])} символов")
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     safe_title = re.sub(r"[^\w\-]", "_", page["title"])
 
-    # Export PDF
-    if fmt in ("pdf", "both"):
-        print("\n=== ЭКСПОРТ PDF ===")
-        clean_html = confluence_to_clean_html(page["html"], page["title"])
-        pdf_path = os.path.join(OUTPUT_DIR, f"{safe_title}_v{page['version']}_{timestamp}.pdf")
-        if export_pdf(clean_html, pdf_path):
-            size_kb = os.path.getsize(pdf_path) / 1024
-            print(f"  PDF: {pdf_path}")
-            print(f"  Размер: {size_kb:.0f} KB")
-        else:
-            print("  PDF: ОШИБКА")
-
-    # Export Word
-    if fmt in ("docx", "both"):
-        print("\n=== ЭКСПОРТ WORD ===")
-        docx_path = os.path.join(OUTPUT_DIR, f"{safe_title}_v{page['version']}_{timestamp}.docx")
-        # For Word we need to process the raw HTML differently (with panels converted)
-        clean_for_word = confluence_to_clean_html(page["html"], page["title"])
-        soup = BeautifulSoup(clean_for_word, "html.parser")
-        body = soup.find("body")
-        body_html = str(body) if body else clean_for_word
-
-        if export_docx(body_html, page["title"], docx_path):
-            size_kb = os.path.getsize(docx_path) / 1024
-            print(f"  Word: {docx_path}")
+    attachments = prefetch_attachments(page)
+    if attachments:
+        print(f"  Изображения: {len(attachments)} (кэш: {ATTACHMENT_CACHE_DIR})")
+    document = build_document(page, attachments)
+    outputs = {
+        fmt: os.path.join(OUTPUT_DIR, f"{safe_title}_v{page['version']}_{timestamp}.{fmt}")
+        for fmt in formats
+    }
+    results = render_formats(document, outputs)
+
+    for fmt in formats:
+        header, label = FORMATS[fmt]
+        print(f"\n=== ЭКСПОРТ {header} ===")
+        if results[fmt]:
+            size_kb = os.path.getsize(outputs[fmt]) / 1024
+            print(f"  {label}: {outputs[fmt]}")
             print(f"  Размер: {size_kb:.0f} KB")
         else:
-            print("  Word: ОШИБКА")
+            print(f"  {label}: ОШИБКА")
 
     print(f"\nГОТОВО! Файлы в: {OUTPUT_DIR}")
 
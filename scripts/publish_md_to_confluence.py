@@ -14,49 +14,137 @@ Usage:
   # Dry run (preview XHTML):
   python3 scripts/publish_md_to_confluence.py --title "Test" --file file.md --dry-run
 
+  # Publish a directory (creates missing pages first, then updates all concurrently):
+  python3 scripts/publish_md_to_confluence.py --dir path/to/docs --space EW --parent 86048852
+
 Converts Markdown to Confluence storage format (XHTML) and creates/updates a page.
 Features:
   - Strips manual "## Содержание" sections (Confluence TOC macro replaces them)
-  - Converts cross-references (phase1a_domain_model.md etc.) to clickable Confluence links
+  - Converts cross-references (phase1a_domain_model.md etc.) to clickable Confluence links;
+    the map lives in config/confluence_cross_refs.json (CROSS_REFS_FILE) and every
+    create/update records the published file there under its repo-relative path.
+    A file name in the text links to a page published from the same directory, or
+    to a bare-name entry (added by hand, linked from every document)
   - Warm yellow table headers, collapsible TOC, code block macros
+  - Incremental conversion: the document is split into top-level sections
+    (# / ## headings outside code fences) and each section's XHTML is cached by
+    content hash + converter version + cross-ref map, so only edited sections are
+    re-rendered (MD_SECTION_CACHE_DIR, --no-cache to disable)
 """
 
 import argparse
+import hashlib
 import json
 import os
 import re
 import ssl
 import sys
+import urllib.error
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from pathlib import Path
 
 import markdown
-from markdown.extensions.fenced_code import FencedCodeExtension
+from markdown.extensions.fenced_code import FencedBlockPreprocessor, FencedCodeExtension
 from markdown.extensions.tables import TableExtension
 from markdown.extensions.toc import TocExtension
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
+
+from fm_review.confluence_utils import THROTTLE_CODES, _parse_retry_after, _rate_limiter
 
 # Load secrets
 CONFLUENCE_URL = os.environ.get("CONFLUENCE_URL", "https://confluence.ekf.su")
 CONFLUENCE_TOKEN = os.environ.get("CONFLUENCE_TOKEN", "")
 
-# Cross-reference mapping: filename → Confluence page ID
-# Updated by publish runs; kept in sync with MEMORY.md
-CROSS_REFS = {
-    "phase1a_domain_model.md": ("86049881", "Phase 1A: Domain Model"),
-    "phase1b_go_architecture.md": ("86049882", "Phase 1B: Go Architecture"),
-    "phase1c_react_architecture.md": ("86049883", "Phase 1C: React Architecture"),
-    "phase1d_ai_analytics.md": ("86049884", "Phase 1D: AI Analytics"),
-    "phase1e_integration_architecture.md": ("86049885", "Phase 1E: Integration Architecture"),
-    "TZ-GO-v1.0.md": ("86049879", "ТЗ Go+React"),
-}
-
-# Additional well-known page IDs
-KNOWN_PAGES = {
-    "83951683": "ФМ FM-LS-PROFIT",
-    "86049548": "ТЗ 1С",
-    "86049550": "Архитектура 1С",
-    "86049879": "ТЗ Go+React",
-    "86049880": "Архитектура Go+React",
-}
+# Cross-reference map (file → Confluence page), written by publish runs
+REPO_ROOT = Path(__file__).resolve().parent.parent
+CROSS_REFS_FILE = Path(os.environ.get(
+    "CROSS_REFS_FILE", str(REPO_ROOT / "config" / "confluence_cross_refs.json")))
+
+
+def load_cross_refs(path: Path = None) -> tuple:
+    """Load (CROSS_REFS, KNOWN_PAGES) from the cross-reference data file.
+
+    CROSS_REFS: key → (page_id, title), where the key is a published file's
+    doc_key or a bare file name; KNOWN_PAGES: page_id → label.
+    """
+    try:
+        with open(path or CROSS_REFS_FILE, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}, {}
+    cross_refs = {name: (entry["page_id"], entry["title"]) for name, entry in data.get("cross_refs", {}).items()}
+    return cross_refs, dict(data.get("known_pages", {}))
+
+
+def doc_key(path) -> str:
+    """Cross-ref key of a file: repo-relative path ("./" for the repo root), absolute outside the repo."""
+    resolved = Path(path).resolve()
+    try:
+        key = resolved.relative_to(REPO_ROOT).as_posix()
+    except ValueError:
+        return resolved.as_posix()
+    return key if "/" in key else f"./{key}"
+
+
+def record_cross_ref(key: str, page_id: str, title: str, path: Path = None):
+    """Record a published page in the data file and the in-memory maps.
+
+    Raises ValueError if key is already mapped to a different page.
+    """
+    path = Path(path or CROSS_REFS_FILE)
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = {}
+    cross_refs = data.setdefault("cross_refs", {})
+    existing = cross_refs.get(key, {}).get("page_id") or CROSS_REFS.get(key, (None,))[0]
+    if existing is not None and str(existing) != str(page_id):
+        raise ValueError(f"{key} is already mapped to page {existing}, not {page_id}")
+    cross_refs[key] = {"page_id": page_id, "title": title}
+    data.setdefault("known_pages", {})[page_id] = title
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    os.replace(tmp, path)
+    CROSS_REFS[key] = (page_id, title)
+    KNOWN_PAGES[page_id] = title
+
+
+CROSS_REFS, KNOWN_PAGES = load_cross_refs()
+
+# Directory publish: concurrent requests (all through the shared rate limiter)
+MD_PUBLISH_WORKERS = int(os.environ.get("MD_PUBLISH_WORKERS", "4"))
+
+# Body of a page created before its content is converted (directory publish, phase 1)
+PLACEHOLDER_CONTENT = "<p>Страница публикуется...</p>"
+
+# Per-section XHTML cache (see md_to_confluence_xhtml)
+MD_SECTION_CACHE_DIR = Path(os.environ.get(
+    "MD_SECTION_CACHE_DIR", str(Path(__file__).parent / ".md_section_cache")))
+MD_SECTION_CACHE_MAX = int(os.environ.get("MD_SECTION_CACHE_MAX", "2000"))
+
+# Bump when the section conversion (steps 1-5 below) changes its output
+CONVERTER_VERSION = "1"
+
+# Collapsible TOC added once at the top of every page
+TOC_MACRO = (
+    '<ac:structured-macro ac:name="expand">'
+    '<ac:parameter ac:name="title">Навигация по документу</ac:parameter>'
+    '<ac:rich-text-body>'
+    '<ac:structured-macro ac:name="toc">'
+    '<ac:parameter ac:name="maxLevel">3</ac:parameter>'
+    '</ac:structured-macro>'
+    '</ac:rich-text-body>'
+    '</ac:structured-macro>'
+)
+
+_SECTION_HEADING = re.compile(r'^#{1,2}\s')
+_REF_DEFINITION = re.compile(r'^ {0,3}\[[^\]]+\]:[ \t]*\S.*$', re.MULTILINE)
+_HEADING_ID = re.compile(r'(<h[1-6] id=")([^"]*)(")')
+_ID_COUNT = re.compile(r'^(.*)_([0-9]+)$')
 
 
 def strip_manual_toc(md_text: str) -> str:
@@ -70,74 +158,115 @@ def strip_manual_toc(md_text: str) -> str:
     return re.sub(pattern, '', md_text, flags=re.MULTILINE | re.DOTALL)
 
 
-def linkify_cross_refs(md_text: str) -> str:
-    """Replace file references with Confluence page links.
+def _short_name(filename: str) -> str:
+    """Short document name used with a section ("phase1a, секция 5.1")."""
+    base = filename[:-3] if filename.endswith(".md") else filename
+    return base.split("_", 1)[0] if base.startswith("phase") else base
+
+
+class CrossRefLinker:
+    """All cross-reference patterns compiled into one regex, applied in a single pass.
 
-    Patterns handled:
+    doc_dir is the directory (doc_key form) of the document being linked: entries
+    published from it are linked by file name and take precedence over bare-name
+    entries; entries from other directories are not linked.
+    """
+
+    def __init__(self, cross_refs: dict, known_pages: dict, base_url: str, doc_dir: str = None):
+        def alternation(names):
+            return "|".join(re.escape(n) for n in sorted(names, key=len, reverse=True))
+
+        self.files = {}
+        for key, (pid, title) in cross_refs.items():
+            folder, _, name = key.rpartition("/")
+            if (folder and folder != doc_dir) or (not folder and name in self.files):
+                continue
+            self.files[name] = (title, self.page_url(base_url, pid))
+        self.shorts = {}
+        for name, target in self.files.items():
+            self.shorts.setdefault(_short_name(name), target)
+        self.pages = {pid: (label, self.page_url(base_url, pid)) for pid, label in known_pages.items()}
+
+        patterns = []
+        if self.files:
+            files = alternation(self.files)
+            patterns.append(rf"`(?P<tick>{files})`")
+            patterns.append(rf"(?<![\[(`])(?P<bare>{files})(?![`)])")
+            patterns.append(rf"(?<!\[)(?P<short>{alternation(self.shorts)}),\s*(?P<section>секци[яию]\s*[\d.]+)")
+        if self.pages:
+            patterns.append(rf"PAGE_ID\s+(?P<page>{alternation(self.pages)})(?!\d)")
+        self.regex = re.compile("|".join(patterns)) if patterns else None
+
+    @staticmethod
+    def page_url(base_url: str, page_id: str) -> str:
+        return f"{base_url}/pages/viewpage.action?pageId={page_id}"
+
+    def _replace(self, m) -> str:
+        kind = m.lastgroup
+        if kind == "section":
+            title, url = self.shorts[m.group("short")]
+            return f"[{title}, {m.group('section')}]({url})"
+        if kind == "page":
+            label, url = self.pages[m.group("page")]
+            return f"[{label}]({url})"
+        title, url = self.files[m.group(kind)]
+        return f"[{title}]({url})"
+
+    def link(self, md_text: str) -> str:
+        return self.regex.sub(self._replace, md_text) if self.regex else md_text
+
+
+@lru_cache(maxsize=8)
+def _linker(base_url: str, cross_refs: tuple, known_pages: tuple, doc_dir: str = None) -> CrossRefLinker:
+    return CrossRefLinker(dict(cross_refs), dict(known_pages), base_url, doc_dir)
+
+
+def linkify_cross_refs(md_text: str, doc_dir: str = None) -> str:
+    """Replace file references with Confluence page links (doc_dir: see CrossRefLinker).
+
+    Patterns handled (one pass of a regex compiled once per cross-ref map):
     - `phase1a_domain_model.md` → clickable link
     - см. phase1a_domain_model.md → clickable link
     - phase1a, секция 5.1 → clickable link with section hint
-    - PAGE_ID 83951683 → clickable link
+    - PAGE_ID 83951683 / Confluence PAGE_ID 83951683 → clickable link (known pages)
     """
-    for filename, (page_id, title) in CROSS_REFS.items():
-        url = f"{CONFLUENCE_URL}/pages/viewpage.action?pageId={page_id}"
-        base = filename.replace('.md', '')
-
-        # Pattern 1: `filename` (in backticks)
-        md_text = md_text.replace(
-            f'`{filename}`',
-            f'[{title}]({url})'
-        )
+    linker = _linker(CONFLUENCE_URL, tuple(CROSS_REFS.items()), tuple(KNOWN_PAGES.items()), doc_dir)
+    return linker.link(md_text)
 
-        # Pattern 2: bare filename (not in backticks, not already in link)
-        md_text = re.sub(
-            rf'(?<!\[)(?<!\()(?<!`){re.escape(filename)}(?!`|\))',
-            f'[{title}]({url})',
-            md_text
-        )
-
-        # Pattern 3: short name with section (e.g., "phase1a, секция 5.1")
-        short = base.replace('_domain_model', '').replace('_go_architecture', '') \
-                     .replace('_react_architecture', '').replace('_ai_analytics', '') \
-                     .replace('_integration_architecture', '')
-        _title, _url = title, url  # bind for lambda closure
-        md_text = re.sub(
-            rf'(?<!\[){re.escape(short)}(?:,\s*секци[яию]\s*[\d.]+)',
-            lambda m, t=_title, u=_url: f'[{t}, {m.group(0).split(",", 1)[1].strip()}]({u})',
-            md_text
-        )
 
-    # Pattern 4: PAGE_ID NNNN → clickable link
-    for page_id, label in KNOWN_PAGES.items():
-        url = f"{CONFLUENCE_URL}/pages/viewpage.action?pageId={page_id}"
-        md_text = re.sub(
-            rf'PAGE_ID\s+{page_id}',
-            f'[{label}]({url})',
-            md_text
-        )
-
-    # Pattern 5: Confluence PAGE_ID NNNN
-    md_text = re.sub(
-        r'Confluence\s+PAGE_ID\s+(\d+)',
-        lambda m: (
-            f'[{KNOWN_PAGES.get(m.group(1), "Confluence")}]'
-            f'({CONFLUENCE_URL}/pages/viewpage.action?pageId={m.group(1)})'
-            if m.group(1) in KNOWN_PAGES
-            else m.group(0)
-        ),
-        md_text
-    )
+def split_sections(md_text: str) -> list:
+    """Split markdown into top-level sections at # / ## headings outside code fences.
 
-    return md_text
-
-
-def md_to_confluence_xhtml(md_text: str) -> str:
-    """Convert markdown to Confluence storage format XHTML."""
+    Fenced blocks are found with the fenced_code extension's own pattern, so a
+    fence opens and closes exactly where the converter sees it (the closing
+    fence repeats the opening one and has no info string; unclosed fences are
+    not code).
+    """
+    fenced = [m.span() for m in FencedBlockPreprocessor.FENCED_BLOCK_RE.finditer(md_text)]
+    sections, current = [], []
+    pos = 0
+    block = 0
+    for line in md_text.splitlines(keepends=True):
+        while block < len(fenced) and fenced[block][1] <= pos:
+            block += 1
+        in_fence = block < len(fenced) and fenced[block][0] <= pos
+        if not in_fence and _SECTION_HEADING.match(line) and current:
+            sections.append("".join(current))
+            current = []
+        current.append(line)
+        pos += len(line)
+    if current:
+        sections.append("".join(current))
+    return sections
+
+
+def convert_section(md_text: str, doc_dir: str = None) -> str:
+    """Convert one markdown section to Confluence XHTML (without the page TOC)."""
     # Step 1: Strip manual TOC
     md_text = strip_manual_toc(md_text)
 
     # Step 2: Linkify cross-references
-    md_text = linkify_cross_refs(md_text)
+    md_text = linkify_cross_refs(md_text, doc_dir)
 
     # Step 3: Remove markdown TOC anchor links (they don't work in Confluence)
     md_text = re.sub(r'\[([^\]]+)\]\(#[^)]+\)', r'\1', md_text)
@@ -154,13 +283,97 @@ def md_to_confluence_xhtml(md_text: str) -> str:
     )
 
     # Step 5: Post-process for Confluence
-    html = postprocess_for_confluence(html)
-
-    return html
+    return postprocess_section(html)
+
+
+def _unique_heading_ids(html: str) -> str:
+    """Make heading ids unique across sections the way the toc extension does per document."""
+    used = set()
+
+    def unique(match):
+        anchor = match.group(2)
+        while anchor in used or not anchor:
+            m = _ID_COUNT.match(anchor)
+            anchor = f"{m.group(1)}_{int(m.group(2)) + 1}" if m else f"{anchor}_1"
+        used.add(anchor)
+        return f"{match.group(1)}{anchor}{match.group(3)}"
+
+    return _HEADING_ID.sub(unique, html)
+
+
+class SectionCache:
+    """On-disk cache of section XHTML keyed by content hash; LRU by mtime."""
+
+    def __init__(self, cache_dir: Path, max_entries: int = MD_SECTION_CACHE_MAX):
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def fingerprint(doc_dir: str = None) -> str:
+        """Everything besides the section text that changes the section XHTML."""
+        return json.dumps([CONVERTER_VERSION, markdown.__version__, CONFLUENCE_URL,
+                           CROSS_REFS, KNOWN_PAGES, doc_dir], ensure_ascii=False, sort_keys=True)
+
+    def get(self, key: str):
+        path = self.cache_dir / f"{key}.xhtml"
+        try:
+            html = path.read_text(encoding="utf-8")
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return html
+
+    def put(self, key: str, html: str):
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = self.cache_dir / f".{key}.tmp"
+            tmp.write_text(html, encoding="utf-8")
+            os.replace(tmp, self.cache_dir / f"{key}.xhtml")
+            entries = sorted(self.cache_dir.glob("*.xhtml"), key=lambda p: p.stat().st_mtime)
+            for old in entries[:max(0, len(entries) - self.max_entries)]:
+                old.unlink(missing_ok=True)
+        except OSError:
+            pass
+
+
+def md_to_confluence_xhtml(md_text: str, cache=None, doc_dir: str = None) -> str:
+    """Convert markdown to Confluence storage format XHTML.
+
+    Sections are converted independently; with a SectionCache only sections whose
+    text (or the converter / cross-ref map) changed are rendered again. Reference
+    link definitions are shared by all sections. doc_dir is the document's
+    directory for cross-reference linking (see CrossRefLinker).
+    """
+    definitions = "\n".join(_REF_DEFINITION.findall(md_text))
+    suffix = f"\n\n{definitions}\n" if definitions else ""
+    fingerprint = SectionCache.fingerprint(doc_dir) if cache is not None else ""
+
+    parts = []
+    for section in split_sections(md_text):
+        html = None
+        if cache is not None:
+            key = hashlib.sha256(f"{fingerprint}\0{suffix}\0{section}".encode("utf-8")).hexdigest()
+            html = cache.get(key)
+        if html is None:
+            html = convert_section(section + suffix, doc_dir)
+            if cache is not None:
+                cache.put(key, html)
+        if html:
+            parts.append(html)
+
+    return TOC_MACRO + '\n' + _unique_heading_ids("\n".join(parts))
 
 
 def postprocess_for_confluence(html: str) -> str:
-    """Apply Confluence-specific transformations."""
+    """Apply Confluence-specific transformations (page TOC + section transformations)."""
+    return TOC_MACRO + '\n' + postprocess_section(html)
+
+
+def postprocess_section(html: str) -> str:
+    """Apply Confluence-specific transformations to converted section HTML."""
 
     # 1. Add warm yellow background to table headers
     html = re.sub(
@@ -202,20 +415,7 @@ def postprocess_for_confluence(html: str) -> str:
         flags=re.DOTALL
     )
 
-    # 3. Add collapsible TOC at the top
-    toc_macro = (
-        '<ac:structured-macro ac:name="expand">'
-        '<ac:parameter ac:name="title">Навигация по документу</ac:parameter>'
-        '<ac:rich-text-body>'
-        '<ac:structured-macro ac:name="toc">'
-        '<ac:parameter ac:name="maxLevel">3</ac:parameter>'
-        '</ac:structured-macro>'
-        '</ac:rich-text-body>'
-        '</ac:structured-macro>'
-    )
-    html = toc_macro + '\n' + html
-
-    # 4. Add anchor IDs to headings for cross-references
+    # 3. Add anchor IDs to headings for cross-references
     def add_anchor(match):
         tag = match.group(1)
         text = match.group(2)
@@ -230,14 +430,23 @@ def postprocess_for_confluence(html: str) -> str:
 
     html = re.sub(r'<(h[1-6])>(.*?)</\1>', add_anchor, html)
 
-    # 5. Fix horizontal rules
+    # 4. Fix horizontal rules
     html = html.replace('<hr />', '<hr/>')
 
     return html
 
 
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=1, min=2, max=10),
+    retry=retry_if_exception(lambda e: isinstance(e, urllib.error.HTTPError) and e.code in THROTTLE_CODES),
+    reraise=True,
+)
 def _api_request(url: str, data: bytes = None, method: str = "GET") -> dict:
-    """Make authenticated Confluence REST API request."""
+    """Make authenticated Confluence REST API request.
+
+    Goes through the shared Confluence rate limiter; 429/503 slow it down and are retried.
+    """
     req = urllib.request.Request(
         url,
         data=data,
@@ -248,13 +457,29 @@ def _api_request(url: str, data: bytes = None, method: str = "GET") -> dict:
         method=method
     )
     ctx = ssl.create_default_context()
-    with urllib.request.urlopen(req, context=ctx) as resp:
-        return json.loads(resp.read().decode('utf-8'))
+    _rate_limiter.acquire()
+    try:
+        with urllib.request.urlopen(req, context=ctx) as resp:
+            result = json.loads(resp.read().decode('utf-8'))
+    except urllib.error.HTTPError as e:
+        if e.code in THROTTLE_CODES:
+            _rate_limiter.on_throttle(_parse_retry_after((e.headers or {}).get("Retry-After")))
+        raise
+    _rate_limiter.on_success()
+    return result
+
+
+def _page_result(result: dict, default_version: int) -> dict:
+    return {
+        "id": result["id"],
+        "title": result["title"],
+        "url": f"{CONFLUENCE_URL}/pages/viewpage.action?pageId={result['id']}",
+        "version": result.get("version", {}).get("number", default_version),
+    }
 
 
-def create_confluence_page(space_key: str, title: str, content: str,
-                           parent_id: str = None) -> dict:
-    """Create a new Confluence page via REST API."""
+def _create_page(space_key: str, title: str, content: str, parent_id: str = None) -> dict:
+    """POST a new page; raises urllib.error.HTTPError."""
     payload = {
         "type": "page",
         "title": title,
@@ -263,19 +488,48 @@ def create_confluence_page(space_key: str, title: str, content: str,
     }
     if parent_id:
         payload["ancestors"] = [{"id": parent_id}]
+    result = _api_request(
+        f"{CONFLUENCE_URL}/rest/api/content",
+        data=json.dumps(payload).encode('utf-8'),
+        method="POST"
+    )
+    return _page_result(result, 1)
 
-    try:
-        result = _api_request(
-            f"{CONFLUENCE_URL}/rest/api/content",
-            data=json.dumps(payload).encode('utf-8'),
-            method="POST"
-        )
-        return {
-            "id": result["id"],
-            "title": result["title"],
-            "url": f"{CONFLUENCE_URL}/pages/viewpage.action?pageId={result['id']}",
-            "version": result.get("version", {}).get("number", 1),
+
+def _current_version(page_id: str) -> int:
+    current = _api_request(f"{CONFLUENCE_URL}/rest/api/content/{page_id}?expand=version")
+    return current["version"]["number"]
+
+
+def _put_page(page_id: str, title: str, content: str, current_version: int,
+              version_message: str = "") -> dict:
+    """PUT the next version of a page; raises urllib.error.HTTPError."""
+    payload = {
+        "type": "page",
+        "title": title,
+        "body": {"storage": {"value": content, "representation": "storage"}},
+        "version": {
+            "number": current_version + 1,
+            "message": version_message or "Updated via publish_md_to_confluence.py"
         }
+    }
+    result = _api_request(
+        f"{CONFLUENCE_URL}/rest/api/content/{page_id}",
+        data=json.dumps(payload).encode('utf-8'),
+        method="PUT"
+    )
+    return _page_result(result, current_version + 1)
+
+
+def _update_page(page_id: str, title: str, content: str, version_message: str = "") -> dict:
+    return _put_page(page_id, title, content, _current_version(page_id), version_message)
+
+
+def create_confluence_page(space_key: str, title: str, content: str,
+                           parent_id: str = None) -> dict:
+    """Create a new Confluence page via REST API."""
+    try:
+        return _create_page(space_key, title, content, parent_id)
     except urllib.error.HTTPError as e:
         error_body = e.read().decode('utf-8')
         print(f"ERROR {e.code}: {error_body}", file=sys.stderr)
@@ -287,59 +541,116 @@ def update_confluence_page(page_id: str, title: str, content: str,
     """Update an existing Confluence page via REST API."""
     # Get current version
     try:
-        current = _api_request(
-            f"{CONFLUENCE_URL}/rest/api/content/{page_id}?expand=version"
-        )
+        current_version = _current_version(page_id)
     except urllib.error.HTTPError as e:
         error_body = e.read().decode('utf-8')
         print(f"ERROR reading page {page_id}: {e.code}: {error_body}", file=sys.stderr)
         sys.exit(1)
 
-    current_version = current["version"]["number"]
-
-    payload = {
-        "type": "page",
-        "title": title,
-        "body": {"storage": {"value": content, "representation": "storage"}},
-        "version": {
-            "number": current_version + 1,
-            "message": version_message or "Updated via publish_md_to_confluence.py"
-        }
-    }
-
     try:
-        result = _api_request(
-            f"{CONFLUENCE_URL}/rest/api/content/{page_id}",
-            data=json.dumps(payload).encode('utf-8'),
-            method="PUT"
-        )
-        return {
-            "id": result["id"],
-            "title": result["title"],
-            "url": f"{CONFLUENCE_URL}/pages/viewpage.action?pageId={result['id']}",
-            "version": result.get("version", {}).get("number", current_version + 1),
-        }
+        return _put_page(page_id, title, content, current_version, version_message)
     except urllib.error.HTTPError as e:
         error_body = e.read().decode('utf-8')
         print(f"ERROR {e.code}: {error_body}", file=sys.stderr)
         sys.exit(1)
 
 
+def _doc_title(key: str, md_text: str) -> str:
+    """Page title: recorded title, else the first '# ' heading, else the file name."""
+    if key in CROSS_REFS:
+        return CROSS_REFS[key][1]
+    m = re.search(r'^#\s+(.+?)\s*#*\s*$', md_text, re.MULTILINE)
+    return m.group(1) if m else key.rpartition("/")[2][:-3]
+
+
+def publish_directory(directory: str, space_key: str, parent_id: str = None,
+                      version_message: str = "", workers: int = MD_PUBLISH_WORKERS,
+                      cache=None) -> dict:
+    """Publish every *.md in a directory, resolving cross-links between them.
+
+    Phase 1 creates pages for files not yet in the cross-ref map (concurrently,
+    with a placeholder body) and records their IDs, so that phase 2 can convert
+    every document with links to all of them and update the pages concurrently.
+    All requests share the Confluence rate limiter. The ID map is saved in
+    CROSS_REFS_FILE for the next run. Pages are looked up by doc_key (path), so a
+    file never updates the page of a same-named file in another directory.
+    """
+    paths = sorted(Path(directory).glob("*.md"))
+    docs = {p.name: p.read_text(encoding="utf-8") for p in paths}
+    keys = {p.name: doc_key(p) for p in paths}
+    doc_dir = keys[paths[0].name].rpartition("/")[0] if paths else None
+    titles = {name: _doc_title(keys[name], text) for name, text in docs.items()}
+    summary = {"created": [], "updated": [], "failed": {}}
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        missing = [name for name in docs if keys[name] not in CROSS_REFS]
+        futures = {
+            pool.submit(_create_page, space_key, titles[name], PLACEHOLDER_CONTENT, parent_id): name
+            for name in missing
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+            except (urllib.error.URLError, KeyError, ValueError) as e:
+                summary["failed"][name] = str(e)
+                print(f"FAILED create {name}: {e}", file=sys.stderr)
+                continue
+            record_cross_ref(keys[name], result["id"], titles[name])
+            summary["created"].append(name)
+            print(f"Created: {titles[name]} (ID: {result['id']})")
+
+        # Every target page exists now: convert with the complete map
+        ready = [name for name in docs if keys[name] in CROSS_REFS and name not in summary["failed"]]
+        futures = {}
+        for name in ready:
+            xhtml = md_to_confluence_xhtml(docs[name], cache=cache, doc_dir=doc_dir)
+            page_id = CROSS_REFS[keys[name]][0]
+            futures[pool.submit(_update_page, page_id, titles[name], xhtml, version_message)] = name
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+            except (urllib.error.URLError, KeyError, ValueError) as e:
+                summary["failed"][name] = str(e)
+                print(f"FAILED update {name}: {e}", file=sys.stderr)
+                continue
+            summary["updated"].append({"file": name, "id": result["id"], "version": result["version"]})
+            print(f"Updated: {result['url']} (version: {result['version']})")
+
+    summary["updated"].sort(key=lambda r: r["file"])
+    summary["created"].sort()
+    return summary
+
+
 def main():
     parser = argparse.ArgumentParser(description="Publish Markdown to Confluence")
-    parser.add_argument("--title", required=True, help="Page title")
-    parser.add_argument("--file", required=True, help="Markdown file path")
+    parser.add_argument("--title", help="Page title (required with --file)")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--file", help="Markdown file path")
+    source.add_argument("--dir", help="Publish every *.md in a directory (page IDs from the cross-ref map)")
     parser.add_argument("--space", default="EW", help="Confluence space key")
     parser.add_argument("--parent", help="Parent page ID (for create)")
     parser.add_argument("--page-id", help="Existing page ID (for update)")
     parser.add_argument("--dry-run", action="store_true", help="Print XHTML without publishing")
     parser.add_argument("--version-message", default="", help="Version history message")
+    parser.add_argument("--no-cache", action="store_true", help="Convert all sections (ignore section cache)")
+    parser.add_argument("--workers", type=int, default=MD_PUBLISH_WORKERS, help="Concurrent requests with --dir")
     args = parser.parse_args()
+    cache = None if args.no_cache else SectionCache(MD_SECTION_CACHE_DIR)
+
+    if args.dir:
+        return _main_directory(args, cache)
+    if not args.title:
+        parser.error("--title is required with --file")
 
     with open(args.file, 'r', encoding='utf-8') as f:
         md_content = f.read()
 
-    xhtml = md_to_confluence_xhtml(md_content)
+    key = doc_key(args.file)
+    xhtml = md_to_confluence_xhtml(md_content, cache=cache, doc_dir=key.rpartition("/")[0])
+    if cache is not None:
+        print(f"Sections: {cache.hits + cache.misses} ({cache.hits} from cache)")
 
     if args.dry_run:
         print(f"=== XHTML for '{args.title}' ({len(xhtml)} chars) ===")
@@ -365,8 +676,34 @@ def main():
         result = create_confluence_page(args.space, args.title, xhtml, args.parent)
         print(f"Created: {result['url']} (ID: {result['id']}, version: {result['version']})")
 
+    try:
+        record_cross_ref(key, result["id"], args.title)
+    except ValueError as e:
+        print(f"WARNING: cross-ref map not updated: {e}", file=sys.stderr)
     print(json.dumps(result))
 
 
+def _main_directory(args, cache):
+    paths = sorted(Path(args.dir).glob("*.md"))
+    if args.dry_run:
+        for path in paths:
+            key = doc_key(path)
+            action = f"update {CROSS_REFS[key][0]}" if key in CROSS_REFS else "create"
+            print(f"  {path.name}: {action}")
+        print(f"\n{len(paths)} file(s)")
+        return
+
+    if not CONFLUENCE_TOKEN:
+        print("ERROR: CONFLUENCE_TOKEN not set. Run: source scripts/load-secrets.sh",
+              file=sys.stderr)
+        sys.exit(1)
+
+    summary = publish_directory(args.dir, args.space, args.parent, args.version_message,
+                                workers=args.workers, cache=cache)
+    print(json.dumps(summary, ensure_ascii=False))
+    if summary["failed"]:
+        sys.exit(1)
+
+
 if __name__ == "__main__":
     main()
@@ -21,6 +21,7 @@ import os
 import re
 import sys
 from datetime import datetime
+from functools import lru_cache
 
 try:
     import docx
@@ -58,6 +59,7 @@ SKIP_AFTER_CODE_SYSTEM = [
 
 
 # === Color mapping ===
+@lru_cache(maxsize=None)
 def hex_to_confluence_color(hex_color):
     """Map Word cell color to Confluence background"""
     if not hex_color or hex_color in ('auto', 'none'):
@@ -109,6 +111,61 @@ def get_cell_color(cell):
             return shd.get(qn('w:fill'))
     return None
 
+def scan_table(table):
+    """Read a Word table once: list of rows, each a list of (text, fill) per cell.
+
+    Merged cells repeat the same <w:tc> in row.cells (and vertical merges walk up
+    to the first row of the span), so text and fill are read once per <w:tc>.
+    """
+    seen = {}
+    rows = []
+    for row in table.rows:
+        cells = []
+        for cell in row.cells:
+            tc = cell._tc
+            data = seen.get(tc)
+            if data is None:
+                data = seen[tc] = (cell.text.strip(), get_cell_color(cell))
+            cells.append(data)
+        rows.append(cells)
+    return rows
+
+def classify_table(rows):
+    """Kind of a scanned table: 'meta', 'history', 'warning', 'note' or None (regular)."""
+    if not rows:
+        return None
+    first_cell = rows[0][0][0].lower() if rows[0] else ''
+    # Метаданные (Версия/Дата/Статус/Автор)
+    if len(rows) >= 3 and len(rows[0]) == 2:
+        if first_cell == 'версия' and rows[1][0][0].lower() == 'дата':
+            return 'meta'
+    # 'верси' ловит и 'версия' и 'версии' и 'версий'
+    if len(rows) > 2 and ('верси' in first_cell or 'version' in first_cell or 'история' in first_cell):
+        return 'history'
+    if len(rows) == 1 and len(rows[0]) == 1:
+        return _panel_type(first_cell)
+    return None
+
+def _panel_type(text):
+    """Panel for a 1x1 callout text (lowercase) - only for real warnings with keywords"""
+    # Keywords for critical (warning = КРАСНАЯ панель в Confluence Server)
+    critical_keywords = ['критич', 'зависимость', 'critical']
+    # Keywords for info/note (note = ЖЁЛТАЯ панель в Confluence Server)
+    note_keywords = ['исключение', 'важно', 'внимание', '⚠']
+
+    # Критические = warning (КРАСНАЯ панель в Confluence)
+    if any(kw in text for kw in critical_keywords):
+        return 'warning'
+    # Предупреждения = note (ЖЁЛТАЯ панель в Confluence)
+    if any(kw in text for kw in note_keywords):
+        return 'note'
+    return None  # Обычная 1x1 таблица - не панель!
+
+def is_code_system_table(rows):
+    """Check if a scanned table lists codes (Код + Наименование/Описание header)"""
+    first_row_text = ' '.join(text for text, _ in rows[0]).lower() if rows else ''
+    return 'код' in first_row_text and ('наименование' in first_row_text or 'описание' in first_row_text)
+
 # === Convert to XHTML ===
 def escape_html(text):
     """Escape HTML special characters"""
@@ -119,9 +176,11 @@ def para_to_html(para, make_bold=False):
     text = para.text.strip()
     if not text:
         return ""
+    return _para_html(text, para.style.name if para.style else "Normal", make_bold)
 
+def _para_html(text, style, make_bold=False):
+    """Render stripped paragraph text with a resolved style name"""
     text = escape_html(text)
-    style = para.style.name if para.style else "Normal"
 
     # Заголовки - жирным
     if style == "Title":
@@ -145,28 +204,7 @@ def para_to_html(para, make_bold=False):
 def is_warning_table(table):
     """Check if table is a warning/note callout - only for real warnings with keywords"""
     if len(table.rows) == 1 and len(table.rows[0].cells) == 1:
-        text = table.rows[0].cells[0].text.strip().lower()
-        get_cell_color(table.rows[0].cells[0])  # may be used in future color-based detection
-
-        # Keywords for critical (warning = КРАСНАЯ панель в Confluence Server)
-        critical_keywords = ['критич', 'зависимость', 'critical']
-        # Keywords for info/note (note = ЖЁЛТАЯ панель в Confluence Server)
-        note_keywords = ['исключение', 'важно', 'внимание', '⚠']
-
-        is_critical = any(kw in text for kw in critical_keywords)
-        is_note = any(kw in text for kw in note_keywords)
-
-        if not is_critical and not is_note:
-            return None  # Обычная 1x1 таблица - не панель!
-
-        # Критические = warning (КРАСНАЯ панель в Confluence)
-        if is_critical:
-            return 'warning'
-
-        # Предупреждения = note (ЖЁЛТАЯ панель в Confluence)
-        if is_note:
-            return 'note'
-
+        return _panel_type(table.rows[0].cells[0].text.strip().lower())
     return None
 
 def is_history_table(table):
@@ -189,50 +227,53 @@ def is_meta_table(table):
 
 def meta_table_to_html(table):
     """Render meta-table with auto-date"""
+    return _meta_html(scan_table(table))
+
+def _meta_html(rows):
     today = datetime.now().strftime("%d.%m.%Y")
-    rows_data = []
-    for row in table.rows:
-        key = row.cells[0].text.strip()
-        val = row.cells[1].text.strip()
+    html = ['<table class="confluenceTable"><tbody>']
+    for row in rows:
+        key = row[0][0]
+        val = row[1][0]
         # Подмена даты на текущую
         if key.lower() == 'дата':
             val = today
         # Подмена версии
         if key.lower() == 'версия':
             val = FM_VERSION
-        rows_data.append((key, val))
-
-    html = '<table class="confluenceTable"><tbody>'
-    for key, val in rows_data:
-        html += f'<tr><td class="confluenceTd" style="background-color: #f4f5f7;"><strong>{escape_html(key)}</strong></td>'
-        html += f'<td class="confluenceTd">{escape_html(val)}</td></tr>'
-    html += '</tbody></table>'
-    return html
+        html.append(f'<tr><td class="confluenceTd" style="background-color: #f4f5f7;"><strong>{escape_html(key)}</strong></td>')
+        html.append(f'<td class="confluenceTd">{escape_html(val)}</td></tr>')
+    html.append('</tbody></table>')
+    return ''.join(html)
 
 def history_table_to_html(table):
     """Render history table with only one clean entry"""
+    return _history_html(scan_table(table))
+
+def _history_html(rows):
     today = datetime.now().strftime("%d.%m.%Y")
     # Header row
-    headers = [escape_html(c.text.strip()) for c in table.rows[0].cells]
-    html = '<table class="confluenceTable"><tbody>'
-    html += '<tr>'
-    for h in headers:
-        html += f'<th class="confluenceTh" style="background-color: #f4f5f7;"><strong>{h}</strong></th>'
-    html += '</tr>'
+    html = ['<table class="confluenceTable"><tbody>', '<tr>']
+    for text, _ in rows[0]:
+        html.append(f'<th class="confluenceTh" style="background-color: #f4f5f7;"><strong>{escape_html(text)}</strong></th>')
+    html.append('</tr>')
     # Одна чистая запись
-    html += '<tr><td class="confluenceTd">1.0.0</td>'
-    html += f'<td class="confluenceTd">{today}</td>'
-    html += '<td class="confluenceTd">Шаховский А.С.</td>'
-    html += '<td class="confluenceTd">Первая публикация в Confluence</td></tr>'
-    html += '</tbody></table>'
-    return html
+    html.append('<tr><td class="confluenceTd">1.0.0</td>')
+    html.append(f'<td class="confluenceTd">{today}</td>')
+    html.append('<td class="confluenceTd">Шаховский А.С.</td>')
+    html.append('<td class="confluenceTd">Первая публикация в Confluence</td></tr>')
+    html.append('</tbody></table>')
+    return ''.join(html)
 
 def table_to_html(table, panel_type=None):
     """Convert Word table to Confluence XHTML table"""
+    return _table_html(scan_table(table), panel_type)
+
+def _table_html(rows, panel_type=None):
 
     # Warning panel (КРАСНАЯ в Confluence Server) - для ⛔ критических
     if panel_type == 'warning':
-        cell_text = escape_html(table.rows[0].cells[0].text.strip())
+        cell_text = escape_html(rows[0][0][0])
         # Убираем эмодзи ⛔ - Confluence panel уже имеет свою иконку
         cell_text = re.sub(r'^⛔\s*', '', cell_text)
         return f'''<ac:structured-macro ac:name="warning">
@@ -241,7 +282,7 @@ def table_to_html(table, panel_type=None):
 
     # Note panel (ЖЁЛТАЯ в Confluence Server) - для ⚠ предупреждений
     if panel_type == 'note':
-        cell_text = escape_html(table.rows[0].cells[0].text.strip())
+        cell_text = escape_html(rows[0][0][0])
         # Убираем эмодзи ⚠ - Confluence panel уже имеет свою иконку
         cell_text = re.sub(r'^[⚠️]+\s*', '', cell_text)
         return f'''<ac:structured-macro ac:name="note">
@@ -249,34 +290,30 @@ def table_to_html(table, panel_type=None):
 </ac:structured-macro>'''
 
     # Regular table with styling
-    html = '<table class="confluenceTable"><tbody>'
-    for i, row in enumerate(table.rows):
+    html = ['<table class="confluenceTable"><tbody>']
+    for i, row in enumerate(rows):
         # Пропускаем пустые строки
-        row_text = ''.join(c.text.strip() for c in row.cells)
-        if not row_text and i > 0:
+        if i > 0 and not any(text for text, _ in row):
             continue
 
-        html += '<tr>'
-        for cell in row.cells:
-            tag = 'th' if i == 0 else 'td'
-            cell_class = 'confluenceTh' if i == 0 else 'confluenceTd'
-            cell_text = escape_html(cell.text.strip())
+        html.append('<tr>')
+        for text, color in row:
+            cell_text = escape_html(text)
 
             # Get background color
-            color = get_cell_color(cell)
             bg = hex_to_confluence_color(color) if color else None
 
             # Header row - bold and gray background
             if i == 0:
                 bg = bg or '#f4f5f7'
-                html += f'<{tag} class="{cell_class}" style="background-color: {bg};"><strong>{cell_text}</strong></{tag}>'
+                html.append(f'<th class="confluenceTh" style="background-color: {bg};"><strong>{cell_text}</strong></th>')
             elif bg:
-                html += f'<{tag} class="{cell_class}" style="background-color: {bg};">{cell_text}</{tag}>'
+                html.append(f'<td class="confluenceTd" style="background-color: {bg};">{cell_text}</td>')
             else:
-                html += f'<{tag} class="{cell_class}">{cell_text}</{tag}>'
-        html += '</tr>'
-    html += '</tbody></table>'
-    return html
+                html.append(f'<td class="confluenceTd">{cell_text}</td>')
+        html.append('</tr>')
+    html.append('</tbody></table>')
+    return ''.join(html)
 
 def should_skip_paragraph(text, skip_mode):
     """Check if paragraph should be skipped"""
@@ -312,45 +349,51 @@ def _parse_args():
     parser.add_argument("--from-file", metavar="XHTML", help="Путь к файлу с XHTML тела страницы (Confluence-only)")
     parser.add_argument("--project", metavar="PROJECT", help="Имя проекта (для PAGE_ID из projects/PROJECT/CONFLUENCE_PAGE_ID)")
     parser.add_argument("--message", metavar="TEXT", default="Update from script", help="Комментарий версии (version.message)")
+    parser.add_argument("--force", action="store_true", help="Публиковать даже если тело страницы не изменилось")
     return parser.parse_args()
 
 
-def _build_content_from_docx(doc, fm_code):
-    """Convert a python-docx Document to Confluence XHTML content string."""
-    print("\n=== ПОСТРОЕНИЕ КОНТЕНТА ===")
+def iter_docx_xhtml(doc, fm_code):
+    """Convert a python-docx Document to Confluence XHTML, one fragment per block.
 
-    html_parts = []
+    Body elements are converted as they are walked (nothing is collected up
+    front); each table is read once by scan_table and classified from that
+    scan, and paragraph style names are resolved once per style id.
+    """
     in_list = False
     skip_code_system_descriptions = False
     in_code_system_section = False
     code_system_items = []
+    style_names = {}
 
     today = datetime.now().strftime("%d.%m.%Y")
-    header = f'''<p><strong>Код:</strong> {fm_code} | <strong>Версия:</strong> {FM_VERSION} | <strong>Дата:</strong> {today}</p>
+    yield f'''<p><strong>Код:</strong> {fm_code} | <strong>Версия:</strong> {FM_VERSION} | <strong>Дата:</strong> {today}</p>
 <hr/>'''
-    html_parts.append(header)
 
     for element in doc.element.body:
         if isinstance(element, CT_P):
-            para = Paragraph(element, doc)
-            text = para.text.strip()
+            text = element.text.strip()
 
             if not text:
                 if in_list:
-                    html_parts.append('</ul>')
+                    yield '</ul>'
                     in_list = False
                 continue
 
             if text.startswith("Дата последнего изменения"):
                 continue
 
-            style = para.style.name if para.style else "Normal"
+            style_id = element.style
+            style = style_names.get(style_id)
+            if style is None:
+                para_style = Paragraph(element, doc).style
+                style = style_names[style_id] = para_style.name if para_style else "Normal"
 
             # === Система кодов: собираем в таблицу ===
             if "система кодов" in text.lower() and style in ["Heading 2", "Heading 3"]:
                 in_code_system_section = True
                 skip_code_system_descriptions = True
-                html_parts.append(para_to_html(para))
+                yield _para_html(text, style)
                 continue
 
             if in_code_system_section and style in ["Heading 1", "Heading 2"] and "система кодов" not in text.lower():
@@ -364,7 +407,7 @@ def _build_content_from_docx(doc, fm_code):
                         tbl += f'<tr><td class="confluenceTd"><strong>{escape_html(code_name)}</strong></td>'
                         tbl += f'<td class="confluenceTd">{escape_html(desc)}</td></tr>'
                     tbl += '</tbody></table>'
-                    html_parts.append(tbl)
+                    yield tbl
                     code_system_items = []
 
             if in_code_system_section:
@@ -389,71 +432,72 @@ def _build_content_from_docx(doc, fm_code):
 
             if text.startswith('⚠') and style == 'Normal':
                 if in_list:
-                    html_parts.append('</ul>')
+                    yield '</ul>'
                     in_list = False
                 clean = re.sub(r'^[⚠️\ufe0f]+\s*', '', text)
                 warning_text = escape_html(clean)
-                html_parts.append(f'''<ac:structured-macro ac:name="note">
+                yield f'''<ac:structured-macro ac:name="note">
 <ac:rich-text-body><p>{warning_text}</p></ac:rich-text-body>
-</ac:structured-macro>''')
+</ac:structured-macro>'''
                 continue
 
             if "List" in style or text.startswith("*") or text.startswith("-"):
                 if not in_list:
-                    html_parts.append('<ul>')
+                    yield '<ul>'
                     in_list = True
                 clean_text = re.sub(r'^[*\-]\s*', '', text)
-                html_parts.append(f'<li>{escape_html(clean_text)}</li>')
+                yield f'<li>{escape_html(clean_text)}</li>'
             else:
                 if in_list:
-                    html_parts.append('</ul>')
+                    yield '</ul>'
                     in_list = False
-                html_parts.append(para_to_html(para))
+                yield _para_html(text, style)
 
         elif isinstance(element, CT_Tbl):
             if in_list:
-                html_parts.append('</ul>')
+                yield '</ul>'
                 in_list = False
 
-            table = Table(element, doc)
+            rows = scan_table(Table(element, doc))
+            kind = classify_table(rows)
 
-            if is_meta_table(table):
-                html_parts.append(meta_table_to_html(table))
+            if kind == 'meta':
+                yield _meta_html(rows)
                 continue
 
-            if is_history_table(table) and len(table.rows) > 2:
-                html_parts.append(history_table_to_html(table))
+            if kind == 'history':
+                yield _history_html(rows)
                 continue
 
-            if len(table.rows) == 1 and len(table.rows[0].cells) == 1:
-                panel_type = is_warning_table(table)
-                if panel_type:
-                    html_parts.append(table_to_html(table, panel_type))
-                    continue
-
-            html_parts.append(table_to_html(table))
-
-            first_row_text = ' '.join([c.text for c in table.rows[0].cells]).lower() if table.rows else ''
-            if 'код' in first_row_text and ('наименование' in first_row_text or 'описание' in first_row_text):
+            yield _table_html(rows, kind)
+            if kind is None and is_code_system_table(rows):
                 skip_code_system_descriptions = True
 
     if in_list:
-        html_parts.append('</ul>')
+        yield '</ul>'
 
-    content = '\n'.join(html_parts)
+
+def _build_content_from_docx(doc, fm_code):
+    """Convert a python-docx Document to Confluence XHTML content string."""
+    print("\n=== ПОСТРОЕНИЕ КОНТЕНТА ===")
+    content = '\n'.join(iter_docx_xhtml(doc, fm_code))
     print(f"  Сгенерировано: {len(content)} символов HTML")
     return content
 
 
-def _publish_to_confluence(content, page_id, token, version_message):
-    """Sanitize XHTML and publish to Confluence with lock + backup + retry."""
+def _publish_to_confluence(content, page_id, token, version_message, force=False):
+    """Sanitize XHTML and publish to Confluence with lock + backup + retry.
+
+    Unchanged bodies are not re-published (no empty versions) unless force=True.
+    """
     print("\n=== ОБНОВЛЕНИЕ CONFLUENCE (safe_publish) ===")
 
     sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
     from fm_review.confluence_utils import ConfluenceAPIError, ConfluenceClient, ConfluenceLockError
-    from fm_review.xhtml_sanitizer import sanitize_xhtml
+    from fm_review.sanitize_cache import sanitize_xhtml_cached
 
-    content, sanitizer_warnings = sanitize_xhtml(content)
+    # Cached by body hash: re-publish / retries of the same body skip the sanitizer
+    content, sanitizer_warnings = sanitize_xhtml_cached(content, page_id=page_id)
     if sanitizer_warnings:
         print("  XHTML Sanitizer warnings:")
         for w in sanitizer_warnings:
@@ -471,16 +515,20 @@ def _publish_to_confluence(content, page_id, token, version_message):
             print(f"  Страница: {page_title}")
             print(f"  Текущая версия: {current_version}")
 
-            result, backup_path = client.update_page(
+            result, backup_id = client.update_page(
                 new_body=content,
                 version_message=version_message,
-                agent_name="Agent7_Publisher"
+                agent_name="Agent7_Publisher",
+                skip_unchanged=not force
             )
 
             new_version = result.get('version', {}).get('number', '?')
-            print(f"  Новая версия: {new_version}")
-            if backup_path:
-                print(f"  Бекап: {backup_path.name}")
+            if new_version == current_version:
+                print("  Без изменений: новая версия не создана")
+            else:
+                print(f"  Новая версия: {new_version}")
+            if backup_id:
+                print(f"  Бекап: {backup_id}")
             print("\n  ГОТОВО!")
             print(f"URL: {CONFLUENCE_URL}/pages/viewpage.action?pageId={page_id}")
 
@@ -563,7 +611,7 @@ def main():
         content = _build_content_from_docx(doc, fm_code)
         version_message = "Import from docx"
 
-    _publish_to_confluence(content, page_id, token, version_message)
+    _publish_to_confluence(content, page_id, token, version_message, force=args.force)
 
 
 if __name__ == "__main__":
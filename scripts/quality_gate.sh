@@ -211,15 +211,12 @@ if [[ -d "$AUDIT_LOG_DIR" ]]; then
     log_files=$(find "$AUDIT_LOG_DIR" -name '*.jsonl' 2>/dev/null | wc -l | tr -d ' ')
     if [[ "${log_files:-0}" -gt 0 ]]; then
         check_pass "Журнал аудита: ${log_files} файл(ов)"
-        # Проверяем что все записи от Agent 7
-        if command -v jq &>/dev/null; then
-            for logfile in "${AUDIT_LOG_DIR}"/*.jsonl; do
-                [[ -f "$logfile" ]] || continue
-                non_publisher=$(jq -r 'select(.agent != "Agent7_Publisher" and .agent != "unknown" and .agent != "system") | .agent' "$logfile" 2>/dev/null | sort -u)
-                if [[ -n "$non_publisher" ]]; then
-                    check_warn "Записи в Confluence от агентов кроме Agent 7: ${non_publisher}"
-                fi
-            done
+        # Проверяем что все записи от Agent 7 (по индексу агентов, без полного чтения журналов)
+        non_publisher=$(PYTHONPATH="${ROOT_DIR}/src" python3 -m fm_review.audit_log \
+            --dir "$AUDIT_LOG_DIR" --agents --exclude Agent7_Publisher,unknown,system 2>/dev/null \
+            | tr '\n' ' ' | sed 's/ $//') || true
+        if [[ -n "$non_publisher" ]]; then
+            check_warn "Записи в Confluence от агентов кроме Agent 7: ${non_publisher}"
         fi
     else
         check_warn "Журнал аудита пуст"
@@ -345,6 +342,16 @@ PAGE_ID_FILE="${PROJECT_DIR}/CONFLUENCE_PAGE_ID"
 if [[ -f "$PAGE_ID_FILE" ]]; then
     PAGE_ID=$(cat "$PAGE_ID_FILE" | tr -d '[:space:]')
     [[ -n "$PAGE_ID" ]] && check_pass "Confluence PAGE_ID: ${PAGE_ID}" || check_warn "CONFLUENCE_PAGE_ID файл пуст"
+    # Предупреждения санитайзера XHTML из кэша последней публикации (без повторного прогона)
+    if [[ -n "$PAGE_ID" ]]; then
+        sanitizer_warnings=$(PYTHONPATH="${ROOT_DIR}/src" python3 -m fm_review.sanitize_cache \
+            --page-id "$PAGE_ID" 2>/dev/null) || true
+        if [[ -n "$sanitizer_warnings" ]]; then
+            while IFS= read -r w; do
+                check_warn "XHTML Sanitizer: ${w}"
+            done <<< "$sanitizer_warnings"
+        fi
+    fi
 else
     # Альтернатива: искать PAGE_ID в PROJECT_CONTEXT.md
     if [[ -f "${PROJECT_DIR}/PROJECT_CONTEXT.md" ]]; then
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+Confluence audit log storage (FC-12B).
+
+One log per page in the audit log directory:
+  - confluence_<page>.jsonl           active segment, append-only JSONL
+  - confluence_<page>.<n>.jsonl       rotated segments, n = 1, 2, ... oldest first
+  - confluence_<page>[.<n>].idx.jsonl append-only index of each segment, one row
+                                      per log line: [offset, end, agent, version,
+                                      timestamp] ([offset, end] for non-entries)
+
+Features:
+  - Buffered appends: entries are written in batches under one flock, with a
+    configurable fsync policy; pending entries are flushed at exit
+  - A write appends its index rows; it never rewrites an index, so its cost
+    does not grow with the size of the log
+  - Rotation by size and by age of the active segment; rotated segments past
+    CONFLUENCE_AUDIT_MAX_SEGMENTS are deleted together with their index
+  - Queries by agent / version read the small segment indexes and seek
+    straight to the matching lines instead of scanning every segment
+  - Self-healing index: lines appended by other writers (or logs written
+    before the index existed) are indexed on the next access
+
+Settings (env):
+    CONFLUENCE_AUDIT_BUFFER        entries held before a write (default 1: write-through)
+    CONFLUENCE_AUDIT_FSYNC         always | never (default always)
+    CONFLUENCE_AUDIT_MAX_BYTES     rotate the active segment above this size (default 5 MB)
+    CONFLUENCE_AUDIT_MAX_DAYS      rotate the active segment older than this (default 30)
+    CONFLUENCE_AUDIT_MAX_SEGMENTS  rotated segments kept (default 12, 0 = keep all)
+
+Usage:
+    python3 -m fm_review.audit_log --agents --exclude Agent7_Publisher,unknown,system
+    python3 -m fm_review.audit_log --page-id 83951683 --agent Agent7_Publisher
+    python3 -m fm_review.audit_log --page-id 83951683 --version 42
+"""
+
+import argparse
+import atexit
+import fcntl
+import json
+import os
+import re
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+AUDIT_BUFFER_SIZE = max(1, int(os.environ.get("CONFLUENCE_AUDIT_BUFFER", "1")))
+AUDIT_FSYNC = os.environ.get("CONFLUENCE_AUDIT_FSYNC", "always")
+AUDIT_MAX_BYTES = int(os.environ.get("CONFLUENCE_AUDIT_MAX_BYTES", str(5 * 1024 * 1024)))
+AUDIT_MAX_DAYS = float(os.environ.get("CONFLUENCE_AUDIT_MAX_DAYS", "30"))
+AUDIT_MAX_SEGMENTS = int(os.environ.get("CONFLUENCE_AUDIT_MAX_SEGMENTS", "12"))
+
+_LOG_NAME = re.compile(r"^confluence_([^.]+)\.(?:\d+\.)?(?:idx\.)?jsonl$")
+
+
+def _index_path(segment: Path) -> Path:
+    """confluence_<page>[.<n>].jsonl -> confluence_<page>[.<n>].idx.jsonl"""
+    return segment.with_suffix(".idx.jsonl")
+
+
+def _row(offset: int, line: bytes) -> List[Any]:
+    end = offset + len(line)
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        entry = None
+    if not isinstance(entry, dict):
+        return [offset, end]
+    version = entry.get("version_number")
+    return [offset, end, str(entry.get("agent")),
+            version if isinstance(version, int) else None, entry.get("timestamp")]
+
+
+def _first_row(index: Path) -> Optional[List[Any]]:
+    try:
+        with open(index, "rb") as f:
+            return json.loads(f.readline())
+    except (OSError, ValueError):
+        return None
+
+
+def _last_row(index: Path) -> Tuple[bool, Optional[List[Any]]]:
+    """(ok, last row) of a segment index, reading only its tail.
+
+    ok is False if the index exists but its last row is unreadable.
+    """
+    try:
+        f = open(index, "rb")
+    except FileNotFoundError:
+        return True, None
+    with f:
+        pos = f.seek(0, os.SEEK_END)
+        if pos == 0:
+            return True, None
+        tail = b""
+        while pos > 0:
+            step = min(4096, pos)
+            pos -= step
+            f.seek(pos)
+            tail = f.read(step) + tail
+            if tail.count(b"\n") >= 2 or pos == 0:
+                break
+    if not tail.endswith(b"\n"):
+        return False, None
+    try:
+        return True, json.loads(tail[:-1].rsplit(b"\n", 1)[-1])
+    except ValueError:
+        return False, None
+
+
+class AuditLog:
+    """Audit log of one page: buffered writer plus indexed reader."""
+
+    def __init__(self, log_dir: Path, page_id: str, buffer_size: int = None,
+                 fsync: str = None, max_bytes: int = None, max_days: float = None,
+                 max_segments: int = None):
+        self.log_dir = Path(log_dir)
+        self.page_id = page_id
+        self.buffer_size = buffer_size or AUDIT_BUFFER_SIZE
+        self.fsync = fsync or AUDIT_FSYNC
+        self.max_bytes = max_bytes if max_bytes is not None else AUDIT_MAX_BYTES
+        self.max_days = max_days if max_days is not None else AUDIT_MAX_DAYS
+        self.max_segments = max_segments if max_segments is not None else AUDIT_MAX_SEGMENTS
+        self.active_file = self.log_dir / f"confluence_{page_id}.jsonl"
+        self.index_file = _index_path(self.active_file)
+        self._lock_file = self.log_dir / f".confluence_{page_id}.lock"
+        self._buffer: List[Dict[str, Any]] = []
+        self._mutex = threading.Lock()
+
+    # ── Writing ───────────────────────────────────────────────
+
+    def append(self, entry: Dict[str, Any]):
+        """Queue an entry; writes once the buffer is full. Raises OSError."""
+        with self._mutex:
+            self._buffer.append(entry)
+            if len(self._buffer) >= self.buffer_size:
+                self._flush_locked()
+
+    def flush(self):
+        """Write all buffered entries. Raises OSError."""
+        with self._mutex:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        pending, self._buffer = self._buffer, []
+        try:
+            with self._exclusive():
+                offset = self._catch_up(self.active_file)
+                if self._should_rotate(offset):
+                    self._rotate()
+                    offset = 0
+                rows = []
+                with open(self.active_file, "ab") as f:
+                    for entry in pending:
+                        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+                        f.write(line)
+                        rows.append(_row(offset, line))
+                        offset += len(line)
+                    f.flush()
+                    if self.fsync == "always":
+                        os.fsync(f.fileno())
+                self._append_rows(self.index_file, rows)
+        except OSError:
+            self._buffer[:0] = pending
+            raise
+
+    def _should_rotate(self, active_bytes: int) -> bool:
+        if active_bytes == 0:
+            return False
+        if active_bytes >= self.max_bytes:
+            return True
+        first = _first_row(self.index_file)
+        started = first[4] if isinstance(first, list) and len(first) > 4 else None
+        if not started:
+            return False
+        try:
+            age = datetime.now() - datetime.fromisoformat(started)
+        except (TypeError, ValueError):
+            return False
+        return age > timedelta(days=self.max_days)
+
+    def _rotated(self) -> List[Path]:
+        """Rotated segments, oldest first."""
+        prefix = f"confluence_{self.page_id}."
+        numbered = []
+        try:
+            names = os.listdir(self.log_dir)
+        except OSError:
+            return []
+        for name in names:
+            number = name[len(prefix):-len(".jsonl")]
+            if name.startswith(prefix) and name.endswith(".jsonl") and number.isdigit():
+                numbered.append((int(number), self.log_dir / name))
+        return [path for _, path in sorted(numbered)]
+
+    def _rotate(self):
+        rotated = self._rotated()
+        number = int(rotated[-1].name.split(".")[-2]) + 1 if rotated else 1
+        segment = self.log_dir / f"confluence_{self.page_id}.{number}.jsonl"
+        # Segment first: if the index rename is lost, both indexes are rebuilt
+        os.rename(self.active_file, segment)
+        try:
+            os.replace(self.index_file, _index_path(segment))
+        except FileNotFoundError:
+            pass
+        rotated.append(segment)
+        if self.max_segments > 0:
+            for old in rotated[:-self.max_segments]:
+                for path in (old, _index_path(old)):
+                    try:
+                        path.unlink()
+                    except FileNotFoundError:
+                        pass
+
+    # ── Index ─────────────────────────────────────────────────
+
+    @contextmanager
+    def _exclusive(self):
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self._lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    @staticmethod
+    def _append_rows(index: Path, rows: List[List[Any]]):
+        if rows:
+            with open(index, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows))
+
+    def _catch_up(self, segment: Path) -> int:
+        """Index lines of a segment past its indexed end. Returns the new end."""
+        index = _index_path(segment)
+        try:
+            size = segment.stat().st_size
+        except FileNotFoundError:
+            size = 0
+        ok, last = _last_row(index)
+        end = last[1] if ok and last else 0
+        if not ok or size < end:
+            # Index unreadable, or segment truncated/replaced: reindex from scratch
+            index.unlink()
+            end = 0
+        if size == end:
+            return end
+        rows = []
+        with open(segment, "rb") as f:
+            f.seek(end)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # partial line from a writer still in progress
+                rows.append(_row(end, line))
+                end += len(line)
+        self._append_rows(index, rows)
+        return end
+
+    def _load_rows(self) -> List[Tuple[Path, List[List[Any]]]]:
+        """(segment, index rows) for every segment, oldest first."""
+        self.flush()
+        if not self.log_dir.is_dir():
+            return []
+        segments = []
+        with self._exclusive():
+            for segment in self._rotated() + [self.active_file]:
+                self._catch_up(segment)
+                rows = []
+                try:
+                    with open(_index_path(segment), "rb") as f:
+                        rows = [json.loads(line) for line in f]
+                except FileNotFoundError:
+                    pass
+                segments.append((segment, rows))
+        return segments
+
+    # ── Reading ───────────────────────────────────────────────
+
+    @staticmethod
+    def _read_lines(segment: Path, offsets: List[int]) -> List[Dict[str, Any]]:
+        entries = []
+        if not offsets:
+            return entries
+        with open(segment, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                try:
+                    entries.append(json.loads(f.readline()))
+                except ValueError:
+                    continue
+        return entries
+
+    def query(self, agent: Optional[str] = None,
+              version: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Entries matching agent and/or version, oldest first."""
+        if agent is None and version is None:
+            return self.entries()
+        entries = []
+        for segment, rows in self._load_rows():
+            offsets = [row[0] for row in rows if len(row) > 2
+                       and (agent is None or row[2] == agent)
+                       and (version is None or row[3] == version)]
+            entries.extend(self._read_lines(segment, offsets))
+        return entries
+
+    def agents(self) -> Set[str]:
+        """Agents that have at least one entry in this log."""
+        return {row[2] for _, rows in self._load_rows() for row in rows if len(row) > 2}
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """All entries across segments, oldest first."""
+        entries = []
+        for segment, rows in self._load_rows():
+            entries.extend(self._read_lines(segment, [row[0] for row in rows if len(row) > 2]))
+        return entries
+
+
+_logs: Dict[Tuple[str, str], AuditLog] = {}
+_logs_lock = threading.Lock()
+
+
+def get_audit_log(log_dir: Path, page_id: str) -> AuditLog:
+    """Process-wide AuditLog for a page, so buffered entries are shared."""
+    key = (str(log_dir), page_id)
+    with _logs_lock:
+        if key not in _logs:
+            _logs[key] = AuditLog(log_dir, page_id)
+        return _logs[key]
+
+
+def flush_all():
+    """Flush buffered entries of every open log. Never raises."""
+    with _logs_lock:
+        logs = list(_logs.values())
+    for log in logs:
+        try:
+            log.flush()
+        except OSError:
+            pass
+
+
+atexit.register(flush_all)
+
+
+def list_pages(log_dir: Path) -> List[str]:
+    """Page ids that have an audit log in log_dir."""
+    pages = set()
+    try:
+        names = os.listdir(log_dir)
+    except OSError:
+        return []
+    for name in names:
+        match = _LOG_NAME.match(name)
+        if match:
+            pages.add(match.group(1))
+    return sorted(pages)
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Query the Confluence audit log")
+    parser.add_argument("--dir", type=Path, help="Audit log directory (default: src/.audit_log)")
+    parser.add_argument("--page-id", help="Limit to one page")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--agents", action="store_true", help="Print agents that wrote to Confluence")
+    mode.add_argument("--agent", help="Print entries written by this agent")
+    mode.add_argument("--version", type=int, help="Print entries for this version (needs --page-id)")
+    parser.add_argument("--exclude", default="", help="With --agents: comma-separated agents to skip")
+    args = parser.parse_args(argv)
+    if args.version is not None and not args.page_id:
+        parser.error("--version requires --page-id")
+    return args
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    log_dir = args.dir
+    if log_dir is None:
+        from fm_review.confluence_utils import AUDIT_LOG_DIR
+        log_dir = AUDIT_LOG_DIR
+    pages = [args.page_id] if args.page_id else list_pages(log_dir)
+
+    try:
+        if args.agents:
+            excluded = {a for a in args.exclude.split(",") if a}
+            agents = set()
+            for page in pages:
+                agents |= AuditLog(log_dir, page).agents()
+            for agent in sorted(agents - excluded):
+                print(agent)
+            return 0
+
+        for page in pages:
+            for entry in AuditLog(log_dir, page).query(agent=args.agent, version=args.version):
+                print(json.dumps(entry, ensure_ascii=False))
+        return 0
+    except OSError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
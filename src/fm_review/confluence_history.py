@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Offline page history and point-in-time restore for Confluence pages.
+
+Joins two local sources written by confluence_utils:
+  - audit log  (.audit_log/confluence_<page>*.jsonl, see audit_log): who wrote which version
+    when, with the backup-store hash of the body that was written
+  - backup store index (.backups/<page>/index.jsonl): page states captured
+    before every update
+and answers from local data only: which versions are known, what the page
+was at version N or at time T, how two versions differ. Any known version is
+restored with a single PUT (ConfluenceClient.restore).
+
+Usage:
+    python3 -m fm_review.confluence_history --page-id 83951683 --list
+    python3 -m fm_review.confluence_history --page-id 83951683 --version 42
+    python3 -m fm_review.confluence_history --page-id 83951683 --at 2026-02-19T10:00
+    python3 -m fm_review.confluence_history --page-id 83951683 --diff 41 42
+    python3 -m fm_review.confluence_history --page-id 83951683 --version 41 --restore [--dry-run]
+"""
+
+import argparse
+import difflib
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from fm_review import confluence_utils
+from fm_review.audit_log import get_audit_log
+from fm_review.confluence_utils import (
+    ConfluenceAPIError,
+    ConfluenceBackup,
+    ConfluenceLockError,
+    create_client_from_env,
+    section_diff,
+)
+
+
+def _local(when: datetime) -> datetime:
+    """Naive local time, the form backups and audit entries are stamped in."""
+    return when.astimezone().replace(tzinfo=None) if when.tzinfo else when
+
+
+def _parse_time(value: str) -> Optional[datetime]:
+    try:
+        return _local(datetime.fromisoformat(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class PageHistory:
+    """Known versions of one page, merged from the audit log and backup index."""
+
+    def __init__(self, page_id: str):
+        self.page_id = page_id
+        self.backup = ConfluenceBackup(page_id)
+        self._versions = self._build()
+
+    def _audit_entries(self) -> List[Dict[str, Any]]:
+        try:
+            return get_audit_log(confluence_utils.AUDIT_LOG_DIR, self.page_id).entries()
+        except OSError:
+            return []
+
+    def _build(self) -> Dict[int, Dict[str, Any]]:
+        versions: Dict[int, Dict[str, Any]] = {}
+
+        def record(number: int, seen_at: str) -> Dict[str, Any]:
+            rec = versions.setdefault(number, {
+                "version": number, "live_since": seen_at, "blob": None, "title": None,
+                "message": None, "agent": None, "action": None, "backup_id": None,
+            })
+            rec["live_since"] = min(rec["live_since"], seen_at)
+            return rec
+
+        # Backup entries: version N was live when the backup was taken
+        for entry in reversed(self.backup.entries()):
+            rec = record(entry["version"], entry["saved_at"])
+            rec["blob"] = entry["blob"]
+            rec["backup_id"] = entry["id"]
+            rec["title"] = entry["meta"].get("title")
+            rec["message"] = rec["message"] or entry["meta"].get("version", {}).get("message")
+
+        # Audit entries: version N was written by us at timestamp
+        for entry in self._audit_entries():
+            number = entry.get("version_number")
+            if not isinstance(number, int) or number <= 0:
+                continue
+            rec = record(number, entry.get("timestamp", ""))
+            rec["blob"] = rec["blob"] or entry.get("body_blob")
+            rec["message"] = entry.get("version_message", rec["message"])
+            rec["agent"] = entry.get("agent")
+            rec["action"] = entry.get("action")
+
+        return versions
+
+    def versions(self) -> List[Dict[str, Any]]:
+        """Known versions, oldest first."""
+        return [self._versions[n] for n in sorted(self._versions)]
+
+    def version_at(self, when: datetime) -> Optional[int]:
+        """Version that was live at `when` (latest version seen live by then)."""
+        when = _local(when)
+        live = [n for n, rec in self._versions.items()
+                if (since := _parse_time(rec["live_since"])) is not None and since <= when]
+        return max(live) if live else None
+
+    def page_at_version(self, number: int) -> Optional[Dict[str, Any]]:
+        """Page data (version, body.storage, title if known) for version N, or None if unknown."""
+        rec = self._versions.get(number)
+        if rec is None or rec["blob"] is None:
+            return None
+        body = self.backup.read_blob(rec["blob"])
+        if body is None:
+            return None
+        page = {
+            "id": self.page_id,
+            "version": {"number": number, "message": rec["message"]},
+            "body": {"storage": {"value": body, "representation": "storage"}},
+        }
+        if rec["title"]:
+            # Audit-only versions have no title; restore keeps the current one
+            page["title"] = rec["title"]
+        return page
+
+    def resolve(self, version: Optional[int] = None, backup_id: Optional[str] = None,
+                at: Optional[datetime] = None) -> Dict[str, Any]:
+        """Page data for a target; defaults to the latest backup."""
+        if at is not None:
+            version = self.version_at(at)
+            if version is None:
+                raise ConfluenceAPIError(f"No known version of page {self.page_id} at {at.isoformat()}")
+        if version is not None:
+            page = self.page_at_version(version)
+            if page is None:
+                raise ConfluenceAPIError(f"Body of version {version} is not available locally")
+            return page
+        if backup_id is not None:
+            return self.backup.load(backup_id)
+        latest = self.backup.get_latest()
+        if latest is None:
+            raise ConfluenceAPIError(f"No backups for page {self.page_id}")
+        return latest
+
+    def diff(self, old: int, new: int) -> Dict[str, Any]:
+        """Section summary and unified diff between two versions."""
+        old_page, new_page = self.resolve(version=old), self.resolve(version=new)
+        old_body = old_page["body"]["storage"]["value"]
+        new_body = new_page["body"]["storage"]["value"]
+        unified = difflib.unified_diff(
+            old_body.splitlines(), new_body.splitlines(),
+            fromfile=f"v{old}", tofile=f"v{new}", lineterm="",
+        )
+        return {"sections": section_diff(old_body, new_body), "unified": "\n".join(unified)}
+
+    def restore(self, page: Dict[str, Any], client=None, agent_name: str = "system") -> Dict:
+        """Restore page data with one PUT under the page lock."""
+        client = client or create_client_from_env(self.page_id)
+        with client.lock():
+            return client.restore(
+                page, f"RESTORE to version {page.get('version', {}).get('number', '?')}",
+                agent_name=agent_name, action="restore",
+            )
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline Confluence page history and restore")
+    parser.add_argument("--page-id", required=True, help="Confluence page ID")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--version", type=int, help="Target version number")
+    target.add_argument("--backup", help="Target backup id (v<N>_<timestamp>) or legacy .json path")
+    target.add_argument("--at", type=datetime.fromisoformat, help="Target point in time (ISO 8601)")
+    action = parser.add_mutually_exclusive_group()
+    action.add_argument("--list", action="store_true", help="List known versions")
+    action.add_argument("--diff", nargs=2, type=int, metavar=("OLD", "NEW"), help="Diff two versions")
+    action.add_argument("--restore", action="store_true", help="Restore target with one PUT")
+    parser.add_argument("--dry-run", action="store_true", help="With --restore: show what would be restored")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    history = PageHistory(args.page_id)
+
+    if args.list:
+        for rec in history.versions():
+            body = "body" if rec["blob"] and history.backup.read_blob(rec["blob"]) is not None else "no body"
+            who = f"{rec['action']} by {rec['agent']}" if rec["agent"] else "backup"
+            print(f"  v{rec['version']:<5} {rec['live_since'][:19]}  {who:<32} {body:<8} {rec['message'] or ''}")
+        print(f"\n  Total: {len(history.versions())} version(s)")
+        return 0
+
+    try:
+        if args.diff:
+            result = history.diff(*args.diff)
+            for kind, titles in result["sections"].items():
+                if titles:
+                    print(f"Sections {kind}: {', '.join(titles)}")
+            print(result["unified"])
+            return 0
+
+        backup_id = args.backup
+        if backup_id and Path(backup_id).suffix == ".json":
+            page = history.backup.load(Path(backup_id))
+        else:
+            page = history.resolve(version=args.version, backup_id=backup_id, at=args.at)
+        body = page.get("body", {}).get("storage", {}).get("value", "")
+        print(f"  Page ID:  {args.page_id}")
+        print(f"  Version:  {page.get('version', {}).get('number', '?')}")
+        print(f"  Title:    {page.get('title') or 'unknown'}")
+        print(f"  Body:     {len(body)} characters")
+
+        if not args.restore:
+            return 0
+        if args.dry_run:
+            print("  DRY RUN — no changes made")
+            return 0
+        result = history.restore(page)
+        print(f"  Restored. New version: {result.get('version', {}).get('number', '?')}")
+        return 0
+    except (ConfluenceAPIError, ConfluenceLockError, ValueError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
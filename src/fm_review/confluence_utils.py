@@ -1,11 +1,14 @@
 #!/usr/bin/env python3
 """
 Confluence Utilities Library v1.1 (FC-12B: audit log)
-- File-based locking (R-01)
+- File-based locking (R-01), FIFO queue without polling, shared/exclusive modes
 - Rollback mechanism (R-02)
 - Retry policy with exponential backoff (R-06)
 - Version management (R-05)
-- Audit log for write operations (FC-12B)
+- Audit log for write operations (FC-12B), buffered/rotated/indexed (audit_log)
+- Batch publish of several pages with all-or-nothing rollback
+- Diff-aware publish: skip PUT when the body is unchanged
+- Adaptive rate limit (AIMD on 429/503, Retry-After), shared across processes
 
 Usage:
     from fm_review.confluence_utils import ConfluenceClient
@@ -14,22 +17,33 @@ Usage:
     with client.lock():
         page = client.get_page()
         client.update_page(new_body, "Description of changes")
+
+    with client.lock(shared=True):  # read-only, concurrent with other readers
+        page = client.get_page()
 """
 
 import fcntl
+import gzip
+import hashlib
 import json
 import os
+import re
 import ssl
 import threading
 import time
 import urllib.error
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
 from datetime import datetime
+from email.utils import parsedate_to_datetime
 from pathlib import Path
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 
+from fm_review.audit_log import get_audit_log
+
 
 def _make_ssl_context():
     """Create a per-request SSL context for Confluence API.
@@ -58,12 +72,9 @@ def _get_page_id(project_name=None):
     Raises ValueError if not found.
     """
     if project_name:
-        path = _PROJECT_ROOT / "projects" / project_name / "CONFLUENCE_PAGE_ID"
-        if path.is_file():
-            for line in path.read_text(encoding="utf-8").splitlines():
-                line = line.strip()
-                if line and not line.startswith("#") and line.isdigit():
-                    return line
+        page_id = _read_page_id_file(_PROJECT_ROOT / "projects" / project_name / "CONFLUENCE_PAGE_ID")
+        if page_id:
+            return page_id
     pid = os.environ.get("CONFLUENCE_PAGE_ID")
     if pid:
         return pid
@@ -73,10 +84,34 @@ def _get_page_id(project_name=None):
     )
 
 
+def _read_page_id_file(path: Path) -> Optional[str]:
+    """First numeric line of a CONFLUENCE_PAGE_ID* file (comments skipped), or None."""
+    if not path.is_file():
+        return None
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if line and not line.startswith("#") and line.isdigit():
+            return line
+    return None
+
+
+def _get_project_page_ids(project_name: str) -> Dict[str, str]:
+    """All page ids of a project: {file name: page id} for projects/PROJECT/CONFLUENCE_PAGE_ID*.
+
+    E.g. {"CONFLUENCE_PAGE_ID": FM page, "CONFLUENCE_PAGE_ID_ARC": ..., "CONFLUENCE_PAGE_ID_TS": ...}
+    """
+    project_dir = _PROJECT_ROOT / "projects" / project_name
+    page_ids = {}
+    for path in sorted(project_dir.glob("CONFLUENCE_PAGE_ID*")):
+        page_id = _read_page_id_file(path)
+        if page_id:
+            page_ids[path.name] = page_id
+    return page_ids
+
+
 # Lock settings
 LOCK_DIR = Path(__file__).parent.parent / ".locks"
 LOCK_TIMEOUT = 60  # seconds
-LOCK_RETRY_INTERVAL = 2  # seconds
 
 # Retry settings
 MAX_RETRIES = 3
@@ -85,43 +120,127 @@ RETRYABLE_CODES = {500, 502, 503, 504, 408, 429}
 
 # Backup settings
 BACKUP_DIR = Path(__file__).parent.parent / ".backups"
-MAX_BACKUPS = 10
+MAX_BACKUPS = int(os.environ.get("CONFLUENCE_MAX_BACKUPS", "100"))
+BACKUP_INDEX = "index.jsonl"
+BLOB_GRACE_SECONDS = 3600  # fresh blobs may not be referenced yet (audit entry in flight)
 
 # Audit log settings (FC-12B)
 AUDIT_LOG_DIR = Path(__file__).parent.parent / ".audit_log"
 
+# Last published body hash per page (diff-aware publish)
+PUBLISH_STATE_DIR = Path(__file__).parent.parent / ".publish_state"
+
 # Rate limiter settings
 RATE_LIMIT_RPS = float(os.environ.get("CONFLUENCE_RATE_LIMIT_RPS", "5"))
+RATE_LIMIT_MIN_RPS = 0.5
+RATE_LIMIT_DECREASE_FACTOR = 0.5  # multiplicative decrease on 429/503
+RATE_LIMIT_INCREASE_RPS = 0.25  # additive increase per successful request
+THROTTLE_CODES = {429, 503}
+# Share one budget between all processes via LOCK_DIR/RATE_STATE_FILE
+RATE_LIMIT_SHARED = os.environ.get("CONFLUENCE_RATE_LIMIT_SHARED", "1") != "0"
+RATE_STATE_FILE = "confluence_rate.json"
+
+# Batch publish settings (PUTs still go through the shared rate limiter)
+BATCH_MAX_WORKERS = int(os.environ.get("CONFLUENCE_BATCH_WORKERS", "4"))
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse Retry-After header (delta-seconds or HTTP-date) into seconds."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
 
 
 class _RateLimiter:
-    """Token bucket rate limiter for Confluence API.
+    """Adaptive token bucket rate limiter for Confluence API (AIMD).
 
-    Limits outgoing requests to CONFLUENCE_RATE_LIMIT_RPS (default 5).
+    Starts at CONFLUENCE_RATE_LIMIT_RPS (default 5). A 429/503 halves the rate
+    and honors Retry-After; every success adds RATE_LIMIT_INCREASE_RPS back up
+    to the configured maximum. With shared=True the bucket state lives in a
+    flock-protected file under LOCK_DIR, so parallel agents split one budget
+    instead of each assuming the full RPS.
     Thread-safe. Blocks caller until a token is available.
     """
 
-    def __init__(self, rps: float = RATE_LIMIT_RPS):
+    def __init__(self, rps: float = RATE_LIMIT_RPS, shared: bool = False):
         self._capacity = rps
-        self._tokens = rps
-        self._last = time.monotonic()
+        self._shared = shared
         self._lock = threading.Lock()
+        self._state = self._initial_state()
+
+    def _initial_state(self) -> Dict[str, float]:
+        return {"tokens": self._capacity, "last": time.time(),
+                "rate": self._capacity, "blocked_until": 0.0}
+
+    @contextmanager
+    def _bucket(self):
+        """Yield mutable bucket state; persisted to the shared file if enabled."""
+        with self._lock:
+            if not self._shared:
+                yield self._state
+                return
+            LOCK_DIR.mkdir(parents=True, exist_ok=True)
+            with open(LOCK_DIR / RATE_STATE_FILE, "a+", encoding="utf-8") as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                f.seek(0)
+                try:
+                    state = json.loads(f.read())
+                    if set(state) != set(self._state):
+                        raise ValueError("stale rate state")
+                except ValueError:
+                    state = self._initial_state()
+                yield state
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+
+    @property
+    def rate(self) -> float:
+        """Current allowed requests per second."""
+        with self._bucket() as state:
+            return state["rate"]
 
     def acquire(self):
         """Block until a token is available, then consume it."""
         while True:
-            with self._lock:
-                now = time.monotonic()
-                elapsed = now - self._last
-                self._tokens = min(self._capacity, self._tokens + elapsed * self._capacity)
-                self._last = now
-                if self._tokens >= 1.0:
-                    self._tokens -= 1.0
-                    return
-            time.sleep(1.0 / self._capacity)
-
-
-_rate_limiter = _RateLimiter()
+            with self._bucket() as state:
+                now = time.time()
+                wait = state["blocked_until"] - now
+                if wait <= 0:
+                    rate = state["rate"]
+                    capacity = max(1.0, rate)
+                    state["tokens"] = min(capacity, state["tokens"] + (now - state["last"]) * rate)
+                    state["last"] = now
+                    if state["tokens"] >= 1.0:
+                        state["tokens"] -= 1.0
+                        return
+                    wait = (1.0 - state["tokens"]) / rate
+            time.sleep(wait)
+
+    def on_success(self):
+        """Additive increase after a successful request."""
+        with self._bucket() as state:
+            if state["rate"] < self._capacity:
+                state["rate"] = min(self._capacity, state["rate"] + RATE_LIMIT_INCREASE_RPS)
+
+    def on_throttle(self, retry_after: Optional[float] = None):
+        """Multiplicative decrease on 429/503; pause all callers for Retry-After."""
+        with self._bucket() as state:
+            state["rate"] = max(RATE_LIMIT_MIN_RPS, state["rate"] * RATE_LIMIT_DECREASE_FACTOR)
+            state["tokens"] = min(state["tokens"], 0.0)
+            if retry_after:
+                state["blocked_until"] = max(state["blocked_until"], time.time() + retry_after)
+
+
+_rate_limiter = _RateLimiter(shared=RATE_LIMIT_SHARED)
 
 # TTL cache settings
 CACHE_TTL_SECONDS = int(os.environ.get("CONFLUENCE_CACHE_TTL", "60"))
@@ -181,74 +300,232 @@ class ConfluenceAPIError(Exception):
         self.response = response
 
 
+def _pid_alive(pid: int) -> bool:
+    """True if a process with this pid exists (signal 0 probe)."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _flock_with_timeout(fd: int, operation: int, timeout: float) -> bool:
+    """Blocking flock with a timeout. Returns True if the lock was taken.
+
+    The blocking call runs in a helper thread on a dup() of fd (same open
+    file description, so the lock is shared with fd). If the caller gives up,
+    the helper releases the lock as soon as it is granted.
+    """
+    try:
+        fcntl.flock(fd, operation | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        pass
+    if timeout <= 0:
+        return False
+
+    helper_fd = os.dup(fd)
+    granted = threading.Event()
+    guard = threading.Lock()
+    state = {"abandoned": False}
+
+    def _wait():
+        try:
+            fcntl.flock(helper_fd, operation)
+            with guard:
+                if state["abandoned"]:
+                    fcntl.flock(helper_fd, fcntl.LOCK_UN)
+                else:
+                    granted.set()
+        except OSError:
+            pass
+        finally:
+            os.close(helper_fd)
+
+    threading.Thread(target=_wait, name="confluence-lock-wait", daemon=True).start()
+    granted.wait(timeout)
+    with guard:
+        if granted.is_set():
+            return True
+        state["abandoned"] = True
+        return False
+
+
+_lock_metrics: Dict[str, Dict[str, float]] = {}
+_lock_metrics_guard = threading.Lock()
+
+
+def get_lock_metrics() -> Dict[str, Dict[str, float]]:
+    """Per-page lock wait statistics for this process.
+
+    {page_id: {"acquired", "timeouts", "total_wait_seconds", "max_wait_seconds"}}
+    """
+    with _lock_metrics_guard:
+        return {page_id: dict(m) for page_id, m in _lock_metrics.items()}
+
+
+def _record_lock_wait(page_id: str, waited: float, acquired: bool):
+    with _lock_metrics_guard:
+        m = _lock_metrics.setdefault(page_id, {
+            "acquired": 0, "timeouts": 0, "total_wait_seconds": 0.0, "max_wait_seconds": 0.0
+        })
+        m["acquired" if acquired else "timeouts"] += 1
+        m["total_wait_seconds"] += waited
+        m["max_wait_seconds"] = max(m["max_wait_seconds"], waited)
+
+
 class ConfluenceLock:
     """
     File-based lock for Confluence page operations.
     Prevents race conditions when multiple agents access same page.
+
+    Waiters queue FIFO: each waiter publishes a ticket file (flock'ed by its
+    owner) in confluence_<page>.queue/ and blocks on its predecessor's ticket,
+    so it wakes as soon as the predecessor releases — no polling. A ticket
+    whose flock is free belongs to a dead process and is removed. The lock
+    file itself is persistent (never unlinked) and records the holder pid.
+
+    shared=True is a read lock: readers wait only for writers queued ahead
+    of them and run concurrently with each other. Writers (update_page,
+    rollback) wait for everyone ahead, so a queued writer is not starved.
     """
 
-    def __init__(self, page_id: str, timeout: int = LOCK_TIMEOUT):
+    def __init__(self, page_id: str, timeout: int = LOCK_TIMEOUT, shared: bool = False):
         self.page_id = page_id
         self.timeout = timeout
+        self.shared = shared
         self.lock_file = LOCK_DIR / f"confluence_{page_id}.lock"
+        self.queue_dir = LOCK_DIR / f"confluence_{page_id}.queue"
         self.lock_fd = None
+        self.wait_seconds = 0.0
+        self._ticket: Optional[Path] = None
+        self._ticket_fd = None
 
         # Ensure lock directory exists
         LOCK_DIR.mkdir(parents=True, exist_ok=True)
 
-    def acquire(self) -> bool:
-        """Acquire lock with timeout. Returns True if acquired."""
-        start_time = time.time()
-
-        while time.time() - start_time < self.timeout:
+    def holder(self) -> Optional[Dict[str, Any]]:
+        """Info recorded by the current/last holder, with `stale` flag."""
+        try:
+            info = json.loads(self.lock_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        info["stale"] = not _pid_alive(int(info.get("pid", 0)))
+        return info
+
+    def _enqueue(self):
+        """Create our ticket; it is flock'ed before it becomes visible."""
+        self.queue_dir.mkdir(parents=True, exist_ok=True)
+        mode = "r" if self.shared else "w"
+        name = f"{time.time_ns():020d}_{os.getpid()}_{threading.get_ident()}_{mode}"
+        tmp = self.queue_dir / f".{name}"
+        self._ticket_fd = open(tmp, "w")
+        fcntl.flock(self._ticket_fd.fileno(), fcntl.LOCK_EX)
+        self._ticket = self.queue_dir / name
+        os.rename(tmp, self._ticket)
+
+    def _dequeue(self):
+        if self._ticket is not None:
             try:
-                # Open or create lock file
-                self.lock_fd = open(self.lock_file, 'w')
-
-                # Try to acquire exclusive lock (non-blocking)
-                fcntl.flock(self.lock_fd.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
-
-                # Write lock info
-                lock_info = {
-                    "page_id": self.page_id,
-                    "acquired_at": datetime.now().isoformat(),
-                    "pid": os.getpid()
-                }
-                self.lock_fd.write(json.dumps(lock_info))
-                self.lock_fd.flush()
+                self._ticket.unlink()
+            except OSError:
+                pass
+            self._ticket = None
+        if self._ticket_fd is not None:
+            self._ticket_fd.close()  # releases flock, wakes the successor
+            self._ticket_fd = None
 
+    def _wait_for_turn(self, deadline: float) -> bool:
+        """Block until no conflicting ticket is ahead of ours."""
+        while True:
+            ahead = sorted(
+                t for t in os.listdir(self.queue_dir)
+                if not t.startswith(".") and t < self._ticket.name
+                and not (self.shared and t.endswith("_r"))
+            )
+            if not ahead:
                 return True
+            predecessor = self.queue_dir / ahead[-1]
+            try:
+                pred_fd = open(predecessor, "r")
+            except FileNotFoundError:
+                continue
+            try:
+                if not _flock_with_timeout(pred_fd.fileno(), fcntl.LOCK_SH,
+                                           deadline - time.monotonic()):
+                    return False
+                # Live owners unlink their ticket before unlocking it, so a
+                # ticket we could lock that still exists is stale.
+                if predecessor.exists():
+                    print(f"  Removing stale lock ticket: {predecessor.name}")
+                    predecessor.unlink(missing_ok=True)
+            finally:
+                pred_fd.close()
 
-            except (IOError, OSError):
-                # Lock held by another process
+    def acquire(self) -> bool:
+        """Acquire lock with timeout. Returns True if acquired."""
+        start_time = time.monotonic()
+        deadline = start_time + self.timeout
+
+        self._enqueue()
+        acquired = False
+        try:
+            if self._wait_for_turn(deadline):
+                self.lock_fd = open(self.lock_file, 'a+')
+                operation = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+                acquired = _flock_with_timeout(self.lock_fd.fileno(), operation,
+                                               deadline - time.monotonic())
+        finally:
+            if not acquired:
                 if self.lock_fd:
                     self.lock_fd.close()
                     self.lock_fd = None
-                time.sleep(LOCK_RETRY_INTERVAL)
-
-        return False
+                self._dequeue()
+
+        self.wait_seconds = time.monotonic() - start_time
+        _record_lock_wait(self.page_id, self.wait_seconds, acquired)
+        if not acquired or self.shared:
+            return acquired
+
+        # Write lock info (writers only — concurrent readers would clobber it)
+        lock_info = {
+            "page_id": self.page_id,
+            "acquired_at": datetime.now().isoformat(),
+            "pid": os.getpid(),
+            "wait_seconds": round(self.wait_seconds, 3),
+        }
+        self.lock_fd.seek(0)
+        self.lock_fd.truncate()
+        self.lock_fd.write(json.dumps(lock_info))
+        self.lock_fd.flush()
+        return True
 
     def release(self):
-        """Release the lock."""
+        """Release the lock and hand it to the next ticket in the queue."""
         if self.lock_fd:
             try:
+                if not self.shared:
+                    self.lock_fd.truncate(0)
                 fcntl.flock(self.lock_fd.fileno(), fcntl.LOCK_UN)
                 self.lock_fd.close()
             except OSError:
                 pass
             finally:
                 self.lock_fd = None
-                # Clean up lock file
-                try:
-                    self.lock_file.unlink()
-                except Exception:
-                    pass
+                self._dequeue()
 
     def __enter__(self):
         if not self.acquire():
+            holder = self.holder() or {}
+            detail = ""
+            if holder.get("pid"):
+                state = "stale, process not running" if holder["stale"] else "running"
+                detail = f" Holder pid {holder['pid']} ({state}) since {holder.get('acquired_at', '?')}."
             raise ConfluenceLockError(
                 f"Could not acquire lock for page {self.page_id} within {self.timeout}s. "
-                f"Another agent may be updating this page."
+                f"Another agent may be updating this page.{detail}"
             )
         return self
 
@@ -265,50 +542,252 @@ class ConfluenceBackup:
     - Admin can purge history; local copy is under our control
     - MCP server does raw PUT with no rollback; this catches partial writes
     - Enables offline diff/audit even when Confluence is unreachable
-    Max 10 backups per page (auto-rotated).
+
+    Content-addressed store per page:
+        <page_id>/blobs/<sha256>.gz — gzip'ed page body, stored once per distinct body
+        <page_id>/index.jsonl      — one line per backup (metadata + blob hash), oldest first
+    Backups are addressed by entry id (v<N>_<timestamp>); there is no file per backup.
+    Keeps CONFLUENCE_MAX_BACKUPS (default 100) entries; blobs referenced by neither a
+    kept entry nor the page's audit log are removed.
     """
 
     def __init__(self, page_id: str):
         self.page_id = page_id
         self.backup_dir = BACKUP_DIR / page_id
-        self.backup_dir.mkdir(parents=True, exist_ok=True)
+        self.blob_dir = self.backup_dir / "blobs"
+        self.index_file = self.backup_dir / BACKUP_INDEX
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        if not self.index_file.exists():
+            self._migrate_legacy()
 
-    def save(self, page_data: Dict[str, Any]) -> Path:
-        """Save page state to backup file. Returns backup path."""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        version = page_data.get("version", {}).get("number", 0)
+    def _read_index(self) -> list:
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except OSError:
+            return []
 
-        backup_file = self.backup_dir / f"v{version}_{timestamp}.json"
+    def store_blob(self, body: str) -> str:
+        """Store a body without an index entry (published versions). Returns its hash.
+
+        Such blobs live as long as an index entry or an audit log entry
+        (body_blob) references the same body.
+        """
+        return self._write_blob(body)
 
-        with open(backup_file, 'w', encoding='utf-8') as f:
-            json.dump(page_data, f, ensure_ascii=False, indent=2)
+    def read_blob(self, digest: str) -> Optional[str]:
+        """Body by hash, or None if it was rotated out."""
+        try:
+            return self._read_blob(digest)
+        except OSError:
+            return None
+
+    def _write_blob(self, body: str) -> str:
+        digest = hashlib.sha256(body.encode('utf-8')).hexdigest()
+        blob = self.blob_dir / f"{digest}.gz"
+        if not blob.exists():
+            tmp = blob.with_suffix(".tmp")
+            with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+                f.write(body)
+            os.replace(tmp, blob)
+        return digest
+
+    def _read_blob(self, digest: str) -> str:
+        with gzip.open(self.blob_dir / f"{digest}.gz", 'rt', encoding='utf-8') as f:
+            return f.read()
+
+    def save(self, page_data: Dict[str, Any], saved_at: Optional[datetime] = None,
+             entry_id: Optional[str] = None) -> str:
+        """Save page state to the store. Returns the backup entry id.
+
+        saved_at / entry_id default to now / v<N>_<now>; legacy migration passes
+        the original ones.
+        """
+        saved_at = saved_at or datetime.now()
+        version = page_data.get("version", {}).get("number", 0)
+        entry_id = entry_id or f"v{version}_{saved_at.strftime('%Y%m%d_%H%M%S_%f')}"
+
+        meta = dict(page_data)
+        body = meta.pop("body", {}).get("storage", {}).get("value", "")
+        entry = {
+            "id": entry_id,
+            "version": version,
+            "saved_at": saved_at.isoformat(),
+            "blob": self._write_blob(body),
+            "meta": meta,
+        }
+        with open(self.index_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
 
         # Cleanup old backups
         self._cleanup_old_backups()
 
-        return backup_file
+        return entry_id
+
+    def entries(self) -> list:
+        """Index entries, newest first (no directory scan)."""
+        return list(reversed(self._read_index()))
+
+    def load(self, backup_id: Union[str, Path]) -> Dict[str, Any]:
+        """Load a backup by entry id. Legacy *.json backup files are read directly."""
+        backup_path = Path(backup_id)
+        if backup_path.suffix == ".json" and backup_path.is_file():
+            with open(backup_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        for entry in self._read_index():
+            if entry["id"] == backup_path.name:
+                return self._entry_to_page(entry)
+        raise ConfluenceAPIError(f"Backup not found: {backup_id}")
+
+    def _entry_to_page(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        page = dict(entry["meta"])
+        page["body"] = {"storage": {"value": self._read_blob(entry["blob"]),
+                                    "representation": "storage"}}
+        return page
 
     def get_latest(self) -> Optional[Dict[str, Any]]:
         """Get latest backup data."""
-        backups = sorted(self.backup_dir.glob("*.json"), reverse=True)
-        if backups:
-            with open(backups[0], 'r', encoding='utf-8') as f:
-                return json.load(f)
+        index = self._read_index()
+        if index:
+            return self._entry_to_page(index[-1])
         return None
 
     def list_backups(self) -> list:
-        """List all available backups."""
-        return sorted(self.backup_dir.glob("*.json"), reverse=True)
+        """List all available backups (entry ids), newest first."""
+        return [entry["id"] for entry in self.entries()]
 
     def _cleanup_old_backups(self):
-        """Keep only MAX_BACKUPS most recent backups."""
-        backups = sorted(self.backup_dir.glob("*.json"), reverse=True)
-        for old_backup in backups[MAX_BACKUPS:]:
+        """Keep only MAX_BACKUPS most recent entries; drop unreferenced blobs.
+
+        Blobs of published versions (store_blob) have no index entry; they stay
+        while the page's retained audit entries point at them.
+        """
+        index = self._read_index()
+        if len(index) <= MAX_BACKUPS:
+            return
+        keep = index[-MAX_BACKUPS:]
+        tmp = self.index_file.with_suffix(".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for entry in keep:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.index_file)
+        referenced = {entry["blob"] for entry in keep}
+        try:
+            audit = get_audit_log(AUDIT_LOG_DIR, self.page_id)
+            audit.flush()
+            referenced.update(entry.get("body_blob") for entry in audit.entries())
+        except OSError:
+            return  # unknown references: deleting could lose published versions
+        rotated_out = {entry["blob"] for entry in index[:-MAX_BACKUPS]}
+        cutoff = time.time() - BLOB_GRACE_SECONDS
+        for blob in self.blob_dir.glob("*.gz"):
+            digest = blob.name[:-3]
             try:
-                old_backup.unlink()
+                if digest not in referenced and (digest in rotated_out or blob.stat().st_mtime < cutoff):
+                    blob.unlink()
             except OSError:
                 pass
 
+    def _migrate_legacy(self):
+        """Import pre-index v<N>_<timestamp>.json backups, oldest first.
+
+        Entries keep the legacy file name as id and its timestamp (file mtime
+        if the name has none) as saved_at.
+        """
+        legacy = []
+        for path in self.backup_dir.glob("*.json"):
+            try:
+                saved_at = datetime.strptime(path.stem.split("_", 1)[1], "%Y%m%d_%H%M%S")
+            except (IndexError, ValueError):
+                try:
+                    saved_at = datetime.fromtimestamp(path.stat().st_mtime)
+                except OSError:
+                    continue
+            legacy.append((saved_at, path))
+        for saved_at, path in sorted(legacy):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.save(json.load(f), saved_at=saved_at, entry_id=path.stem)
+                path.unlink()
+            except (OSError, ValueError):
+                pass
+
+
+# Tags whose surrounding whitespace is not rendered. Whitespace between inline
+# elements (`<strong>a</strong> <em>b</em>`) is content and is kept.
+_BLOCK_TAGS = frozenset({
+    "p", "div", "br", "hr", "h1", "h2", "h3", "h4", "h5", "h6", "ul", "ol", "li",
+    "table", "thead", "tbody", "tfoot", "tr", "th", "td", "colgroup", "col",
+    "blockquote", "pre", "section", "dl", "dt", "dd",
+    "ac:structured-macro", "ac:parameter", "ac:rich-text-body", "ac:plain-text-body",
+    "ac:layout", "ac:layout-section", "ac:layout-cell", "ac:image", "ac:task-list",
+    "ac:task", "ri:attachment", "ri:page", "ri:url",
+})
+_CDATA = re.compile(r"(<!\[CDATA\[.*?\]\]>)", re.DOTALL)
+_GAP_BETWEEN_TAGS = re.compile(r"<(/?)([\w:.-]+)[^<>]*>(\s+)(?=<(/?)([\w:.-]+))")
+
+
+def _collapse_block_gap(m: "re.Match") -> str:
+    tag = m.group(0)[:-len(m.group(3))]
+    if m.group(2).lower() in _BLOCK_TAGS or m.group(5).lower() in _BLOCK_TAGS:
+        return tag
+    return m.group(0)
+
+
+def normalize_body(body: str) -> str:
+    """Normalize storage XHTML for comparison.
+
+    Ignores differences Confluence introduces on save: line endings,
+    whitespace next to block-level tags, `<br />` vs `<br/>`, leading/trailing
+    blanks. CDATA (code macro bodies) is compared verbatim.
+    """
+    parts = _CDATA.split(body.replace("\r\n", "\n").strip())
+    for i in range(0, len(parts), 2):
+        part = _GAP_BETWEEN_TAGS.sub(_collapse_block_gap, parts[i])
+        parts[i] = re.sub(r"\s+/>", "/>", part)
+    return "".join(parts)
+
+
+def body_hash(body: str) -> str:
+    """SHA-256 of the normalized body."""
+    return hashlib.sha256(normalize_body(body).encode("utf-8")).hexdigest()
+
+
+_SECTION_SPLIT = re.compile(r"(?=<h[12][\s>])", re.IGNORECASE)
+
+
+def _split_sections(body: str) -> Dict[str, str]:
+    """Split body into {section title: normalized section XHTML} at h1/h2."""
+    sections: Dict[str, str] = {}
+    for chunk in _SECTION_SPLIT.split(normalize_body(body)):
+        if not chunk:
+            continue
+        m = re.match(r"<h[12][^>]*>(.*?)</h[12]>", chunk, re.IGNORECASE | re.DOTALL)
+        title = re.sub(r"<[^>]+>", "", m.group(1)).strip() if m else "(preamble)"
+        key, n = title, 2
+        while key in sections:
+            key, n = f"{title} #{n}", n + 1
+        sections[key] = chunk
+    return sections
+
+
+def section_diff(old_body: str, new_body: str) -> Dict[str, list]:
+    """Section-level diff between two bodies (sections split at h1/h2).
+
+    Returns:
+        {"added": [...], "removed": [...], "changed": [...]} — section titles
+    """
+    old_sections = _split_sections(old_body)
+    new_sections = _split_sections(new_body)
+    return {
+        "added": [t for t in new_sections if t not in old_sections],
+        "removed": [t for t in old_sections if t not in new_sections],
+        "changed": [
+            t for t in new_sections
+            if t in old_sections and new_sections[t] != old_sections[t]
+        ],
+    }
+
 
 class ConfluenceClient:
     """
@@ -324,11 +803,15 @@ class ConfluenceClient:
         self.token = token
         self.page_id = page_id
         self.backup = ConfluenceBackup(page_id)
-        self._current_backup: Optional[Path] = None
+        self._current_backup: Optional[str] = None
 
-    def lock(self, timeout: int = LOCK_TIMEOUT) -> ConfluenceLock:
-        """Return a lock context manager for this page."""
-        return ConfluenceLock(self.page_id, timeout)
+    def lock(self, timeout: int = LOCK_TIMEOUT, shared: bool = False) -> ConfluenceLock:
+        """Return a lock context manager for this page.
+
+        Use shared=True for read-only access (QA checks, exports); writes
+        (update_page, rollback) need the default exclusive lock.
+        """
+        return ConfluenceLock(self.page_id, timeout, shared=shared)
 
     @retry(
         stop=stop_after_attempt(MAX_RETRIES + 1),
@@ -340,8 +823,13 @@ class ConfluenceClient:
         _rate_limiter.acquire()
         try:
             with urllib.request.urlopen(req, timeout=30, context=_make_ssl_context()) as resp:
-                return json.loads(resp.read().decode('utf-8'))
+                result = json.loads(resp.read().decode('utf-8'))
+            _rate_limiter.on_success()
+            return result
         except urllib.error.HTTPError as e:
+            if e.code in THROTTLE_CODES:
+                headers = e.headers or {}
+                _rate_limiter.on_throttle(_parse_retry_after(headers.get("Retry-After")))
             if e.code not in RETRYABLE_CODES:
                 error_body = e.read().decode('utf-8', errors='replace')[:500]
                 raise ConfluenceAPIError(
@@ -391,7 +879,8 @@ class ConfluenceClient:
         version_message: str,
         fm_version: Optional[str] = None,
         create_backup: bool = True,
-        agent_name: str = "unknown"
+        agent_name: str = "unknown",
+        skip_unchanged: bool = False
     ) -> Tuple[Dict, Optional[Path]]:
         """
         Update page with new content.
@@ -402,21 +891,40 @@ class ConfluenceClient:
             fm_version: Optional FM semantic version (e.g., "1.2.3")
             create_backup: Whether to backup current state before update
             agent_name: Name of the agent performing the update (FC-12B)
+            skip_unchanged: Skip the PUT (no new version) if body is unchanged
 
         Returns:
-            Tuple of (response_dict, backup_path or None)
+            Tuple of (response_dict, backup entry id or None).
+            When skipped, response_dict is the current page and backup is None.
         """
+        if skip_unchanged:
+            new_hash = body_hash(new_body)
+            if self._matches_last_published(new_hash):
+                print("  No changes (matches last published body), update skipped")
+                return self.get_page(expand="version"), None
+
         # Get current page
         current = self.get_page()
         current_version = current["version"]["number"]
         title = current["title"]
 
+        if skip_unchanged:
+            current_body = current.get("body", {}).get("storage", {}).get("value", "")
+            if body_hash(current_body) == new_hash:
+                self._record_published(new_hash, current_version)
+                print("  No changes (body identical to live page), update skipped")
+                return current, None
+            diff = section_diff(current_body, new_body)
+            for kind in ("added", "removed", "changed"):
+                if diff[kind]:
+                    print(f"  Sections {kind}: {', '.join(diff[kind])}")
+
         # Create backup before update
-        backup_path = None
+        backup_id = None
         if create_backup:
-            backup_path = self.backup.save(current)
-            self._current_backup = backup_path
-            print(f"  Backup created: {backup_path.name}")
+            backup_id = self.backup.save(current)
+            self._current_backup = backup_id
+            print(f"  Backup created: {backup_id}")
 
         # Prepare update payload
         update_data = {
@@ -448,51 +956,65 @@ class ConfluenceClient:
 
             # Audit log (FC-12B)
             new_version = result.get("version", {}).get("number", current_version + 1)
-            self._audit_log("update", agent_name, version_message, new_version)
+            self._audit_log("update", agent_name, version_message, new_version,
+                            body_blob=self._store_body(new_body))
+            self._record_published(body_hash(new_body), new_version)
 
-            return result, backup_path
+            return result, backup_id
 
         except ConfluenceAPIError as e:
             print(f"  ERROR during update: {e}")
-            if backup_path:
-                print(f"  Backup available for rollback: {backup_path}")
+            if backup_id:
+                print(f"  Backup available for rollback: {backup_id} (page {self.page_id})")
             raise
 
-    def rollback(self, backup_path: Optional[Path] = None) -> Dict:
+    def rollback(self, backup_id: Optional[str] = None) -> Dict:
         """
         Rollback to previous page state.
 
         Args:
-            backup_path: Specific backup to restore. If None, uses latest.
+            backup_id: Specific backup entry id to restore. If None, uses latest.
 
         Returns:
             Response from restore operation
         """
-        if backup_path is None:
-            backup_path = self._current_backup
+        if backup_id is None:
+            backup_id = self._current_backup
 
-        if backup_path is None:
+        if backup_id is None:
             backup_data = self.backup.get_latest()
             if backup_data is None:
                 raise ConfluenceAPIError("No backup available for rollback")
         else:
-            with open(backup_path, 'r', encoding='utf-8') as f:
-                backup_data = json.load(f)
+            backup_data = self.backup.load(backup_id)
+
+        result = self.restore(
+            backup_data,
+            f"ROLLBACK to version {backup_data.get('version', {}).get('number', '?')}"
+        )
+        print(f"  Rollback complete. New version: {result.get('version', {}).get('number')}")
+        return result
 
+    def restore(self, page_data: Dict, version_message: str,
+                agent_name: str = "system", action: str = "rollback") -> Dict:
+        """
+        Make page_data (a stored page state) the current page with one PUT.
+
+        Used by rollback() and by the offline restore tool (confluence_history).
+        """
         # Get current version for increment
         current = self.get_page()
         current_version = current["version"]["number"]
 
-        # Restore from backup
-        restore_body = backup_data.get("body", {}).get("storage", {}).get("value", "")
+        restore_body = page_data.get("body", {}).get("storage", {}).get("value", "")
 
         restore_data = {
             "id": self.page_id,
             "type": "page",
-            "title": backup_data.get("title", current["title"]),
+            "title": page_data.get("title") or current["title"],
             "version": {
                 "number": current_version + 1,
-                "message": f"ROLLBACK to version {backup_data.get('version', {}).get('number', '?')}"
+                "message": version_message
             },
             "body": {
                 "storage": {
@@ -504,25 +1026,58 @@ class ConfluenceClient:
 
         result = self._request("PUT", f"/rest/api/content/{self.page_id}", restore_data)
 
-        # Invalidate cache after rollback
+        # Invalidate cache after restore
         _page_cache.invalidate(self.page_id)
 
-        print(f"  Rollback complete. New version: {result.get('version', {}).get('number')}")
-
         # Audit log (FC-12B)
         new_version = result.get("version", {}).get("number", 0)
-        self._audit_log("rollback", "system", f"ROLLBACK to version {backup_data.get('version', {}).get('number', '?')}", new_version)
+        self._audit_log(action, agent_name, version_message, new_version,
+                        body_blob=self._store_body(restore_body))
 
         return result
 
-    def _audit_log(self, action: str, agent_name: str, version_message: str, version_number: int):
+    def _store_body(self, body: str) -> Optional[str]:
+        """Keep the published body in the backup store for offline history."""
+        try:
+            return self.backup.store_blob(body)
+        except OSError:
+            return None
+
+    def _publish_state_file(self) -> Path:
+        return PUBLISH_STATE_DIR / f"confluence_{self.page_id}.json"
+
+    def _matches_last_published(self, new_hash: str) -> bool:
+        """True if new_hash equals the last body we published and the page
+        has not been edited since (checked with a cheap version-only GET)."""
+        try:
+            record = json.loads(self._publish_state_file().read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        if record.get("hash") != new_hash:
+            return False
+        current = self.get_page(expand="version")
+        return current.get("version", {}).get("number") == record.get("version_number")
+
+    def _record_published(self, new_hash: str, version_number: int):
+        """Remember hash of the published body. Never raises."""
+        try:
+            PUBLISH_STATE_DIR.mkdir(parents=True, exist_ok=True)
+            self._publish_state_file().write_text(json.dumps({
+                "hash": new_hash,
+                "version_number": version_number,
+                "published_at": datetime.now().isoformat(),
+            }), encoding="utf-8")
+        except OSError:
+            pass
+
+    def _audit_log(self, action: str, agent_name: str, version_message: str, version_number: int,
+                   body_blob: Optional[str] = None):
         """Write audit entry for every Confluence write operation (FC-12B).
 
+        body_blob is the backup-store hash of the body written in this version.
         Never raises — audit log failure must not block the primary operation.
         """
         try:
-            AUDIT_LOG_DIR.mkdir(parents=True, exist_ok=True)
-            log_file = AUDIT_LOG_DIR / f"confluence_{self.page_id}.jsonl"
             entry = {
                 "timestamp": datetime.now().isoformat(),
                 "page_id": self.page_id,
@@ -530,10 +1085,10 @@ class ConfluenceClient:
                 "agent": agent_name,
                 "version_message": version_message,
                 "version_number": version_number,
+                "body_blob": body_blob,
                 "pid": os.getpid()
             }
-            with open(log_file, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            get_audit_log(AUDIT_LOG_DIR, self.page_id).append(entry)
         except OSError:
             pass
 
@@ -584,6 +1139,80 @@ def safe_publish(page_id: str, new_body: str, version_message: str,
         return result
 
 
+def batch_publish(pages: List[Tuple[str, str, str]], fm_version: Optional[str] = None,
+                  agent_name: str = "unknown", max_workers: int = BATCH_MAX_WORKERS) -> List[Dict]:
+    """
+    Publish several pages as one release (all-or-nothing):
+    - Acquires all page locks in page_id order (no lock-order deadlocks)
+    - Backs up every page before the first PUT
+    - PUTs pages concurrently (shared rate limiter caps total RPS)
+    - On any failure rolls back the pages that were already updated
+
+    Args:
+        pages: List of (page_id, new_body, version_message)
+
+    Returns:
+        List of update results in the order of `pages`
+
+    Usage:
+        batch_publish([
+            ("83951683", fm_body, "FM 1.0.7"),
+            ("86049548", tz_body, "TZ 1.0.7"),
+        ], agent_name="Agent7_Publisher")
+    """
+    page_ids = [page_id for page_id, _, _ in pages]
+    if len(set(page_ids)) != len(page_ids):
+        raise ValueError(f"Duplicate page_id in batch: {page_ids}")
+
+    clients = {page_id: create_client_from_env(page_id) for page_id in page_ids}
+
+    with ExitStack() as stack:
+        for page_id in sorted(page_ids):
+            stack.enter_context(clients[page_id].lock())
+
+        backups: Dict[str, str] = {}
+        for page_id in page_ids:
+            client = clients[page_id]
+            backups[page_id] = client.backup.save(client.get_page())
+            client._current_backup = backups[page_id]
+        print(f"  Batch: {len(backups)} page(s) locked and backed up")
+
+        def _publish_one(page: Tuple[str, str, str]) -> Dict:
+            page_id, new_body, version_message = page
+            result, _ = clients[page_id].update_page(
+                new_body=new_body,
+                version_message=version_message,
+                fm_version=fm_version,
+                create_backup=False,
+                agent_name=agent_name
+            )
+            return result
+
+        results: Dict[str, Dict] = {}
+        errors: Dict[str, Exception] = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pages)))) as pool:
+            futures = {pool.submit(_publish_one, page): page[0] for page in pages}
+            for future, page_id in futures.items():
+                try:
+                    results[page_id] = future.result()
+                except Exception as e:
+                    errors[page_id] = e
+
+        if errors:
+            for page_id in sorted(results):
+                try:
+                    clients[page_id].rollback(backups[page_id])
+                except ConfluenceAPIError as e:
+                    print(f"  ERROR rolling back page {page_id}: {e}")
+                    print(f"  Backup available for manual restore: {backups[page_id]}")
+            failed = ", ".join(f"{pid}: {err}" for pid, err in sorted(errors.items()))
+            raise ConfluenceAPIError(
+                f"Batch publish failed, {len(results)} updated page(s) rolled back. Failed: {failed}"
+            )
+
+        return [results[page_id] for page_id in page_ids]
+
+
 if __name__ == "__main__":
     # Test the library
     print("Confluence Utils Library v1.1 (FC-12B: audit log)")
@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+"""
+Durable local spool for Langfuse traces.
+
+Tracers (langfuse_tracer Stop hook, PipelineTracer) do not talk to Langfuse
+synchronously. They get a SpoolClient, which records the calls they make
+(start_span / start_generation / update / update_trace / end) as one
+observation tree per trace. flush() appends those trees to an append-only
+JSONL queue. A drainer, started in the background after each flush or from
+cron, uploads the trees in batches through the ingestion API. A hook therefore
+returns in milliseconds, and traces survive Langfuse being slow or down.
+
+Files (in LANGFUSE_SPOOL_DIR, default src/.langfuse_state):
+  - spool.jsonl            queue, one record per line, appended under flock
+  - spool.<ns>.draining    batch claimed by the drainer; left over after a
+                           crash or an outage and resumed by the next drain
+  - spool.<ns>.draining.pos  lines of that batch already uploaded
+  - spool.retry.jsonl      records that failed during the running drain; moved
+                           back to the queue when it ends
+  - spool.dead.jsonl       records that failed LANGFUSE_SPOOL_MAX_ATTEMPTS times
+
+Features:
+  - At most one drainer at a time (non-blocking flock); extra runs exit at once,
+    and the running drainer keeps claiming the queue until it is empty, so
+    traces flushed while it runs are sent by it
+  - Reachability is checked (auth_check with retries and backoff) before
+    anything is claimed; an unreachable Langfuse leaves the queue untouched
+  - One ingestion request per LANGFUSE_SPOOL_BATCH records. The SDK exporter
+    drops failed uploads silently, so the drainer uses the ingestion endpoint,
+    which reports errors per event. A record is only counted as sent once that
+    request succeeds; otherwise it is re-queued with attempts + 1
+  - Trace and observation ids are derived from the record's seed (a trace's
+    spool id), so a batch sent again after a crash updates the same trace
+  - checkpoint() spools a snapshot of a trace that is still open; snapshots
+    share the trace's ids, so a long run that dies before flush() keeps
+    everything recorded up to its last checkpoint
+  - Original timings are kept as the observations' start / end times
+
+Settings (env):
+    LANGFUSE_SPOOL               1 = tracers write to the spool (default), 0 = send directly
+    LANGFUSE_SPOOL_DIR           spool directory (default src/.langfuse_state)
+    LANGFUSE_SPOOL_AUTODRAIN     1 = start a background drainer after each flush (default)
+    LANGFUSE_SPOOL_BATCH         records per ingestion request (default 50)
+    LANGFUSE_SPOOL_MAX_ATTEMPTS  failed uploads before a record is dead-lettered (default 5)
+
+Usage:
+    python3 -m fm_review.langfuse_spool --drain     # cron or background
+    python3 -m fm_review.langfuse_spool --status
+"""
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from tenacity import retry, stop_after_attempt, wait_random_exponential
+
+SPOOL_ENABLED = os.environ.get("LANGFUSE_SPOOL", "1") != "0"
+SPOOL_DIR = Path(os.environ.get(
+    "LANGFUSE_SPOOL_DIR", str(Path(__file__).parent.parent / ".langfuse_state")))
+SPOOL_AUTODRAIN = os.environ.get("LANGFUSE_SPOOL_AUTODRAIN", "1") != "0"
+SPOOL_BATCH = max(1, int(os.environ.get("LANGFUSE_SPOOL_BATCH", "50")))
+SPOOL_MAX_ATTEMPTS = max(1, int(os.environ.get("LANGFUSE_SPOOL_MAX_ATTEMPTS", "5")))
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+# ── Recording client ──────────────────────────────────────
+
+
+class SpoolSpan:
+    """Records the span API calls tracers make into a JSON-serializable node.
+
+    Unlike the SDK, start_* and end() take an ISO start_time / end_time, so
+    observations rebuilt from a transcript keep their real timings.
+    """
+
+    def __init__(self, as_type: str, kwargs: Dict[str, Any], start_time: Optional[str] = None):
+        self.node = {"type": as_type, "kwargs": kwargs, "trace": None, "updates": [],
+                     "children": [], "started_at": start_time or _now(), "ended_at": None}
+
+    def _child(self, as_type: str, kwargs: Dict[str, Any], start_time: Optional[str]) -> "SpoolSpan":
+        child = SpoolSpan(as_type, kwargs, start_time)
+        self.node["children"].append(child.node)
+        return child
+
+    def start_span(self, start_time: Optional[str] = None, **kwargs) -> "SpoolSpan":
+        return self._child("span", kwargs, start_time)
+
+    def start_generation(self, start_time: Optional[str] = None, **kwargs) -> "SpoolSpan":
+        return self._child("generation", kwargs, start_time)
+
+    def update(self, **kwargs) -> "SpoolSpan":
+        self.node["updates"].append(kwargs)
+        return self
+
+    def update_trace(self, **kwargs) -> "SpoolSpan":
+        self.node["trace"] = {**(self.node["trace"] or {}), **kwargs}
+        return self
+
+    def end(self, end_time: Optional[str] = None, **_kwargs) -> "SpoolSpan":
+        self.node["ended_at"] = end_time or _now()
+        return self
+
+
+class SpoolClient:
+    """Stand-in for the Langfuse client: root spans are spooled on flush().
+
+    Long runs call checkpoint() as parts of the trace end, so a crash or kill
+    before flush() only loses what was still open.
+    """
+
+    def __init__(self, spool: Optional["LangfuseSpool"] = None):
+        self._spool = spool
+        self._roots: List[Dict[str, Any]] = []
+        self._seeds: List[str] = []
+
+    def start_span(self, start_time: Optional[str] = None, **kwargs) -> SpoolSpan:
+        root = SpoolSpan("span", kwargs, start_time)
+        self._roots.append(root.node)
+        self._seeds.append(uuid.uuid4().hex)
+        return root
+
+    def _enqueue(self, roots: List[Dict[str, Any]], seeds: List[str]):
+        spool = self._spool or LangfuseSpool(SPOOL_DIR)
+        for node, seed in zip(roots, seeds):
+            spool.enqueue(node, seed=seed)
+        if roots and SPOOL_AUTODRAIN:
+            spawn_drainer(spool.spool_dir)
+
+    def checkpoint(self):
+        """Spool a snapshot of the open traces and keep recording them.
+
+        Every snapshot of a trace shares its trace and observation ids, so
+        each upload updates the same trace in place.
+        """
+        self._enqueue(self._roots, self._seeds)
+
+    def flush(self):
+        roots, self._roots = self._roots, []
+        seeds, self._seeds = self._seeds, []
+        self._enqueue(roots, seeds)
+
+
+# ── Replay ────────────────────────────────────────────────
+
+_TRACE_FIELDS = frozenset({"name", "user_id", "session_id", "release", "version",
+                           "metadata", "tags", "environment", "public", "input", "output"})
+_SPAN_FIELDS = frozenset({"name", "metadata", "input", "output", "level", "status_message",
+                          "version", "environment"})
+_GENERATION_FIELDS = _SPAN_FIELDS | {"model", "model_parameters", "usage", "usage_details",
+                                     "cost_details", "prompt_name", "prompt_version"}
+
+
+def _time(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _merged(node: Dict[str, Any]) -> Dict[str, Any]:
+    """Start kwargs with the recorded update() calls applied; metadata dicts are merged."""
+    fields = dict(node["kwargs"])
+    for update in node["updates"]:
+        for key, value in update.items():
+            if key == "metadata" and isinstance(value, dict) and isinstance(fields.get(key), dict):
+                value = {**fields[key], **value}
+            fields[key] = value
+    return fields
+
+
+def _observation_events(node: Dict[str, Any], trace_id: str, seed: str, record_id: str,
+                        path: str, parent_id: Optional[str]) -> List[Any]:
+    from langfuse.api.resources.ingestion.types import (
+        CreateGenerationBody,
+        CreateSpanBody,
+        IngestionEvent_GenerationCreate,
+        IngestionEvent_SpanCreate,
+    )
+    generation = node["type"] == "generation"
+    allowed = _GENERATION_FIELDS if generation else _SPAN_FIELDS
+    fields = {k: v for k, v in _merged(node).items() if k in allowed}
+    obs_id = hashlib.sha256(f"{seed}:{path}".encode()).hexdigest()[:16]
+    body_cls, event_cls = ((CreateGenerationBody, IngestionEvent_GenerationCreate) if generation
+                           else (CreateSpanBody, IngestionEvent_SpanCreate))
+    body = body_cls(id=obs_id, trace_id=trace_id, parent_observation_id=parent_id,
+                    start_time=_time(node["started_at"]), end_time=_time(node["ended_at"]), **fields)
+    events = [event_cls(id=f"{record_id}-{path}", timestamp=node["started_at"], body=body)]
+    for i, child in enumerate(node["children"]):
+        events += _observation_events(child, trace_id, seed, record_id, f"{path}.{i}", obs_id)
+    return events
+
+
+def record_events(client, record: Dict[str, Any]) -> List[Any]:
+    """Ingestion events (trace + one per observation) for one spooled trace.
+
+    Trace and observation ids are derived from the record's seed (its id
+    unless it is a checkpoint), so a record sent again after a failure, or a
+    later snapshot of the same trace, updates that trace. Event ids are
+    derived from the record id and stay unique per record.
+    """
+    from langfuse.api.resources.ingestion.types import IngestionEvent_TraceCreate, TraceBody
+    root = record["trace"]
+    seed = record.get("seed") or record["id"]
+    trace_id = client.create_trace_id(seed=seed)
+    fields = {"name": root["kwargs"].get("name"), **(root["trace"] or {})}
+    body = TraceBody(id=trace_id, timestamp=_time(root["started_at"]),
+                     **{k: v for k, v in fields.items() if k in _TRACE_FIELDS})
+    trace = IngestionEvent_TraceCreate(id=f"{record['id']}-trace", timestamp=root["started_at"], body=body)
+    return [trace] + _observation_events(root, trace_id, seed, record["id"], "0", None)
+
+
+@retry(stop=stop_after_attempt(3), wait=wait_random_exponential(multiplier=1, max=10), reraise=True)
+def _auth_check(client) -> bool:
+    return client.auth_check()
+
+
+def _reachable(client) -> bool:
+    try:
+        return bool(_auth_check(client))
+    except Exception:
+        return False
+
+
+# ── Spool ─────────────────────────────────────────────────
+
+
+class LangfuseSpool:
+    """Append-only JSONL queue of spooled traces with a single-drainer protocol."""
+
+    def __init__(self, spool_dir: Path):
+        self.spool_dir = Path(spool_dir)
+        self.active_file = self.spool_dir / "spool.jsonl"
+        self.dead_file = self.spool_dir / "spool.dead.jsonl"
+        self.retry_file = self.spool_dir / "spool.retry.jsonl"
+        self._lock_file = self.spool_dir / "spool.lock"
+        self._drain_lock_file = self.spool_dir / "drain.lock"
+
+    @contextmanager
+    def _exclusive(self):
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self._lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _append(self, path: Path, records: List[Dict[str, Any]]):
+        if not records:
+            return
+        data = "".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in records)
+        with self._exclusive():
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(data)
+
+    def enqueue(self, trace: Dict[str, Any], seed: Optional[str] = None) -> str:
+        """Append a recorded trace; returns the record id.
+
+        Records enqueued with the same seed are snapshots of one trace.
+        """
+        record = {"id": uuid.uuid4().hex, "created_at": _now(), "attempts": 0, "trace": trace}
+        if seed:
+            record["seed"] = seed
+        self._append(self.active_file, [record])
+        return record["id"]
+
+    def _claimed(self) -> List[Path]:
+        return sorted(self.spool_dir.glob("spool.*.draining"))
+
+    def _requeue_retries(self):
+        """Move the records that failed during a drain back to the queue."""
+        with self._exclusive():
+            if not self.retry_file.exists():
+                return
+            with open(self.retry_file, encoding="utf-8") as src, \
+                    open(self.active_file, "a", encoding="utf-8") as dst:
+                dst.write(src.read())
+            self.retry_file.unlink()
+
+    def _claim(self) -> List[Path]:
+        """Move the queue aside for draining; returns all claimed batches, oldest first."""
+        with self._exclusive():
+            if self.active_file.exists() and self.active_file.stat().st_size:
+                os.rename(self.active_file, self.spool_dir / f"spool.{time.time_ns()}.draining")
+        return self._claimed()
+
+    def status(self) -> Dict[str, int]:
+        def count(path: Path) -> int:
+            try:
+                with open(path, "rb") as f:
+                    return sum(1 for _ in f)
+            except OSError:
+                return 0
+        claimed = sum(count(p) - _read_pos(p) for p in self._claimed())
+        queued = count(self.active_file) + count(self.retry_file) + claimed
+        return {"queued": queued, "dead": count(self.dead_file)}
+
+    def drain(self, client=None, batch_size: int = SPOOL_BATCH,
+              max_attempts: int = SPOOL_MAX_ATTEMPTS) -> Dict[str, Any]:
+        """Upload queued traces. Returns counts: sent, requeued, dead (+ busy / offline flags)."""
+        result = {"sent": 0, "requeued": 0, "dead": 0, "busy": False, "offline": False}
+        if not self.active_file.exists() and not self.retry_file.exists() and not self._claimed():
+            return result
+
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self._drain_lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                result["busy"] = True
+                return result
+
+            if client is None:
+                from langfuse import get_client
+                client = get_client()
+            if not _reachable(client):
+                result["offline"] = True
+                return result
+
+            # Failures of a crashed drain are retried now; failures of this one
+            # are held in retry_file so the loop ends once the queue is empty
+            self._requeue_retries()
+            while True:
+                claimed = self._claim()
+                if not claimed:
+                    break
+                for path in claimed:
+                    self._drain_file(client, path, batch_size, max_attempts, result)
+            self._requeue_retries()
+            return result
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _drain_file(self, client, path: Path, batch_size: int, max_attempts: int, result: Dict[str, Any]):
+        done = _read_pos(path)
+        with open(path, encoding="utf-8") as f:
+            lines = f.readlines()
+
+        for start in range(done, len(lines), batch_size):
+            records, events, owner, invalid = [], [], {}, []
+            for line in lines[start:start + batch_size]:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                try:
+                    batch = record_events(client, record)
+                except (ValueError, KeyError, TypeError):
+                    invalid.append(record)  # never accepted by the API; no point retrying
+                    continue
+                records.append(record)
+                owner.update((event.id, record["id"]) for event in batch)
+                events += batch
+
+            # The SDK exports in the background and swallows errors; the
+            # ingestion endpoint reports failure per event instead
+            try:
+                response = client.api.ingestion.batch(batch=events) if events else None
+                rejected = {owner.get(error.id) for error in response.errors} if response else set()
+            except Exception:
+                rejected = {r["id"] for r in records}
+
+            failed = [r for r in records if r["id"] in rejected]
+            for record in failed:
+                record["attempts"] = record.get("attempts", 0) + 1
+            retry_records = [r for r in failed if r["attempts"] < max_attempts]
+            self._append(self.retry_file, retry_records)
+            dead = invalid + [r for r in failed if r["attempts"] >= max_attempts]
+            self._append(self.dead_file, dead)
+            result["sent"] += len(records) - len(failed)
+            result["requeued"] += len(retry_records)
+            result["dead"] += len(dead)
+            _write_pos(path, min(start + batch_size, len(lines)))
+
+        path.unlink()
+        _pos_file(path).unlink(missing_ok=True)
+
+
+def _pos_file(path: Path) -> Path:
+    return path.with_name(path.name + ".pos")
+
+
+def _read_pos(path: Path) -> int:
+    try:
+        return int(_pos_file(path).read_text())
+    except (OSError, ValueError):
+        return 0
+
+
+def _write_pos(path: Path, done: int):
+    tmp = _pos_file(path).with_suffix(f".tmp{os.getpid()}")
+    tmp.write_text(str(done))
+    os.replace(tmp, _pos_file(path))
+
+
+def get_client():
+    """Client for tracers: a SpoolClient, or the Langfuse SDK client when the spool is off."""
+    if SPOOL_ENABLED:
+        return SpoolClient()
+    from langfuse import get_client as langfuse_client
+    return langfuse_client()
+
+
+def spawn_drainer(spool_dir: Optional[Path] = None):
+    """Start a detached drainer process; never blocks or fails the caller."""
+    src_dir = str(Path(__file__).resolve().parent.parent)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [src_dir, os.environ.get("PYTHONPATH")])))
+    try:
+        subprocess.Popen(  # noqa: S603 - fixed argv, our own module
+            [sys.executable, "-m", "fm_review.langfuse_spool", "--drain",
+             "--dir", str(spool_dir or SPOOL_DIR)],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            env=env, start_new_session=True,
+        )
+    except OSError:
+        pass
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Langfuse trace spool")
+    parser.add_argument("--dir", type=Path, default=None, help="Spool directory")
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--drain", action="store_true", help="Upload queued traces")
+    action.add_argument("--status", action="store_true", help="Show queued / dead-lettered counts")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    spool = LangfuseSpool(args.dir or SPOOL_DIR)
+    if args.status:
+        counts = spool.status()
+        print(f"  Queued: {counts['queued']}")
+        print(f"  Dead:   {counts['dead']}")
+        return 0
+
+    if not os.environ.get("LANGFUSE_HOST") and os.environ.get("LANGFUSE_BASE_URL"):
+        os.environ["LANGFUSE_HOST"] = os.environ["LANGFUSE_BASE_URL"]
+    result = spool.drain()
+    if result["busy"]:
+        print("  Another drainer is running")
+        return 0
+    if result["offline"]:
+        print("  Langfuse unreachable, traces kept in spool", file=sys.stderr)
+        return 1
+    print(f"  Sent: {result['sent']}, requeued: {result['requeued']}, dead: {result['dead']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
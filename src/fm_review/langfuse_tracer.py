@@ -3,11 +3,24 @@
 Langfuse tracer for Claude Code sessions.
 
 Stop hook script: parses Claude Code JSONL transcript and sends
-traces to Langfuse for cost/usage/agent observability.
+traces to Langfuse for cost/usage/agent observability: one generation per
+turn (token usage, cost, duration) and one span per tool call (duration from
+tool_use to tool_result), both timed from transcript timestamps.
 
 Usage (called by .claude/hooks/langfuse-trace.sh):
     echo '{"session_id":"...","transcript_path":"..."}' | python3 langfuse_tracer.py
 
+Parsing is incremental: the byte offset of the last complete line and the
+running SessionStats (including seen message ids) are kept per transcript in
+.langfuse_state/<transcript>.state.json, so each Stop hook reads only the
+bytes appended since the previous one and reports only the new turns.
+Only lines that can matter (assistant messages; user messages while the
+project is unknown) are JSON-decoded, using orjson when it is installed.
+
+Traces go to the local spool (fm_review.langfuse_spool) and are uploaded by a
+background drainer, so the hook does not wait on Langfuse (LANGFUSE_SPOOL=0
+sends directly).
+
 Requires: LANGFUSE_PUBLIC_KEY, LANGFUSE_SECRET_KEY, LANGFUSE_BASE_URL in env.
 """
 
@@ -15,9 +28,15 @@ import json
 import os
 import re
 import sys
-from dataclasses import dataclass, field
+from dataclasses import asdict, dataclass, field, fields, replace
+from datetime import datetime
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # USD per million tokens (Feb 2026)
 MODEL_PRICING = {
     "claude-opus-4-6": {
@@ -50,6 +69,21 @@ AGENT_NAMES = {
 
 STATE_DIR = Path(__file__).parent.parent / ".langfuse_state"
 
+# Optional fast decoder; both raise a json.JSONDecodeError subclass on bad input
+_loads = orjson.loads if orjson is not None else json.loads
+
+# Raw-line prefilter: top-level "type" values the parser acts on. Quotes inside
+# JSON strings are escaped, so a match is a real key/value pair (at worst a
+# nested one, which only costs a full decode).
+_ASSISTANT_TYPE = re.compile(rb'"type"\s*:\s*"assistant"')
+# Read from lines that are not decoded (tool results): when they were written
+# and which tool calls they answer
+_TIMESTAMP = re.compile(rb'"timestamp"\s*:\s*"([^"]+)"')
+_TOOL_RESULT_ID = re.compile(rb'"tool_use_id"\s*:\s*"([^"]+)"')
+
+# Per-invocation detail (sent, never persisted in the transcript state)
+TRANSIENT_FIELDS = ("turns", "tool_spans")
+
 
 @dataclass
 class SessionStats:
@@ -64,41 +98,164 @@ class SessionStats:
     agent_id: int | None = None
     agent_name: str = "interactive"
     project: str = ""
+    seen_message_ids: set = field(default_factory=set)
+    last_timestamp: str = ""
+    pending_tools: dict = field(default_factory=dict)
+    turns: list = field(default_factory=list)
+    tool_spans: list = field(default_factory=list)
+
+    def since(self, base: "SessionStats") -> "SessionStats":
+        """Usage accumulated after `base` was taken, with this session's context."""
+        return replace(
+            self,
+            input_tokens=self.input_tokens - base.input_tokens,
+            output_tokens=self.output_tokens - base.output_tokens,
+            cache_creation_tokens=self.cache_creation_tokens - base.cache_creation_tokens,
+            cache_read_tokens=self.cache_read_tokens - base.cache_read_tokens,
+            turn_count=self.turn_count - base.turn_count,
+            tool_calls={
+                tool: count - base.tool_calls.get(tool, 0)
+                for tool, count in self.tool_calls.items()
+                if count > base.tool_calls.get(tool, 0)
+            },
+            seen_message_ids=set(),
+        )
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["seen_message_ids"] = sorted(self.seen_message_ids)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SessionStats":
+        known = {f.name for f in fields(cls)}
+        stats = cls(**{k: v for k, v in data.items() if k in known})
+        stats.seen_message_ids = set(stats.seen_message_ids)
+        return stats
+
+
+def _state_file(transcript_path: str) -> Path:
+    return STATE_DIR / (Path(transcript_path).stem + ".state.json")
+
+
+def _legacy_offset(transcript_path: str) -> int:
+    """Byte offset for a line offset left by older versions (<stem>.offset)."""
+    legacy = STATE_DIR / (Path(transcript_path).stem + ".offset")
+    try:
+        lines = int(legacy.read_text().strip())
+        offset = 0
+        with open(transcript_path, "rb") as f:
+            for _ in range(lines):
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break
+                offset = f.tell()
+        return offset
+    except (ValueError, OSError):
+        return 0
+
+
+def load_state(transcript_path: str) -> tuple[int, SessionStats]:
+    """Byte offset and running stats saved by the previous invocation.
+
+    A transcript shorter than the saved offset was truncated or replaced and is
+    parsed again from the start.
+    """
+    offset, stats = 0, SessionStats()
+    try:
+        data = json.loads(_state_file(transcript_path).read_text())
+        offset, stats = int(data["offset"]), SessionStats.from_dict(data["stats"])
+    except FileNotFoundError:
+        offset = _legacy_offset(transcript_path)
+    except (ValueError, KeyError, TypeError, OSError):
+        pass
+    try:
+        if os.path.getsize(transcript_path) < offset:
+            return 0, SessionStats()
+    except OSError:
+        pass
+    return offset, stats
 
 
-def get_last_offset(transcript_path: str) -> int:
-    """Get the last processed line offset for incremental parsing."""
-    state_file = STATE_DIR / (Path(transcript_path).stem + ".offset")
-    if state_file.exists():
-        try:
-            return int(state_file.read_text().strip())
-        except (ValueError, OSError):
-            return 0
-    return 0
-
-
-def save_offset(transcript_path: str, offset: int):
-    """Save the current line offset for next invocation."""
+def save_state(transcript_path: str, offset: int, stats: SessionStats):
+    """Persist byte offset and running stats for the next invocation (atomic replace)."""
     STATE_DIR.mkdir(parents=True, exist_ok=True)
-    state_file = STATE_DIR / (Path(transcript_path).stem + ".offset")
-    state_file.write_text(str(offset))
+    state_file = _state_file(transcript_path)
+    tmp = state_file.with_suffix(".tmp")
+    data = stats.to_dict()
+    for name in TRANSIENT_FIELDS:
+        data.pop(name)
+    tmp.write_text(json.dumps({"offset": offset, "stats": data}))
+    os.replace(tmp, state_file)
+
 
+def _line_timestamp(line: bytes | None) -> str:
+    # Top-level "timestamp" follows the (large) message: search from the end
+    pos = line.rfind(b'"timestamp"') if line else -1
+    m = _TIMESTAMP.match(line, pos) if pos >= 0 else None
+    return m.group(1).decode() if m else ""
 
-def parse_transcript(transcript_path: str, start_offset: int = 0) -> tuple[SessionStats, int]:
-    """Parse JSONL transcript from offset. Returns stats and new offset."""
-    stats = SessionStats()
-    seen_message_ids = set()
-    line_count = 0
 
-    with open(transcript_path) as f:
-        for i, line in enumerate(f):
-            line_count = i + 1
-            if i < start_offset:
+def _duration_ms(started_at: str, ended_at: str) -> int | None:
+    try:
+        delta = datetime.fromisoformat(ended_at) - datetime.fromisoformat(started_at)
+    except (TypeError, ValueError):
+        return None
+    return max(int(delta.total_seconds() * 1000), 0)
+
+
+def _close_tool_calls(stats: SessionStats, line: bytes):
+    """Turn pending tool calls answered by a tool_result line into tool spans."""
+    ended_at = ""
+    pos = line.find(b'"tool_use_id"')
+    while pos >= 0:
+        m = _TOOL_RESULT_ID.match(line, pos)
+        call = stats.pending_tools.pop(m.group(1).decode(), None) if m else None
+        if call is not None:
+            ended_at = ended_at or _line_timestamp(line)
+            stats.tool_spans.append({
+                **call, "ended_at": ended_at, "duration_ms": _duration_ms(call["started_at"], ended_at),
+            })
+        pos = line.find(b'"tool_use_id"', pos + 1)
+
+
+def parse_transcript(transcript_path: str, start_offset: int = 0,
+                     stats: SessionStats | None = None) -> tuple[SessionStats, int]:
+    """Parse JSONL transcript from a byte offset. Returns stats and new byte offset.
+
+    Continues `stats` when given (message ids seen earlier stay deduplicated).
+    Only complete lines are consumed: a line still being written stays beyond
+    the returned offset and is read on the next call.
+
+    Besides totals, records each new turn (stats.turns: usage, start = previous
+    line, end = the assistant message) and each answered tool call
+    (stats.tool_spans: tool_use -> tool_result). Calls still waiting for a
+    result are kept in stats.pending_tools.
+    """
+    stats = stats if stats is not None else SessionStats()
+    seen_message_ids = stats.seen_message_ids
+    offset = start_offset
+    prev_line = None
+
+    with open(transcript_path, "rb") as f:
+        f.seek(start_offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            line_before, prev_line = prev_line, line
+
+            if stats.pending_tools:
+                _close_tool_calls(stats, line)
+
+            # Skip tool results and other large lines without decoding them
+            if not (b'"assistant"' in line and _ASSISTANT_TYPE.search(line)) and (
+                    stats.project or b"PROJECT_" not in line):
                 continue
 
             try:
-                entry = json.loads(line)
-            except json.JSONDecodeError:
+                entry = _loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
                 continue
 
             entry_type = entry.get("type", "")
@@ -115,36 +272,65 @@ def parse_transcript(transcript_path: str, start_offset: int = 0) -> tuple[Sessi
             # Process assistant messages (LLM responses)
             if entry_type == "assistant" and msg.get("role") == "assistant":
                 msg_id = msg.get("id", "")
+                timestamp = entry.get("timestamp", "")
+                content = msg.get("content", [])
+                blocks = [b for b in content if isinstance(b, dict) and b.get("type") == "tool_use"] \
+                    if isinstance(content, list) else []
 
-                # Deduplicate: same message.id appears multiple times (streaming)
+                # Deduplicate: same message.id appears multiple times (streaming),
+                # one content block per line - only tool calls not seen yet count
                 if msg_id and msg_id in seen_message_ids:
-                    continue
-                if msg_id:
-                    seen_message_ids.add(msg_id)
-
-                # Model
-                model = msg.get("model", "")
-                if model:
-                    stats.model = model
-
-                # Token usage
-                usage = msg.get("usage", {})
-                if usage and usage.get("input_tokens", 0) > 0:
-                    stats.input_tokens += usage.get("input_tokens", 0)
-                    stats.output_tokens += usage.get("output_tokens", 0)
-                    stats.cache_creation_tokens += usage.get("cache_creation_input_tokens", 0)
-                    stats.cache_read_tokens += usage.get("cache_read_input_tokens", 0)
-                    stats.turn_count += 1
+                    blocks = [b for b in blocks if b.get("id") and b["id"] not in seen_message_ids]
+                    turn = stats.turns[-1] if stats.turns and stats.turns[-1]["message_id"] == msg_id else None
+                else:
+                    if msg_id:
+                        seen_message_ids.add(msg_id)
+
+                    # Model
+                    model = msg.get("model", "")
+                    if model:
+                        stats.model = model
+
+                    # Token usage
+                    turn = None
+                    usage = msg.get("usage", {})
+                    if usage and usage.get("input_tokens", 0) > 0:
+                        stats.input_tokens += usage.get("input_tokens", 0)
+                        stats.output_tokens += usage.get("output_tokens", 0)
+                        stats.cache_creation_tokens += usage.get("cache_creation_input_tokens", 0)
+                        stats.cache_read_tokens += usage.get("cache_read_input_tokens", 0)
+                        stats.turn_count += 1
+                        started_at = _line_timestamp(line_before) if line_before else stats.last_timestamp
+                        turn = {
+                            "index": stats.turn_count, "message_id": msg_id, "model": model or stats.model,
+                            "started_at": started_at, "ended_at": timestamp,
+                            "duration_ms": _duration_ms(started_at, timestamp),
+                            "usage": {
+                                "input": usage.get("input_tokens", 0),
+                                "output": usage.get("output_tokens", 0),
+                                "cache_creation_input_tokens": usage.get("cache_creation_input_tokens", 0),
+                                "cache_read_input_tokens": usage.get("cache_read_input_tokens", 0),
+                            },
+                            "tools": [],
+                        }
+                        stats.turns.append(turn)
 
                 # Tool calls
-                content = msg.get("content", [])
-                if isinstance(content, list):
-                    for block in content:
-                        if isinstance(block, dict) and block.get("type") == "tool_use":
-                            tool = block.get("name", "unknown")
-                            stats.tool_calls[tool] = stats.tool_calls.get(tool, 0) + 1
-
-    return stats, line_count
+                for block in blocks:
+                    tool = block.get("name", "unknown")
+                    stats.tool_calls[tool] = stats.tool_calls.get(tool, 0) + 1
+                    if turn is not None:
+                        turn["tools"].append(tool)
+                    tool_id = block.get("id")
+                    if tool_id:
+                        seen_message_ids.add(tool_id)
+                        stats.pending_tools[tool_id] = {
+                            "id": tool_id, "name": tool, "turn": stats.turn_count, "started_at": timestamp,
+                        }
+
+    if prev_line is not None:
+        stats.last_timestamp = _line_timestamp(prev_line) or stats.last_timestamp
+    return stats, offset
 
 
 def detect_agent(transcript_path: str) -> tuple[int | None, str]:
@@ -182,11 +368,31 @@ def calculate_cost(stats: SessionStats) -> float:
     return round(cost, 6)
 
 
-def send_to_langfuse(stats: SessionStats, cost: float, session_id: str):
-    """Send trace to Langfuse (SDK v3 API)."""
-    from langfuse import get_client
+def _usage_cost(usage: dict, pricing: dict) -> dict:
+    """USD cost per usage type of one turn."""
+    return {
+        "input": usage["input"] * pricing["input"] / 1_000_000,
+        "output": usage["output"] * pricing["output"] / 1_000_000,
+        "cache_creation_input_tokens": usage["cache_creation_input_tokens"] * pricing["cache_creation"] / 1_000_000,
+        "cache_read_input_tokens": usage["cache_read_input_tokens"] * pricing["cache_read"] / 1_000_000,
+    }
 
-    langfuse = get_client()
+
+def _tool_durations(tool_spans: list) -> dict:
+    """Total time per tool (ms) over answered tool calls."""
+    totals = {}
+    for call in tool_spans:
+        if call["duration_ms"] is not None:
+            totals[call["name"]] = totals.get(call["name"], 0) + call["duration_ms"]
+    return totals
+
+
+def send_to_langfuse(stats: SessionStats, cost: float, session_id: str, client=None):
+    """Send trace to Langfuse (SDK v3 API), or through `client` (e.g. the spool recorder)."""
+    if client is None:
+        from langfuse import get_client
+        client = get_client()
+    langfuse = client
 
     trace_name = (
         f"agent-{stats.agent_id}-{stats.agent_name}"
@@ -205,9 +411,9 @@ def send_to_langfuse(stats: SessionStats, cost: float, session_id: str):
         tags.append(f"project:{stats.project}")
 
     # v3: create root span, then set trace metadata via update_trace()
-    pricing = MODEL_PRICING.get(stats.model, DEFAULT_PRICING)
-
-    root = langfuse.start_span(name=trace_name)
+    timing = _Timing(langfuse)
+    window = _window(stats)
+    root = langfuse.start_span(name=trace_name, **timing.start(window))
     root.update_trace(
         name=trace_name,
         session_id=session_id,
@@ -222,11 +428,78 @@ def send_to_langfuse(stats: SessionStats, cost: float, session_id: str):
             "output_tokens": stats.output_tokens,
             "cache_creation_tokens": stats.cache_creation_tokens,
             "cache_read_tokens": stats.cache_read_tokens,
+            "tool_duration_ms": _tool_durations(stats.tool_spans),
         },
         tags=tags,
     )
 
-    # Generation: aggregate LLM usage
+    if stats.turns or stats.tool_spans:
+        # One generation per turn and one span per answered tool call; the SDK
+        # queues them and exports in batches (LANGFUSE_FLUSH_AT) on flush()
+        for turn in stats.turns:
+            usage = turn["usage"]
+            gen = root.start_generation(
+                name=f"turn-{turn['index']}",
+                model=turn["model"],
+                usage_details=usage,
+                cost_details=_usage_cost(usage, MODEL_PRICING.get(turn["model"], DEFAULT_PRICING)),
+                metadata={"message_id": turn["message_id"], "tools": turn["tools"], **timing.metadata(turn)},
+                **timing.start(turn),
+            )
+            gen.end(**timing.end(turn))
+
+        for call in stats.tool_spans:
+            tool_span = root.start_span(
+                name=f"tool:{call['name']}",
+                metadata={"tool_use_id": call["id"], "turn": call["turn"], **timing.metadata(call)},
+                **timing.start(call),
+            )
+            tool_span.end(**timing.end(call))
+    else:
+        _send_aggregate(root, stats, cost)
+
+    root.end(**timing.end(window))
+    langfuse.flush()
+
+
+class _Timing:
+    """Transcript timings of turns and tool calls, as observation times or as metadata.
+
+    The spool recorder takes ISO start / end times, so observations show their
+    real latency. SDK v3 spans always start when created; there the timings
+    only go into metadata.
+    """
+
+    def __init__(self, client):
+        self.real = isinstance(client, _spool_module().SpoolClient)
+
+    def start(self, item: dict) -> dict:
+        return {"start_time": item["started_at"] or None} if self.real else {}
+
+    def end(self, item: dict) -> dict:
+        return {"end_time": item["ended_at"] or item["started_at"] or None} if self.real else {}
+
+    def metadata(self, item: dict) -> dict:
+        if self.real:
+            return {}
+        return {"started_at": item["started_at"], "ended_at": item["ended_at"], "duration_ms": item["duration_ms"]}
+
+
+def _window(stats: SessionStats) -> dict:
+    """Earliest start and latest end over the turns and tool calls (empty when unknown)."""
+    items = stats.turns + stats.tool_spans
+    starts = [i["started_at"] for i in items if i["started_at"]]
+    ends = [i["ended_at"] for i in items if i["ended_at"]]
+    return {
+        "started_at": min(starts, key=datetime.fromisoformat) if starts else "",
+        "ended_at": max(ends, key=datetime.fromisoformat) if ends else "",
+    }
+
+
+def _send_aggregate(root, stats: SessionStats, cost: float):
+    """No per-turn detail: one generation for the usage, one span per tool with its call count."""
+    pricing = MODEL_PRICING.get(stats.model, DEFAULT_PRICING)
+
     gen = root.start_generation(
         name="claude-code-session",
         model=stats.model,
@@ -249,8 +522,19 @@ def send_to_langfuse(stats: SessionStats, cost: float, session_id: str):
         tool_span = root.start_span(name=f"tool:{tool_name}", metadata={"call_count": count})
         tool_span.end()
 
-    root.end()
-    langfuse.flush()
+
+def _spool_module():
+    try:
+        from fm_review import langfuse_spool
+    except ImportError:  # run as a script: python3 src/fm_review/langfuse_tracer.py
+        sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+        from fm_review import langfuse_spool
+    return langfuse_spool
+
+
+def _trace_client():
+    """Client for the hook: spool recorder, or the SDK client with LANGFUSE_SPOOL=0."""
+    return _spool_module().get_client()
 
 
 def main():
@@ -275,28 +559,28 @@ def main():
         if not os.environ.get("LANGFUSE_HOST") and os.environ.get("LANGFUSE_BASE_URL"):
             os.environ["LANGFUSE_HOST"] = os.environ["LANGFUSE_BASE_URL"]
 
-        # Incremental parsing
-        last_offset = get_last_offset(transcript_path)
-        stats, new_offset = parse_transcript(transcript_path, last_offset)
+        # Incremental parsing: only bytes appended since the last invocation
+        last_offset, session = load_state(transcript_path)
+        base = replace(session, tool_calls=dict(session.tool_calls))
+        session, new_offset = parse_transcript(transcript_path, last_offset, session)
+        session.session_id = session_id or session.session_id
 
         # Nothing new to report
-        if stats.turn_count == 0:
-            save_offset(transcript_path, new_offset)
+        if session.turn_count == base.turn_count and not session.tool_spans:
+            save_state(transcript_path, new_offset, session)
             sys.exit(0)
 
-        # Detect agent (only on first parse)
-        if last_offset == 0:
-            stats.agent_id, stats.agent_name = detect_agent(transcript_path)
-        else:
-            # Re-detect from full transcript
-            stats.agent_id, stats.agent_name = detect_agent(transcript_path)
+        # Detect agent until found (header of the transcript; result is persisted)
+        if session.agent_id is None:
+            session.agent_id, session.agent_name = detect_agent(transcript_path)
 
-        # Calculate cost and send
+        # Calculate cost and send the new turns only
+        stats = session.since(base)
         cost = calculate_cost(stats)
-        send_to_langfuse(stats, cost, session_id)
+        send_to_langfuse(stats, cost, session_id, _trace_client())
 
-        # Save offset for next invocation
-        save_offset(transcript_path, new_offset)
+        # Save state for next invocation
+        save_state(transcript_path, new_offset, session)
 
     except Exception:
         # Never block Claude Code
@@ -1,7 +1,12 @@
 """
 Pipeline tracer and agent result model.
 
-PipelineTracer wraps Langfuse for optional observability.
+PipelineTracer wraps Langfuse for optional observability. Spans are recorded
+into the local spool (fm_review.langfuse_spool) and uploaded by a background
+drainer, so pipeline shutdown does not wait on Langfuse (LANGFUSE_SPOOL=0
+sends directly). The trace is checkpointed to the spool as it starts and as
+each agent / Quality Gate span ends, so a crashed or killed run keeps the
+agents that finished.
 AgentResult is the standard return type from agent execution.
 """
 import os
@@ -46,7 +51,9 @@ class PipelineTracer:
             os.environ["LANGFUSE_HOST"] = os.environ["LANGFUSE_BASE_URL"]
         try:
             from langfuse import get_client
-            self.langfuse = get_client()
+
+            from fm_review import langfuse_spool
+            self.langfuse = langfuse_spool.SpoolClient() if langfuse_spool.SPOOL_ENABLED else get_client()
             self.enabled = True
         except ImportError:
             pass
@@ -67,6 +74,17 @@ class PipelineTracer:
             },
             tags=[f"project:{self.project}", f"model:{self.model}", "pipeline", mode],
         )
+        self._checkpoint()
+
+    def _checkpoint(self) -> None:
+        """Spool what has been recorded so far (the SDK client exports ended spans itself)."""
+        checkpoint = getattr(self.langfuse, "checkpoint", None)
+        if not checkpoint:
+            return
+        try:
+            checkpoint()
+        except Exception:
+            pass
 
     def start_agent(self, agent_id: int, agent_name: str):
         """Create a child span for an agent run. Returns span or None."""
@@ -103,6 +121,7 @@ class PipelineTracer:
             )
             gen.end()
         span.end()
+        self._checkpoint()
 
     def start_quality_gate(self):
         """Create a child span for Quality Gate."""
@@ -123,6 +142,7 @@ class PipelineTracer:
             level=level,
         )
         span.end()
+        self._checkpoint()
 
     def finish(self, total_cost: float, total_duration: float, results: dict) -> None:
         """End root trace and flush."""
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Sanitization result cache for xhtml_sanitizer.
+
+The same body is sanitized several times per release (agent preview, publish,
+re-publish after lock contention, retries). Results are memoized on disk:
+  - <sha256(body)>.<mode>.json  sanitized body (or "unchanged") + warnings,
+                                stamped with the RULESET_VERSION it was made with
+  - pages/<page_id>.json        last body hash / warnings sanitized for a page,
+                                so the quality gate can read them without re-running
+
+Features:
+  - Key = body hash + mode; an entry made under another ruleset is a miss
+  - LRU eviction by mtime (hits touch the entry) above SANITIZE_CACHE_MAX_ENTRIES
+  - In-process layer for repeats within one run
+  - Atomic writes (tmp + os.replace); cache I/O errors never fail sanitization
+
+Settings (env):
+    XHTML_SANITIZE_CACHE_DIR      cache directory (default src/.sanitize_cache)
+    XHTML_SANITIZE_CACHE_MAX      entries kept on disk (default 256)
+
+Usage:
+    from fm_review.sanitize_cache import sanitize_xhtml_cached
+    clean_body, warnings = sanitize_xhtml_cached(raw_body, page_id="83951683")
+
+    python3 -m fm_review.sanitize_cache --page-id 83951683   # cached warnings, exit 3 if none
+    python3 -m fm_review.sanitize_cache --file body.xhtml    # warnings (cached or computed)
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from fm_review import xhtml_sanitizer
+
+SANITIZE_CACHE_DIR = Path(os.environ.get(
+    "XHTML_SANITIZE_CACHE_DIR", str(Path(__file__).parent.parent / ".sanitize_cache")))
+SANITIZE_CACHE_MAX = int(os.environ.get("XHTML_SANITIZE_CACHE_MAX", "256"))
+
+# Entries kept in memory per process
+MEMORY_ENTRIES = 32
+
+
+def body_hash(body: str) -> str:
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+class SanitizeCache:
+    """On-disk LRU of sanitization results keyed by body hash, mode and ruleset."""
+
+    def __init__(self, cache_dir: Path, max_entries: int = SANITIZE_CACHE_MAX):
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self._memory: "OrderedDict[Tuple[str, str], Tuple[str, List[str]]]" = OrderedDict()
+
+    def _entry_file(self, digest: str, mode: str) -> Path:
+        return self.cache_dir / f"{digest}.{mode}.json"
+
+    def _page_file(self, page_id: str) -> Path:
+        return self.cache_dir / "pages" / f"{page_id}.json"
+
+    def _write(self, path: Path, data: Dict[str, Any]):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def _remember(self, key: Tuple[str, str], result: Tuple[str, List[str]]):
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > MEMORY_ENTRIES:
+            self._memory.popitem(last=False)
+
+    def get(self, body: str, mode: str, digest: Optional[str] = None) -> Optional[Tuple[str, List[str]]]:
+        """Cached (sanitized_body, warnings) for body, or None."""
+        digest = digest or body_hash(body)
+        key = (digest, mode)
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            result, warnings = self._memory[key]
+            return result, list(warnings)
+        path = self._entry_file(digest, mode)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+            if entry.get("ruleset") != xhtml_sanitizer.RULESET_VERSION:
+                return None
+            os.utime(path)  # LRU: a hit makes the entry recent
+        except (OSError, ValueError):
+            return None
+        result = body if entry.get("unchanged") else entry["body"]
+        self._remember(key, (result, entry["warnings"]))
+        return result, list(entry["warnings"])
+
+    def put(self, body: str, mode: str, result: str, warnings: List[str], digest: Optional[str] = None):
+        digest = digest or body_hash(body)
+        self._remember((digest, mode), (result, list(warnings)))
+        unchanged = result == body
+        try:
+            self._write(self._entry_file(digest, mode), {
+                "ruleset": xhtml_sanitizer.RULESET_VERSION, "mode": mode,
+                "unchanged": unchanged, "body": None if unchanged else result, "warnings": warnings,
+            })
+            self._evict()
+        except OSError:
+            pass
+
+    def _evict(self):
+        entries = [e for e in os.scandir(self.cache_dir) if e.is_file() and e.name.endswith(".json")]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_entries]:
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+
+    def sanitize(self, body: str, mode: Optional[str] = None,
+                 page_id: Optional[str] = None) -> Tuple[str, List[str]]:
+        """sanitize_xhtml through the cache; records the result for page_id if given."""
+        mode = mode or xhtml_sanitizer.SANITIZER_MODE
+        digest = body_hash(body)
+        cached = self.get(body, mode, digest)
+        if cached is None:
+            # Serial below two chunks; large pages are sanitized chunk-parallel
+            cached = xhtml_sanitizer.sanitize_xhtml_parallel(body, mode=mode)
+            self.put(body, mode, cached[0], cached[1], digest)
+        if page_id:
+            try:
+                self._write(self._page_file(page_id), {
+                    "page_id": page_id, "body_sha256": digest, "mode": mode,
+                    "ruleset": xhtml_sanitizer.RULESET_VERSION, "warnings": cached[1],
+                    "sanitized_at": datetime.now().isoformat(),
+                })
+            except OSError:
+                pass
+        return cached
+
+    def page_warnings(self, page_id: str) -> Optional[List[str]]:
+        """Warnings of the last body sanitized for page_id under the current ruleset."""
+        try:
+            with open(self._page_file(page_id), encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if record.get("ruleset") != xhtml_sanitizer.RULESET_VERSION:
+            return None
+        return record.get("warnings", [])
+
+
+_default_cache: Optional[SanitizeCache] = None
+
+
+def get_cache() -> SanitizeCache:
+    """Process-wide cache in SANITIZE_CACHE_DIR."""
+    global _default_cache
+    if _default_cache is None or _default_cache.cache_dir != Path(SANITIZE_CACHE_DIR):
+        _default_cache = SanitizeCache(SANITIZE_CACHE_DIR)
+    return _default_cache
+
+
+def sanitize_xhtml_cached(body: str, mode: Optional[str] = None,
+                          page_id: Optional[str] = None) -> Tuple[str, List[str]]:
+    """Drop-in for sanitize_xhtml that memoizes results on disk."""
+    return get_cache().sanitize(body, mode=mode, page_id=page_id)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cached XHTML sanitizer warnings")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--page-id", help="Print warnings cached for the last body sanitized for this page")
+    source.add_argument("--file", help="Sanitize an XHTML file through the cache and print its warnings")
+    parser.add_argument("--mode", choices=["tokens", "stream"], help="Sanitizer mode (default: XHTML_SANITIZER_MODE)")
+    parser.add_argument("--dir", help="Cache directory (default: XHTML_SANITIZE_CACHE_DIR)")
+    args = parser.parse_args(argv)
+
+    cache = SanitizeCache(Path(args.dir)) if args.dir else get_cache()
+    if args.page_id:
+        warnings = cache.page_warnings(args.page_id)
+        if warnings is None:
+            return 3
+    else:
+        body = Path(args.file).read_text(encoding="utf-8")
+        _, warnings = cache.sanitize(body, mode=args.mode)
+    for w in warnings:
+        print(w)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,19 +9,53 @@ before publishing to Confluence:
   - AI/Agent mentions (per project policy: author = "Шаховский А.С.")
   - Invalid/unsupported Confluence macros
 
+Two modes (XHTML_SANITIZER_MODE env var, or mode= argument):
+  - tokens (default): all rules run in one tokenizing pass; the body is split once
+    into tags, text, comments and CDATA; tag rules look at parsed attributes, text
+    rules at text (AI mentions also at kept attribute values and comments), and well-formedness / element whitelist are checked on the same
+    token stream (no second XML parse). Unchanged bodies are returned as is.
+  - stream: incremental XML parse (XMLPullParser) that enforces the whitelist
+    structurally: forbidden elements and unknown macros are dropped with their
+    content, non-whitelisted elements are unwrapped, and sanitized XHTML is emitted
+    node by node (iter_sanitized_xhtml keeps memory bounded for huge bodies).
+    Code bodies (ac:plain-text-body, pre, code) are not checked for AI mentions.
+    Bodies that are not well-formed fall back to the tokens mode.
+
+sanitize_xhtml_parallel splits a large body at top-level element boundaries and
+sanitizes the chunks in a process pool (either mode). Per-chunk rule state is
+merged and the warnings are built from it exactly as in the serial path; if any
+chunk is not a clean, balanced fragment on its own (split point not top-level,
+parse error, namespace declared in another chunk) the body is sanitized serially,
+so the result always matches sanitize_xhtml.
+
 Usage:
     from fm_review.xhtml_sanitizer import sanitize_xhtml
-    clean_body = sanitize_xhtml(raw_body)
+    clean_body, warnings = sanitize_xhtml(raw_body)
+    clean_body, warnings = sanitize_xhtml(raw_body, mode="stream")
+    clean_body, warnings = sanitize_xhtml_parallel(raw_body)  # large multi-section pages
 """
 
+import hashlib
+import os
 import re
-from typing import Tuple
-from xml.etree import ElementTree
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 from xml.etree.ElementTree import ParseError as XMLParseError
+from xml.etree.ElementTree import XMLPullParser
+
+SANITIZER_MODE = os.environ.get("XHTML_SANITIZER_MODE", "tokens")
+SANITIZE_WORKERS = int(os.environ.get("XHTML_SANITIZE_WORKERS", "0")) or (os.cpu_count() or 1)
+SANITIZE_CHUNK_CHARS = int(os.environ.get("XHTML_SANITIZE_CHUNK_CHARS", str(512 * 1024)))
+
+# Elements that are never allowed in Confluence storage format
+FORBIDDEN_ELEMENTS = (
+    "script", "iframe", "object", "embed", "applet", "form", "input", "textarea", "button", "select",
+)
 
 # Tags that are never allowed in Confluence storage format
 FORBIDDEN_TAGS = re.compile(
-    r"<\s*/?\s*(script|iframe|object|embed|applet|form|input|textarea|button|select)\b[^>]*>",
+    rf"<\s*/?\s*({'|'.join(FORBIDDEN_ELEMENTS)})\b[^>]*>",
     re.IGNORECASE,
 )
 
@@ -83,82 +117,544 @@ ALLOWED_ELEMENTS = {
 }
 
 
-def sanitize_xhtml(body: str) -> Tuple[str, list]:
+# Namespace prefixes declared for storage format (anything else is unbound)
+BOUND_PREFIXES = {"ac", "ri", "xml", "xmlns"}
+
+# Predefined XML entities (anything else, e.g. &nbsp;, is undefined in XML)
+XML_ENTITIES = {"amp", "lt", "gt", "quot", "apos"}
+
+# One token per match: CDATA, comment, attribute-less leaf element with plain text
+# (<b>text</b>, one token instead of two), tag (quote-aware), entity reference, stray '<'.
+# Plain text is never tokenized; it is skipped by the regex engine.
+_TOKEN = re.compile(
+    r"<!\[CDATA\[.*?\]\](?P<cdata>>)"
+    r"|<!--.*?-(?P<comment>->)"
+    r"|<(?P<leaf>[A-Za-z_][\w.-]*)>[^<&]*</(?P=leaf)>"
+    r"|<(?P<lead>\s*)(?P<close>/?)\s*(?P<name>[A-Za-z_][\w:.-]*)"
+    r"(?P<attrs>(?:[^>\"']|\"[^\"]*\"|'[^']*')*?)(?P<tag>/?)>"
+    r"|(?P<entity>&(?:#[0-9]+;|#x[0-9a-fA-F]+;|[A-Za-z_][\w.-]*;)?)"
+    r"|(?P<junk><)",
+    re.S,
+)
+# Markup removed to get the text the text rules look at (CDATA content is text)
+_MARKUP = re.compile(r"<!--.*?-->|<!\[CDATA\[|\]\]>|<[^>]*>", re.S)
+_ATTR = re.compile(r"""\s+([^\s=/>"']+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>"']+)))?""")
+_FORBIDDEN_NAME = re.compile(rf"({'|'.join(FORBIDDEN_ELEMENTS)})\b", re.IGNORECASE)
+_HANDLER_NAME = re.compile(r"on\w+", re.IGNORECASE)
+_JS_ATTR = re.compile(r"(?:href|src|action)$", re.IGNORECASE)
+_DATA_ATTR = re.compile(r"(?:href|src)$", re.IGNORECASE)
+_JS_VALUE = re.compile(r"\s*javascript\s*:", re.IGNORECASE)
+_DATA_VALUE_UNSAFE = re.compile(r"\s*data\s*:(?!image/(png|jpeg|gif|svg\+xml))", re.IGNORECASE)
+
+
+class _Scan:
+    """State of one sanitizing pass over a body."""
+
+    unknown_elements_label = "Non-whitelisted elements"
+
+    def __init__(self, body: str):
+        self.body = body
+        self.forbidden: List[str] = []
+        self.handlers = 0
+        self.js_urls = False
+        self.data_urls = False
+        self.blue_header = False
+        self.unknown_macros: List[str] = []
+        self.unknown_elements = set()
+        self.ai_found = set()  # AI mentions in kept attribute values and comments
+        self.error: Optional[Tuple[str, int]] = None
+        self.stack: List[str] = []
+        self.prefixes = set(BOUND_PREFIXES)
+
+    def fail(self, message: str, pos: int):
+        if self.error is None:
+            self.error = (message, pos)
+
+    def check_entity(self, ref: str, pos: int):
+        if ref == "&":
+            self.fail("not well-formed (invalid token)", pos)
+        elif ref[1] != "#" and ref[1:-1] not in XML_ENTITIES:
+            self.fail(f"undefined entity {ref}", pos)
+
+    def attributes(self, tag: str, attrs: str, pos: int, self_closing: bool) -> Optional[str]:
+        """Apply attribute rules; returns rewritten attribute text, or None if unchanged."""
+        edits = []  # (start, end, replacement) within attrs
+        handler_removed = False
+        seen = set()
+        end = 0
+        for m in _ATTR.finditer(attrs):
+            if m.start() != end:
+                break
+            end = m.end()
+            name, double, single, bare = m.groups()
+            at = pos + m.start(1)
+            if ":" in name:
+                prefix, _, local = name.partition(":")
+                if prefix == "xmlns":
+                    self.prefixes.add(local)
+                elif prefix not in self.prefixes:
+                    self.fail("unbound prefix", at)
+            if name in seen:
+                self.fail("duplicate attribute", at)
+            seen.add(name)
+            value = double if double is not None else single if single is not None else bare
+            if value is None or bare is not None or "<" in value:
+                self.fail("not well-formed (invalid token)", at)
+                value = value or ""
+            if "&" in value:
+                for ref in _TOKEN.finditer(value):
+                    if ref.lastgroup == "entity":
+                        self.check_entity(ref.group(), at)
+
+            if name[:2].lower() == "on" and _HANDLER_NAME.fullmatch(name):
+                self.handlers += 1
+                handler_removed = True
+                edits.append((m.start(), m.end(), ""))
+            elif ":" in value and _JS_ATTR.search(name) and _JS_VALUE.match(value):
+                self.js_urls = True
+                edits.append((m.end(1), m.end(), '=""'))
+            elif ":" in value and _DATA_ATTR.search(name) and _DATA_VALUE_UNSAFE.match(value):
+                self.data_urls = True
+                edits.append((m.end(1), m.end(), '=""'))
+            elif name == "ac:name" and tag == "ac:structured-macro" and value not in ALLOWED_MACROS:
+                self.unknown_macros.append(value)
+            else:
+                if "rgb" in value and BLUE_HEADER.search(value):
+                    self.blue_header = True
+                self.ai_found.update(AI_MENTIONS.findall(value))
+
+        if attrs[end:].strip():
+            self.fail("not well-formed (invalid token)", pos + end)
+        if not edits:
+            return None
+        parts = []
+        last = 0
+        for start, stop, replacement in edits:
+            parts.append(attrs[last:start])
+            parts.append(replacement)
+            last = stop
+        rest = attrs[last:]
+        if handler_removed and not self_closing and not rest.strip():
+            rest = ""  # no dangling whitespace before '>'
+        parts.append(rest)
+        return "".join(parts)
+
+    def run(self) -> str:
+        body = self.body
+        stack = self.stack
+        unknown = self.unknown_elements
+        allowed = ALLOWED_ELEMENTS
+        out = []
+        last = 0
+        for m in _TOKEN.finditer(body):
+            kind = m.lastgroup
+            if kind != "tag":
+                if kind == "leaf":
+                    name = m.group("leaf")
+                    if name not in allowed:
+                        forbidden = _FORBIDDEN_NAME.match(name)
+                        if forbidden:  # drop both tags, keep the text
+                            self.forbidden.append(forbidden.group(1))
+                            out.append(body[last:m.start()])
+                            out.append(body[m.start() + len(name) + 2:m.end() - len(name) - 3])
+                            last = m.end()
+                        else:
+                            unknown.add(name)
+                elif kind == "entity":
+                    self.check_entity(m.group(), m.start())
+                elif kind == "junk":
+                    self.fail("not well-formed (invalid token)", m.start())
+                elif kind == "comment":
+                    self.ai_found.update(AI_MENTIONS.findall(m.group()))
+                continue
+
+            _, _, _, lead, close, name, attrs, self_closing, _, _ = m.groups()
+            if ":" in name:
+                prefix, _, local = name.rpartition(":")
+                if prefix not in self.prefixes:
+                    self.fail("unbound prefix", m.start())
+            else:
+                local = name
+            if local not in allowed:
+                forbidden = _FORBIDDEN_NAME.match(name)
+                if forbidden:
+                    self.forbidden.append(forbidden.group(1))
+                    out.append(body[last:m.start()])
+                    last = m.end()
+                    continue
+                if not close:
+                    unknown.add(local)
+            if lead:
+                self.fail("not well-formed (invalid token)", m.start())
+
+            if close:
+                if self_closing or (attrs and not attrs.isspace()):
+                    self.fail("not well-formed (invalid token)", m.start())
+                if not stack or stack.pop() != name:
+                    self.fail("mismatched tag", m.start())
+                continue
+            if not self_closing:
+                stack.append(name)
+            if attrs and not attrs.isspace():
+                new_attrs = self.attributes(name, attrs, m.start("attrs"), bool(self_closing))
+                if new_attrs is not None:
+                    out.append(body[last:m.start("attrs")])
+                    out.append(new_attrs)
+                    last = m.end("attrs")
+
+        if stack:
+            self.fail("mismatched tag", len(body))
+        if not out:
+            return body
+        out.append(body[last:])
+        return "".join(out)
+
+    def text_findings(self) -> Tuple[set, bool]:
+        """AI mentions (text, kept attribute values, comments) and blue header colour in text."""
+        text = _MARKUP.sub("\x00", self.body)
+        return set(AI_MENTIONS.findall(text)) | self.ai_found, bool(BLUE_HEADER.search(text))
+
+    def warnings(self) -> List[str]:
+        warnings = []
+        if self.forbidden:
+            warnings.append(f"Removed forbidden tags: {', '.join(dict.fromkeys(self.forbidden))}")
+        if self.handlers:
+            warnings.append(f"Removed {self.handlers} event handler(s)")
+        if self.js_urls:
+            warnings.append("Removed javascript: URL(s)")
+        if self.data_urls:
+            warnings.append("Removed unsafe data: URL(s)")
+        ai_found, blue_in_text = self.text_findings()
+        if ai_found:
+            warnings.append(f"AI/Agent mentions detected: {', '.join(sorted(ai_found))}")
+        if self.blue_header or blue_in_text:
+            warnings.append("Prohibited blue header color rgb(59,115,175) found — should be rgb(255,250,230)")
+        if self.unknown_macros:
+            warnings.append(f"Unknown Confluence macros: {', '.join(sorted(set(self.unknown_macros)))}")
+        if self.error:
+            message, pos = self.error
+            line = self.body.count("\n", 0, pos) + 1
+            column = pos - (self.body.rfind("\n", 0, pos) + 1)
+            warnings.append(f"XHTML well-formedness error: {message}: line {line}, column {column}")
+        elif self.unknown_elements:
+            warnings.append(f"{self.unknown_elements_label}: {', '.join(sorted(self.unknown_elements))}")
+        return warnings
+
+
+# Namespaces of storage format prefixes (declared on the wrapper root when parsing as XML)
+NAMESPACES = {
+    "ac": "http://atlassian.com/content",
+    "ri": "http://atlassian.com/resource-identifier",
+}
+
+# Elements whose text is code, not prose: emitted as CDATA / not checked for AI mentions
+CODE_ELEMENTS = {"ac:plain-text-body", "pre", "code"}
+CDATA_ELEMENTS = {"ac:plain-text-body"}
+
+_STREAM_ROOT_OPEN = "<root " + " ".join(f'xmlns:{p}="{uri}"' for p, uri in NAMESPACES.items()) + ">"
+_STREAM_ROOT_CLOSE = "</root>"
+_SKIP = object()  # stack marker: element dropped with its content
+
+
+def _escape_text(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _escape_attr(value: str) -> str:
+    return _escape_text(value).replace('"', "&quot;")
+
+
+class _Stream(_Scan):
+    """State of one streaming (XMLPullParser) pass; emits sanitized XHTML per node."""
+
+    unknown_elements_label = "Removed non-whitelisted elements"  # unwrapped, not only reported
+
+    def __init__(self):
+        super().__init__("")
+        self.prefix_of = {uri: prefix for prefix, uri in NAMESPACES.items()}
+        self.declarations: List[Tuple[str, str]] = []
+        self.open: List[Tuple[object, object]] = []  # (element, emitted name | None | _SKIP)
+        self.pending = None  # (element, "text" | "tail") whose text is not emitted yet
+        self.start_tag: Optional[str] = None  # emitted lazily, so empty elements self-close
+        self.skipping = 0
+        self.code = 0
+
+    def qname(self, name: str) -> str:
+        if name[0] != "{":
+            return name
+        uri, _, local = name[1:].partition("}")
+        prefix = self.prefix_of.get(uri)
+        return f"{prefix}:{local}" if prefix else local
+
+    def flush_start(self, self_closing: bool = False) -> str:
+        tag, self.start_tag = self.start_tag, None
+        if tag is None:
+            return ""
+        return tag + (" />" if self_closing else ">")
+
+    def text(self, text: Optional[str]) -> str:
+        if not text or self.skipping:
+            return ""
+        if self.code:
+            name = self.open[-1][1]
+            if name in CDATA_ELEMENTS:
+                return self.flush_start() + "<![CDATA[" + text.replace("]]>", "]]]]><![CDATA[>") + "]]>"
+        else:
+            self.ai_found.update(AI_MENTIONS.findall(text))
+        return self.flush_start() + _escape_text(text)
+
+    def flush_pending(self) -> str:
+        if self.pending is None:
+            return ""
+        elem, which = self.pending
+        self.pending = None
+        if which == "text":
+            return self.text(elem.text)
+        out = self.text(elem.tail)
+        self.open[-1][0].remove(elem)  # finished subtree; keep memory bounded
+        return out
+
+    def attributes(self, tag: str, attrib: dict) -> str:
+        parts = []
+        for prefix, uri in self.declarations:
+            parts.append(f' xmlns:{prefix}="{_escape_attr(uri)}"')
+        self.declarations = []
+        for key, value in attrib.items():
+            name = self.qname(key)
+            if _HANDLER_NAME.fullmatch(name):
+                self.handlers += 1
+                continue
+            if _JS_ATTR.search(name) and _JS_VALUE.match(value):
+                self.js_urls = True
+                value = ""
+            elif _DATA_ATTR.search(name) and _DATA_VALUE_UNSAFE.match(value):
+                self.data_urls = True
+                value = ""
+            else:
+                if "rgb" in value and BLUE_HEADER.search(value):
+                    self.blue_header = True
+                self.ai_found.update(AI_MENTIONS.findall(value))
+            parts.append(f' {name}="{_escape_attr(value)}"')
+        return "".join(parts)
+
+    def start(self, elem) -> str:
+        out = self.flush_start() + self.flush_pending()
+        self.pending = (elem, "text")
+        if not self.open:  # wrapper root
+            self.open.append((elem, None))
+            self.declarations = []
+            return out
+        if self.skipping:
+            self.skipping += 1
+            self.open.append((elem, _SKIP))
+            return out
+        name = self.qname(elem.tag)
+        local = name.rpartition(":")[2]
+        macro = elem.get(f"{{{NAMESPACES['ac']}}}name") if name == "ac:structured-macro" else None
+        if local.lower() in FORBIDDEN_ELEMENTS:
+            self.forbidden.append(local.lower())
+        elif macro is not None and macro not in ALLOWED_MACROS:
+            self.unknown_macros.append(macro)
+        elif local not in ALLOWED_ELEMENTS:
+            self.unknown_elements.add(local)
+            self.open.append((elem, None))  # unwrapped: content is kept
+            return out
+        else:
+            if name in CODE_ELEMENTS:
+                self.code += 1
+            self.start_tag = f"<{name}{self.attributes(name, elem.attrib)}"
+            self.open.append((elem, name))
+            return out
+        self.skipping = 1
+        self.open.append((elem, _SKIP))
+        return out
+
+    def end(self, elem) -> str:
+        out = self.flush_pending()
+        _, name = self.open.pop()
+        self.pending = (elem, "tail") if self.open else None
+        if name is _SKIP:
+            self.skipping -= 1
+            return out
+        if name is None:
+            return out
+        if name in CODE_ELEMENTS:
+            self.code -= 1
+        if self.start_tag is not None:
+            return out + self.flush_start(self_closing=True)
+        return out + f"</{name}>"
+
+    def text_findings(self) -> Tuple[set, bool]:
+        return self.ai_found, False  # text and attribute values, collected while emitting
+
+    def feed(self, pieces: Iterable[str]) -> Iterator[str]:
+        """Parse pieces inside the wrapper root and yield sanitized XHTML."""
+        parser = XMLPullParser(events=("start-ns", "start", "end"))
+
+        def drain() -> Iterator[str]:
+            for event, item in parser.read_events():
+                if event == "start-ns":
+                    prefix, uri = item
+                    self.prefix_of[uri] = prefix
+                    self.declarations.append((prefix, uri))
+                    continue
+                out = self.start(item) if event == "start" else self.end(item)
+                if out:
+                    yield out
+
+        parser.feed(_STREAM_ROOT_OPEN)
+        for piece in pieces:
+            parser.feed(piece)
+            yield from drain()
+        parser.feed(_STREAM_ROOT_CLOSE)
+        parser.close()
+        yield from drain()
+
+
+def iter_sanitized_xhtml(pieces: Iterable[str], warnings: List[str]) -> Iterator[str]:
+    """
+    Sanitize XHTML incrementally (stream mode).
+
+    Args:
+        pieces: XHTML body as an iterable of string pieces (split anywhere)
+        warnings: list that receives the warnings once the body is complete
+
+    Yields:
+        Sanitized XHTML pieces as soon as the parser has seen them.
+
+    Raises:
+        xml.etree.ElementTree.ParseError: body is not well-formed (output so far is partial)
+    """
+    stream = _Stream()
+    yield from stream.feed(pieces)
+    warnings.extend(stream.warnings())
+
+
+# Bump when sanitizer logic changes; the rule tables are hashed into RULESET_VERSION as is
+RULES_REVISION = 3
+
+
+def _ruleset_version() -> str:
+    rules = [
+        RULES_REVISION, FORBIDDEN_ELEMENTS, sorted(ALLOWED_MACROS), sorted(ALLOWED_ELEMENTS),
+        sorted(BOUND_PREFIXES), sorted(XML_ENTITIES), sorted(CODE_ELEMENTS), sorted(CDATA_ELEMENTS),
+        AI_MENTIONS.pattern, BLUE_HEADER.pattern, _HANDLER_NAME.pattern, _JS_ATTR.pattern,
+        _DATA_ATTR.pattern, _JS_VALUE.pattern, _DATA_VALUE_UNSAFE.pattern,
+    ]
+    return hashlib.sha256(repr(rules).encode()).hexdigest()[:12]
+
+
+# Identifies the rules a cached result was produced with (see sanitize_cache)
+RULESET_VERSION = _ruleset_version()
+
+
+def sanitize_xhtml(body: str, mode: Optional[str] = None) -> Tuple[str, list]:
     """
     Sanitize XHTML body for Confluence storage format.
 
     Args:
         body: Raw XHTML string
+        mode: "tokens" or "stream" (default: XHTML_SANITIZER_MODE)
 
     Returns:
         Tuple of (sanitized_body, list_of_warnings)
     """
-    warnings = []
-    result = body
-
-    # 1. Remove forbidden tags
-    forbidden_found = FORBIDDEN_TAGS.findall(result)
-    if forbidden_found:
-        warnings.append(f"Removed forbidden tags: {', '.join(set(forbidden_found))}")
-        result = FORBIDDEN_TAGS.sub("", result)
-
-    # 2. Remove event handlers
-    handlers_found = EVENT_HANDLERS.findall(result)
-    if handlers_found:
-        warnings.append(f"Removed {len(handlers_found)} event handler(s)")
-        result = EVENT_HANDLERS.sub("", result)
-        # Clean up any leftover empty spaces before closing brackets that might have been left
-        result = re.sub(r'\s+>', '>', result)
-
-    # 3. Remove javascript: URLs
-    if JS_URLS.search(result):
-        warnings.append("Removed javascript: URL(s)")
-        result = JS_URLS.sub(r'\1=""', result)
-
-    # 4. Remove unsafe data: URLs
-    if DATA_URLS_UNSAFE.search(result):
-        warnings.append("Removed unsafe data: URL(s)")
-        result = DATA_URLS_UNSAFE.sub(r'\1=""', result)
-
-    # 5. Check for AI mentions (warn but don't remove — may be in legitimate context)
-    ai_found = AI_MENTIONS.findall(result)
-    if ai_found:
-        unique = sorted(set(m if isinstance(m, str) else m[0] for m in ai_found))
-        warnings.append(f"AI/Agent mentions detected: {', '.join(unique)}")
-
-    # 6. Check blue header color
-    if BLUE_HEADER.search(result):
-        warnings.append("Prohibited blue header color rgb(59,115,175) found — should be rgb(255,250,230)")
-
-    # 7. Check for unknown Confluence macros
-    macros = re.findall(r'ac:name="([^"]+)"', result)
-    unknown = [m for m in macros if m not in ALLOWED_MACROS]
-    if unknown:
-        warnings.append(f"Unknown Confluence macros: {', '.join(sorted(set(unknown)))}")
-
-    # 8. XML well-formedness check (HIGH-A4: unclosed tags break Confluence pages)
-    # Declare Confluence namespaces so ac:/ri: prefixes don't cause false positives
-    _xml_wrapper = (
-        '<root xmlns:ac="http://atlassian.com/content"'
-        ' xmlns:ri="http://atlassian.com/resource-identifier">'
-    )
-    try:
-        tree = ElementTree.fromstring(f"{_xml_wrapper}{result}</root>")  # nosec B314 — input is our own sanitized XHTML, not untrusted
-
-        # 9. Structural validation: whitelist of allowed elements (D4)
-        unknown_elements = set()
-        for elem in tree.iter():
-            # Strip namespace URI, keep local name
-            tag = elem.tag.split("}")[-1] if "}" in elem.tag else elem.tag
-            if tag == "root":
-                continue
-            if tag not in ALLOWED_ELEMENTS:
-                unknown_elements.add(tag)
-        if unknown_elements:
-            warnings.append(
-                f"Non-whitelisted elements: {', '.join(sorted(unknown_elements))}"
-            )
-    except XMLParseError as e:
-        warnings.append(f"XHTML well-formedness error: {e}")
-
-    return result, warnings
+    if (mode or SANITIZER_MODE) == "stream":
+        warnings: List[str] = []
+        try:
+            return "".join(iter_sanitized_xhtml([body], warnings)), warnings
+        except XMLParseError:
+            pass  # not well-formed: the tokens mode sanitizes it and reports the error
+    scan = _Scan(body)
+    result = scan.run()
+    return result, scan.warnings()
+
+
+# ── Parallel chunked sanitization ────────────────────────────
+
+# Closing tags of block elements that usually end a top-level section
+_BLOCK_END = re.compile(
+    r"</(?:p|h[1-6]|table|ul|ol|dl|div|pre|blockquote|ac:structured-macro|ac:layout)>"
+)
+
+# Rule state merged from chunks (everything except the text checks, which run on the whole body)
+_CHUNK_FIELDS = ("forbidden", "handlers", "js_urls", "data_urls", "blue_header",
+                 "unknown_macros", "unknown_elements", "ai_found")
+
+
+def _depth_delta(segment: str) -> int:
+    """Element depth change over a segment (estimate; verified per chunk)."""
+    return (segment.count("<") - segment.count("<!") - segment.count("<?")
+            - 2 * segment.count("</") - segment.count("/>"))
+
+
+def split_top_level(body: str, chunk_chars: int = SANITIZE_CHUNK_CHARS) -> List[str]:
+    """Split body into chunks of about chunk_chars at top-level block element ends."""
+    chunks = []
+    start = pos = depth = 0
+    while len(body) - start > chunk_chars:
+        for m in _BLOCK_END.finditer(body, start + chunk_chars):
+            depth += _depth_delta(body[pos:m.end()])
+            pos = m.end()
+            if depth == 0:
+                break
+        else:
+            break
+        chunks.append(body[start:pos])
+        start = pos
+    chunks.append(body[start:])
+    return chunks
+
+
+def _sanitize_chunk(chunk: str, mode: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """Sanitize one chunk; None if it is not a clean, balanced fragment on its own."""
+    if mode == "stream":
+        state = _Stream()
+        try:
+            result = "".join(state.feed([chunk]))
+        except XMLParseError:
+            return None
+    else:
+        state = _Scan(chunk)
+        result = state.run()
+        if state.error:
+            return None
+    return result, {name: getattr(state, name) for name in _CHUNK_FIELDS if hasattr(state, name)}
+
+
+def sanitize_xhtml_parallel(body: str, mode: Optional[str] = None, workers: Optional[int] = None,
+                            chunk_chars: Optional[int] = None) -> Tuple[str, list]:
+    """
+    sanitize_xhtml for large bodies: chunks sanitized in a process pool.
+
+    Args:
+        body: Raw XHTML string
+        mode: "tokens" or "stream" (default: XHTML_SANITIZER_MODE)
+        workers: Pool size (default: XHTML_SANITIZE_WORKERS or CPU count)
+        chunk_chars: Target chunk size (default: XHTML_SANITIZE_CHUNK_CHARS)
+
+    Returns:
+        Tuple of (sanitized_body, list_of_warnings), identical to sanitize_xhtml
+    """
+    mode = mode or SANITIZER_MODE
+    chunks = split_top_level(body, chunk_chars or SANITIZE_CHUNK_CHARS)
+    workers = min(workers or SANITIZE_WORKERS, len(chunks))
+    if workers < 2:
+        return sanitize_xhtml(body, mode=mode)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(_sanitize_chunk, chunks, repeat(mode)))
+    if any(part is None for part in parts):
+        return sanitize_xhtml(body, mode=mode)
+
+    state = _Stream() if mode == "stream" else _Scan(body)
+    for _, fields in parts:
+        state.forbidden += fields["forbidden"]
+        state.handlers += fields["handlers"]
+        state.js_urls |= fields["js_urls"]
+        state.data_urls |= fields["data_urls"]
+        state.blue_header |= fields["blue_header"]
+        state.unknown_macros += fields["unknown_macros"]
+        state.unknown_elements |= fields["unknown_elements"]
+        state.ai_found |= fields["ai_found"]
+    result = "".join(part[0] for part in parts)
+    return (body if result == body else result), state.warnings()
@@ -22,9 +22,22 @@ def _clear_confluence_cache():
     _page_cache.invalidate()
     yield
     _page_cache.invalidate()
+
 sys.path.insert(0, str(SCRIPTS_DIR))
 
 
+@pytest.fixture(autouse=True)
+def _isolate_local_state(tmp_path):
+    """Keep publish hashes, shared rate-limit state, sanitizer cache and tracer state out of the source tree."""
+    with patch("fm_review.confluence_utils.PUBLISH_STATE_DIR", tmp_path / ".publish_state"), \
+            patch("fm_review.confluence_utils.LOCK_DIR", tmp_path / ".locks"), \
+            patch("fm_review.sanitize_cache.SANITIZE_CACHE_DIR", tmp_path / ".sanitize_cache"), \
+            patch("fm_review.langfuse_tracer.STATE_DIR", tmp_path / ".langfuse_state"), \
+            patch("fm_review.langfuse_spool.SPOOL_DIR", tmp_path / ".langfuse_state"), \
+            patch("fm_review.langfuse_spool.SPOOL_AUTODRAIN", False):
+        yield
+
+
 SAMPLE_XHTML = """<p><strong>Код проекта:</strong> FM-LS-PROFIT
 <strong>Версия ФМ:</strong> 1.0.2
 <strong>Дата:</strong> 10.02.2026
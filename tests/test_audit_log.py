@@ -0,0 +1,160 @@
+"""
+Tests for src/fm_review/audit_log.py
+
+Covers: buffered writes, sidecar index, rotation, indexed queries, catch-up, CLI.
+"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from fm_review.audit_log import AuditLog, list_pages, main
+
+
+def _entry(agent="Agent7_Publisher", version=1, **extra):
+    return {"timestamp": datetime.now().isoformat(), "page_id": "p1", "action": "update",
+            "agent": agent, "version_number": version, **extra}
+
+
+@pytest.fixture
+def log(tmp_path):
+    return AuditLog(tmp_path, "p1")
+
+
+# ── Writer Tests ──────────────────────────────────────────
+
+class TestAuditLogWriter:
+    def test_write_through_by_default(self, log):
+        """With buffer size 1 each append is on disk immediately."""
+        log.append(_entry())
+        lines = log.active_file.read_text().splitlines()
+        assert json.loads(lines[0])["agent"] == "Agent7_Publisher"
+
+    def test_buffered_until_full(self, tmp_path):
+        """Entries are held until the buffer fills, then written in one batch."""
+        log = AuditLog(tmp_path, "p1", buffer_size=3, fsync="never")
+        log.append(_entry(version=1))
+        log.append(_entry(version=2))
+        assert not log.active_file.exists()
+        log.append(_entry(version=3))
+        assert len(log.active_file.read_text().splitlines()) == 3
+
+    def test_flush_writes_pending(self, tmp_path):
+        """flush writes a partially filled buffer."""
+        log = AuditLog(tmp_path, "p1", buffer_size=10)
+        log.append(_entry())
+        log.flush()
+        assert len(log.active_file.read_text().splitlines()) == 1
+
+    def test_index_offsets(self, log):
+        """Each write appends index rows with the byte offsets of its entries."""
+        log.append(_entry(agent="A", version=1))
+        log.append(_entry(agent="B", version=2))
+        rows = [json.loads(line) for line in log.index_file.read_text().splitlines()]
+        assert [row[2:4] for row in rows] == [["A", 1], ["B", 2]]
+        assert rows[-1][1] == log.active_file.stat().st_size
+        with open(log.active_file, "rb") as f:
+            f.seek(rows[1][0])
+            assert json.loads(f.readline())["agent"] == "B"
+
+    def test_write_does_not_rewrite_index(self, log):
+        """Appends leave existing index bytes untouched."""
+        log.append(_entry(version=1))
+        before = log.index_file.read_bytes()
+        log.append(_entry(version=2))
+        assert log.index_file.read_bytes().startswith(before)
+
+    def test_rotate_by_size(self, tmp_path):
+        """Active segment is rotated once it exceeds max_bytes."""
+        log = AuditLog(tmp_path, "p1", max_bytes=1)
+        log.append(_entry(version=1))
+        log.append(_entry(version=2))
+        assert (tmp_path / "confluence_p1.1.jsonl").exists()
+        assert [e["version_number"] for e in log.query(agent="Agent7_Publisher")] == [1, 2]
+
+    def test_old_segments_pruned(self, tmp_path):
+        """Rotated segments past max_segments are deleted with their index."""
+        log = AuditLog(tmp_path, "p1", max_bytes=1, max_segments=2)
+        for version in range(1, 6):
+            log.append(_entry(version=version))
+        assert sorted(p.name for p in tmp_path.glob("confluence_p1.*.jsonl")) == [
+            "confluence_p1.3.idx.jsonl", "confluence_p1.3.jsonl",
+            "confluence_p1.4.idx.jsonl", "confluence_p1.4.jsonl",
+            "confluence_p1.idx.jsonl",
+        ]
+        assert [e["version_number"] for e in log.entries()] == [3, 4, 5]
+
+    def test_rotate_by_age(self, tmp_path):
+        """Active segment is rotated when its first entry is older than max_days."""
+        log = AuditLog(tmp_path, "p1", max_days=1)
+        old = (datetime.now() - timedelta(days=2)).isoformat()
+        log.append(_entry(version=1, timestamp=old))
+        log.append(_entry(version=2))
+        assert (tmp_path / "confluence_p1.1.jsonl").exists()
+        assert len(log.active_file.read_text().splitlines()) == 1
+
+
+# ── Query Tests ───────────────────────────────────────────
+
+class TestAuditLogQuery:
+    def test_query_by_agent_and_version(self, log):
+        """query intersects agent and version matches."""
+        log.append(_entry(agent="A", version=1))
+        log.append(_entry(agent="B", version=1))
+        log.append(_entry(agent="A", version=2))
+        assert [e["version_number"] for e in log.query(agent="A")] == [1, 2]
+        assert [e["agent"] for e in log.query(version=1)] == ["A", "B"]
+        assert [e["agent"] for e in log.query(agent="B", version=1)] == ["B"]
+        assert log.query(agent="C") == []
+
+    def test_catch_up_legacy_log(self, tmp_path):
+        """A log written without an index is indexed on first access."""
+        with open(tmp_path / "confluence_p1.jsonl", "w") as f:
+            f.write(json.dumps(_entry(agent="Agent2")) + "\n")
+            f.write("not json\n")
+        log = AuditLog(tmp_path, "p1")
+        assert log.agents() == {"Agent2"}
+        log.append(_entry(agent="Agent7_Publisher", version=5))
+        assert [e["agent"] for e in log.query(version=5)] == ["Agent7_Publisher"]
+        assert len(log.entries()) == 2
+
+    def test_truncated_active_reindexed(self, log):
+        """A truncated active segment is reindexed instead of read at stale offsets."""
+        log.append(_entry(agent="A"))
+        log.append(_entry(agent="B"))
+        log.active_file.write_text(json.dumps(_entry(agent="C")) + "\n")
+        assert log.agents() == {"C"}
+
+    def test_rotated_segment_without_index(self, tmp_path):
+        """A rotated segment whose index was lost is indexed on read."""
+        log = AuditLog(tmp_path, "p1", max_bytes=1)
+        log.append(_entry(agent="A", version=1))
+        log.append(_entry(agent="B", version=2))
+        (tmp_path / "confluence_p1.1.idx.jsonl").unlink()
+        assert [e["agent"] for e in log.query(version=1)] == ["A"]
+        assert log.agents() == {"A", "B"}
+
+    def test_missing_dir(self, tmp_path):
+        """Reading a log in a missing directory returns nothing and creates nothing."""
+        log = AuditLog(tmp_path / "none", "p1")
+        assert log.entries() == [] and log.agents() == set()
+        assert not (tmp_path / "none").exists()
+
+
+# ── CLI Tests ─────────────────────────────────────────────
+
+class TestCli:
+    def test_agents_excluded(self, tmp_path, capsys):
+        """--agents prints agents across pages minus excluded ones."""
+        AuditLog(tmp_path, "p1").append(_entry(agent="Agent7_Publisher"))
+        AuditLog(tmp_path, "p2").append(_entry(agent="Agent1_Architect"))
+        (tmp_path / "quality_gate_overrides.jsonl").write_text("{}\n")
+        assert list_pages(tmp_path) == ["p1", "p2"]
+        assert main(["--dir", str(tmp_path), "--agents", "--exclude", "Agent7_Publisher,system"]) == 0
+        assert capsys.readouterr().out.split() == ["Agent1_Architect"]
+
+    def test_version_query(self, tmp_path, capsys):
+        """--version prints matching entries as JSONL."""
+        AuditLog(tmp_path, "p1").append(_entry(version=42))
+        assert main(["--dir", str(tmp_path), "--page-id", "p1", "--version", "42"]) == 0
+        assert json.loads(capsys.readouterr().out)["version_number"] == 42
@@ -0,0 +1,120 @@
+"""
+Tests for src/fm_review/confluence_history.py
+
+Covers: merging audit log and backup index, version/time lookup, diff, restore.
+"""
+import json
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from fm_review.confluence_history import PageHistory, main
+from fm_review.confluence_utils import ConfluenceAPIError, ConfluenceBackup
+
+
+@pytest.fixture
+def history_dirs(tmp_path):
+    """Point backup store and audit log at tmp_path."""
+    with patch("fm_review.confluence_utils.BACKUP_DIR", tmp_path / "backups"), \
+            patch("fm_review.confluence_utils.AUDIT_LOG_DIR", tmp_path / "audit"):
+        yield tmp_path
+
+
+def _audit(tmp_path, page_id, **entry):
+    audit_dir = tmp_path / "audit"
+    audit_dir.mkdir(exist_ok=True)
+    with open(audit_dir / f"confluence_{page_id}.jsonl", "a") as f:
+        f.write(json.dumps({"page_id": page_id, "agent": "Agent7_Publisher",
+                            "action": "update", **entry}) + "\n")
+
+
+@pytest.fixture
+def populated(history_dirs, confluence_response):
+    """v41 backed up, v42 published by us (backed up later), v43 published by us."""
+    backup = ConfluenceBackup("p1")
+    with patch("fm_review.confluence_utils.datetime") as mock_dt:
+        mock_dt.now.return_value = datetime(2026, 2, 10, 9, 0)
+        backup.save(confluence_response(version=41, body="<h1>A</h1><p>one</p>"))
+        mock_dt.now.return_value = datetime(2026, 2, 12, 9, 0)
+        backup.save(confluence_response(version=42, body="<h1>A</h1><p>two</p>"))
+    _audit(history_dirs, "p1", timestamp="2026-02-10T09:00:01", version_number=42,
+           version_message="second", body_blob=backup.store_blob("<h1>A</h1><p>two</p>"))
+    _audit(history_dirs, "p1", timestamp="2026-02-12T09:00:01", version_number=43,
+           version_message="third", body_blob=backup.store_blob("<h1>A</h1><h1>B</h1><p>three</p>"))
+    return history_dirs
+
+
+class TestPageHistory:
+    def test_versions_merged(self, populated):
+        """Backup and audit entries merge into one record per version."""
+        history = PageHistory("p1")
+        versions = history.versions()
+        assert [v["version"] for v in versions] == [41, 42, 43]
+        assert versions[1]["live_since"] == "2026-02-10T09:00:01"
+        assert versions[1]["agent"] == "Agent7_Publisher"
+        assert versions[1]["backup_id"] is not None
+        assert versions[2]["backup_id"] is None
+
+    def test_page_at_version(self, populated):
+        """Published-only version body comes from the audit blob."""
+        page = PageHistory("p1").page_at_version(43)
+        assert page["body"]["storage"]["value"] == "<h1>A</h1><h1>B</h1><p>three</p>"
+        assert page["version"]["message"] == "third"
+        assert "title" not in page
+
+    def test_version_at_time(self, populated):
+        """version_at returns the version live at a point in time."""
+        history = PageHistory("p1")
+        assert history.version_at(datetime(2026, 2, 9)) is None
+        assert history.version_at(datetime(2026, 2, 11)) == 42
+        assert history.version_at(datetime(2026, 3, 1)) == 43
+
+    def test_version_at_time_with_offset(self, populated):
+        """An aware time is converted to local time before comparing (stamps are naive local)."""
+        history = PageHistory("p1")
+        after = datetime(2026, 2, 12, 9, 0, 30).astimezone()  # v43 went live at 09:00:01 local
+        before = datetime(2026, 2, 12, 8, 59, 30).astimezone()
+        for tz in (timezone(timedelta(hours=-12)), timezone(timedelta(hours=14)), timezone.utc):
+            assert history.version_at(after.astimezone(tz)) == 43
+            assert history.version_at(before.astimezone(tz)) == 42
+
+    def test_diff(self, populated):
+        """diff reports section changes and a unified diff."""
+        result = PageHistory("p1").diff(42, 43)
+        assert result["sections"]["added"] == ["B"]
+        assert "+<h1>A</h1><h1>B</h1><p>three</p>" in result["unified"]
+
+    def test_unknown_version_raises(self, populated):
+        """resolve raises for a version without a local body."""
+        with pytest.raises(ConfluenceAPIError, match="not available locally"):
+            PageHistory("p1").resolve(version=7)
+
+    def test_restore_single_put(self, populated):
+        """restore sends exactly one PUT with the stored body, under the lock."""
+        history = PageHistory("p1")
+        client = MagicMock()
+        client.restore.return_value = {"version": {"number": 44}}
+        result = history.restore(history.resolve(version=41), client=client)
+        assert result["version"]["number"] == 44
+        assert client.lock.called
+        page, message = client.restore.call_args[0]
+        assert page["body"]["storage"]["value"] == "<h1>A</h1><p>one</p>"
+        assert message == "RESTORE to version 41"
+        assert client.restore.call_args[1]["action"] == "restore"
+
+
+class TestCli:
+    def test_list(self, populated, capsys):
+        assert main(["--page-id", "p1", "--list"]) == 0
+        out = capsys.readouterr().out
+        assert "v43" in out and "Total: 3 version(s)" in out
+
+    def test_at_dry_run(self, populated, capsys):
+        assert main(["--page-id", "p1", "--at", "2026-02-11T00:00", "--restore", "--dry-run"]) == 0
+        out = capsys.readouterr().out
+        assert "Version:  42" in out and "DRY RUN" in out
+
+    def test_no_backups_error(self, history_dirs, capsys):
+        assert main(["--page-id", "empty"]) == 1
+        assert "No backups" in capsys.readouterr().err
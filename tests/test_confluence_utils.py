@@ -11,6 +11,7 @@ from unittest.mock import MagicMock, patch
 import pytest
 
 from fm_review.confluence_utils import (
+    BLOB_GRACE_SECONDS,
     RETRYABLE_CODES,
     ConfluenceAPIError,
     ConfluenceBackup,
@@ -31,8 +32,9 @@ class TestConfluenceLock:
             lock = ConfluenceLock("test_page", timeout=5)
             assert lock.acquire() is True
             lock.release()
-            # Lock file cleaned up
-            assert not (tmp_path / "confluence_test_page.lock").exists()
+            # Lock file persists (no unlink race), holder info and ticket cleared
+            assert (tmp_path / "confluence_test_page.lock").read_text() == ""
+            assert os.listdir(tmp_path / "confluence_test_page.queue") == []
 
     def test_context_manager(self, tmp_path):
         """Lock works as context manager."""
@@ -40,8 +42,10 @@ class TestConfluenceLock:
             with ConfluenceLock("test_page", timeout=5):
                 lock_file = tmp_path / "confluence_test_page.lock"
                 assert lock_file.exists()
-            # After exit, lock file removed
-            assert not lock_file.exists()
+                assert len(os.listdir(tmp_path / "confluence_test_page.queue")) == 1
+            # After exit, lock is free
+            assert lock_file.read_text() == ""
+            assert os.listdir(tmp_path / "confluence_test_page.queue") == []
 
     def test_lock_writes_info(self, tmp_path):
         """Lock file contains JSON with page_id and pid."""
@@ -71,21 +75,226 @@ class TestConfluenceLock:
 
             lock1.release()
 
+    def test_waiter_wakes_on_release(self, tmp_path):
+        """A blocked waiter acquires right after release, without polling delay."""
+        import threading
+        with patch("fm_review.confluence_utils.LOCK_DIR", tmp_path):
+            holder = ConfluenceLock("handoff_page", timeout=5)
+            holder.acquire()
+            waiter = ConfluenceLock("handoff_page", timeout=5)
+            result = {}
+            t = threading.Thread(target=lambda: result.setdefault("ok", waiter.acquire()))
+            t.start()
+            time.sleep(0.2)
+            released_at = time.monotonic()
+            holder.release()
+            t.join(timeout=5)
+            assert result["ok"] is True
+            assert time.monotonic() - released_at < 0.5
+            assert waiter.wait_seconds >= 0.2
+            waiter.release()
+
+    def test_fifo_order(self, tmp_path):
+        """Waiters get the lock in the order they queued."""
+        import threading
+        with patch("fm_review.confluence_utils.LOCK_DIR", tmp_path):
+            holder = ConfluenceLock("fifo_page", timeout=5)
+            holder.acquire()
+            order = []
+
+            def worker(n):
+                lock = ConfluenceLock("fifo_page", timeout=5)
+                assert lock.acquire()
+                order.append(n)
+                lock.release()
+
+            threads = []
+            for n in range(3):
+                t = threading.Thread(target=worker, args=(n,))
+                t.start()
+                threads.append(t)
+                time.sleep(0.1)  # queue in a known order
+            holder.release()
+            for t in threads:
+                t.join(timeout=5)
+            assert order == [0, 1, 2]
+
+    def test_stale_ticket_removed(self, tmp_path):
+        """A ticket left by a dead process does not block the queue."""
+        with patch("fm_review.confluence_utils.LOCK_DIR", tmp_path):
+            queue = tmp_path / "confluence_stale_page.queue"
+            queue.mkdir()
+            (queue / "00000000000000000001_999999_1").write_text("")
+            lock = ConfluenceLock("stale_page", timeout=1)
+            assert lock.acquire() is True
+            assert not (queue / "00000000000000000001_999999_1").exists()
+            lock.release()
+
+    def test_timeout_reports_holder_and_metrics(self, tmp_path):
+        """Timeout error names the holder pid; metrics count the timeout."""
+        from fm_review.confluence_utils import get_lock_metrics
+        with patch("fm_review.confluence_utils.LOCK_DIR", tmp_path):
+            holder = ConfluenceLock("metrics_page", timeout=5)
+            holder.acquire()
+            with pytest.raises(ConfluenceLockError, match=f"Holder pid {os.getpid()} \\(running\\)"):
+                with ConfluenceLock("metrics_page", timeout=0.2):
+                    pass
+            holder.release()
+            # Abandoned waiter must not keep the lock
+            follower = ConfluenceLock("metrics_page", timeout=1)
+            assert follower.acquire() is True
+            follower.release()
+        metrics = get_lock_metrics()["metrics_page"]
+        assert metrics["timeouts"] == 1
+        assert metrics["acquired"] >= 2
+        assert metrics["max_wait_seconds"] >= 0.2
+
+
+# ── Reader/Writer Lock Tests ───────────────────────────────
+
+
+class TestSharedLock:
+    def test_readers_run_concurrently(self, tmp_path):
+        """Several shared locks can be held at the same time."""
+        with patch("fm_review.confluence_utils.LOCK_DIR", tmp_path):
+            r1 = ConfluenceLock("rw_page", timeout=1, shared=True)
+            r2 = ConfluenceLock("rw_page", timeout=1, shared=True)
+            assert r1.acquire() is True
+            assert r2.acquire() is True
+            r1.release()
+            r2.release()
+
+    def test_writer_waits_for_readers(self, tmp_path):
+        """Exclusive lock is not granted while a reader holds the page."""
+        with patch("fm_review.confluence_utils.LOCK_DIR", tmp_path):
+            reader = ConfluenceLock("rw_page", timeout=1, shared=True)
+            reader.acquire()
+            assert ConfluenceLock("rw_page", timeout=0.2).acquire() is False
+            reader.release()
+            writer = ConfluenceLock("rw_page", timeout=1)
+            assert writer.acquire() is True
+            writer.release()
+
+    def test_reader_waits_for_writer(self, tmp_path):
+        """Shared lock is not granted while a writer holds the page."""
+        with patch("fm_review.confluence_utils.LOCK_DIR", tmp_path):
+            writer = ConfluenceLock("rw_page", timeout=1)
+            writer.acquire()
+            assert ConfluenceLock("rw_page", timeout=0.2, shared=True).acquire() is False
+            writer.release()
+
+    def test_queued_writer_not_starved(self, tmp_path):
+        """A reader arriving after a queued writer waits behind it (FIFO)."""
+        import threading
+        with patch("fm_review.confluence_utils.LOCK_DIR", tmp_path):
+            reader = ConfluenceLock("rw_page", timeout=5, shared=True)
+            reader.acquire()
+            order = []
+
+            def run(lock, label):
+                assert lock.acquire()
+                order.append(label)
+                time.sleep(0.05)
+                lock.release()
+
+            w = threading.Thread(target=run, args=(ConfluenceLock("rw_page", timeout=5), "writer"))
+            w.start()
+            time.sleep(0.1)
+            r = threading.Thread(target=run, args=(ConfluenceLock("rw_page", timeout=5, shared=True), "reader"))
+            r.start()
+            time.sleep(0.1)
+            assert order == []
+            reader.release()
+            w.join(timeout=5)
+            r.join(timeout=5)
+            assert order == ["writer", "reader"]
+
+    def test_client_lock_shared(self):
+        """ConfluenceClient.lock(shared=True) returns a shared lock."""
+        client = ConfluenceClient("https://test.example.com", "token", "12345")
+        assert client.lock(shared=True).shared is True
+        assert client.lock().shared is False
+
 
 # ── Backup Tests ────────────────────────────────────────────
 
 
 class TestConfluenceBackup:
-    def test_save_creates_file(self, tmp_path, confluence_response):
-        """Backup.save creates a JSON file."""
+    def test_save_creates_entry(self, tmp_path, confluence_response):
+        """Backup.save stores a compressed blob and an index entry."""
         with patch("fm_review.confluence_utils.BACKUP_DIR", tmp_path):
             backup = ConfluenceBackup("test_page")
             page_data = confluence_response()
-            path = backup.save(page_data)
-            assert path.exists()
-            assert path.suffix == ".json"
-            saved = json.loads(path.read_text())
-            assert saved["version"]["number"] == 42
+            backup_id = backup.save(page_data)
+            assert backup_id.startswith("v42_")
+            assert not (tmp_path / "test_page" / backup_id).exists()
+            assert len(list((tmp_path / "test_page" / "blobs").glob("*.gz"))) == 1
+            saved = backup.load(backup_id)
+            assert saved == page_data
+
+    def test_identical_bodies_deduplicated(self, tmp_path, confluence_response):
+        """Same body across versions is stored once."""
+        with patch("fm_review.confluence_utils.BACKUP_DIR", tmp_path):
+            backup = ConfluenceBackup("dedup_page")
+            for i in range(3):
+                backup.save(confluence_response(version=i))
+            backup.save(confluence_response(version=3, body="<p>Other</p>"))
+            assert len(list((tmp_path / "dedup_page" / "blobs").glob("*.gz"))) == 2
+            assert len(backup.list_backups()) == 4
+            assert backup.get_latest()["body"]["storage"]["value"] == "<p>Other</p>"
+
+    def test_cleanup_removes_unreferenced_blobs(self, tmp_path, confluence_response):
+        """Rotated-out entries drop blobs nothing else references."""
+        with patch("fm_review.confluence_utils.BACKUP_DIR", tmp_path):
+            with patch("fm_review.confluence_utils.MAX_BACKUPS", 2):
+                backup = ConfluenceBackup("gc_page")
+                for i in range(4):
+                    backup.save(confluence_response(version=i, body=f"<p>{i}</p>"))
+                assert len(list((tmp_path / "gc_page" / "blobs").glob("*.gz"))) == 2
+                assert [b.split("_")[0] for b in backup.list_backups()] == ["v3", "v2"]
+
+    def test_cleanup_keeps_audited_blobs_drops_orphans(self, tmp_path, confluence_response):
+        """Published bodies live while an audit entry references them; stale orphans go."""
+        from fm_review.audit_log import get_audit_log
+        with patch("fm_review.confluence_utils.BACKUP_DIR", tmp_path / "backups"), \
+                patch("fm_review.confluence_utils.AUDIT_LOG_DIR", tmp_path / "audit"), \
+                patch("fm_review.confluence_utils.MAX_BACKUPS", 2):
+            backup = ConfluenceBackup("orphan_page")
+            published = backup.store_blob("<p>published</p>")
+            orphan = backup.store_blob("<p>edited in Confluence after us</p>")
+            fresh = backup.store_blob("<p>audit entry not written yet</p>")
+            for digest in (published, orphan):
+                old = time.time() - 2 * BLOB_GRACE_SECONDS
+                os.utime(backup.blob_dir / f"{digest}.gz", (old, old))
+            get_audit_log(tmp_path / "audit", "orphan_page").append(
+                {"action": "update", "version_number": 5, "body_blob": published})
+            for i in range(3):
+                backup.save(confluence_response(version=i, body=f"<p>{i}</p>"))
+            blobs = {b.name[:-3] for b in backup.blob_dir.glob("*.gz")}
+            assert published in blobs and fresh in blobs
+            assert orphan not in blobs
+            assert len(blobs) == 4  # two kept entries + published + fresh
+
+    def test_legacy_json_backups_migrated(self, tmp_path, confluence_response):
+        """Pre-index v<N>_<ts>.json files are imported into the store."""
+        legacy_dir = tmp_path / "legacy_page"
+        legacy_dir.mkdir()
+        (legacy_dir / "v7_20260101_000000.json").write_text(
+            json.dumps(confluence_response(version=7)))
+        with patch("fm_review.confluence_utils.BACKUP_DIR", tmp_path):
+            backup = ConfluenceBackup("legacy_page")
+            assert backup.get_latest()["version"]["number"] == 7
+            (entry,) = backup.entries()
+            assert entry["id"] == "v7_20260101_000000"
+            assert entry["saved_at"] == "2026-01-01T00:00:00"
+            assert not (legacy_dir / "v7_20260101_000000.json").exists()
+
+    def test_load_unknown_raises(self, tmp_path):
+        """load raises for an unknown backup id."""
+        with patch("fm_review.confluence_utils.BACKUP_DIR", tmp_path):
+            backup = ConfluenceBackup("missing_page")
+            with pytest.raises(ConfluenceAPIError, match="Backup not found"):
+                backup.load(tmp_path / "missing_page" / "v1_nope")
 
     def test_get_latest(self, tmp_path, confluence_response):
         """get_latest returns most recent backup."""
@@ -126,8 +335,7 @@ class TestConfluenceBackup:
             backups = backup.list_backups()
             assert len(backups) == 3
             # Most recent first
-            names = [b.name for b in backups]
-            assert names == sorted(names, reverse=True)
+            assert backups == sorted(backups, reverse=True)
 
 
 # ── Client Tests ────────────────────────────────────────────
@@ -168,7 +376,7 @@ class TestConfluenceClient:
                     agent_name="Agent7_Publisher"
                 )
             assert backup_path is not None
-            assert backup_path.exists()
+            assert backup_path in client.backup.list_backups()
 
     def test_update_page_increments_version(self, tmp_path, mock_urllib):
         """update_page sends version.number = current + 1."""
@@ -208,6 +416,7 @@ class TestConfluenceClient:
                 assert entry["action"] == "update"
                 assert entry["agent"] == "Agent7_Publisher"
                 assert entry["page_id"] == "12345"
+                assert client.backup.read_blob(entry["body_blob"]) == "<p>New</p>"
 
     def test_url_trailing_slash_stripped(self, mock_urllib):
         """Trailing slash in URL is stripped."""
@@ -320,6 +529,16 @@ class TestRollback:
                     result = client.rollback(backup_path)
                     assert result["version"]["number"] == 44
 
+    def test_restore_without_title_keeps_current(self, tmp_path, mock_urllib, confluence_response):
+        """A stored page without a (known) title is restored under the current title."""
+        mock_urllib.return_value.read.return_value = json.dumps(confluence_response(version=43)).encode()
+        with patch("fm_review.confluence_utils.BACKUP_DIR", tmp_path):
+            client = ConfluenceClient("https://test.example.com", "token", "12345")
+        with patch.object(client, "_audit_log"):
+            client.restore({"title": None, "body": {"storage": {"value": "<p>x</p>"}}}, "restore")
+        put = json.loads(mock_urllib.call_args_list[-1][0][0].data)
+        assert put["title"] == confluence_response()["title"]
+
     def test_rollback_no_backup_raises(self, tmp_path):
         """rollback raises error when no backup available."""
         with patch("fm_review.confluence_utils.BACKUP_DIR", tmp_path / "empty"):
@@ -418,6 +637,75 @@ class TestRateLimiter:
         elapsed = time.monotonic() - t0
         assert elapsed < 0.05
 
+    def test_throttle_halves_rate(self):
+        """on_throttle shrinks the rate multiplicatively, bounded by the minimum."""
+        from fm_review.confluence_utils import RATE_LIMIT_MIN_RPS
+        limiter = _RateLimiter(rps=4.0)
+        limiter.on_throttle()
+        assert limiter.rate == 2.0
+        for _ in range(10):
+            limiter.on_throttle()
+        assert limiter.rate == RATE_LIMIT_MIN_RPS
+
+    def test_success_grows_rate_back(self):
+        """on_success grows the rate additively up to the configured maximum."""
+        from fm_review.confluence_utils import RATE_LIMIT_INCREASE_RPS
+        limiter = _RateLimiter(rps=4.0)
+        limiter.on_throttle()
+        limiter.on_success()
+        assert limiter.rate == 2.0 + RATE_LIMIT_INCREASE_RPS
+        for _ in range(100):
+            limiter.on_success()
+        assert limiter.rate == 4.0
+
+    def test_retry_after_blocks_acquire(self):
+        """acquire waits out the Retry-After pause."""
+        limiter = _RateLimiter(rps=100.0)
+        limiter.on_throttle(retry_after=0.1)
+        t0 = time.monotonic()
+        limiter.acquire()
+        assert time.monotonic() - t0 >= 0.08
+
+    def test_parse_retry_after(self):
+        """Retry-After accepts delta-seconds and HTTP-date; garbage is ignored."""
+        from email.utils import formatdate
+
+        from fm_review.confluence_utils import _parse_retry_after
+        assert _parse_retry_after("3") == 3.0
+        assert _parse_retry_after(None) is None
+        assert _parse_retry_after("soon") is None
+        assert 8 <= _parse_retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
+
+    def test_shared_state_across_instances(self, tmp_path):
+        """Shared limiters (one per process in practice) see the same budget."""
+        with patch("fm_review.confluence_utils.LOCK_DIR", tmp_path):
+            a = _RateLimiter(rps=4.0, shared=True)
+            b = _RateLimiter(rps=4.0, shared=True)
+            a.on_throttle()
+            assert b.rate == 2.0
+            for _ in range(2):
+                b.acquire()
+            t0 = time.monotonic()
+            a.acquire()
+            assert time.monotonic() - t0 >= 0.3  # bucket drained by b
+            assert (tmp_path / "confluence_rate.json").exists()
+
+    def test_do_request_reports_429(self):
+        """429 with Retry-After is reported to the limiter before retrying."""
+        import urllib.error
+
+        error = urllib.error.HTTPError(
+            "https://test.example.com", 429, "Too Many Requests", {"Retry-After": "2"}, MagicMock()
+        )
+        with patch("urllib.request.urlopen", side_effect=error):
+            with patch("fm_review.confluence_utils._rate_limiter") as mock_rl:
+                with patch("fm_review.confluence_utils.RETRY_BACKOFF_BASE", 0.01):
+                    client = ConfluenceClient("https://test.example.com", "token", "12345")
+                    with pytest.raises(ConfluenceAPIError):
+                        client.get_page()
+        mock_rl.on_throttle.assert_called_with(2.0)
+        assert not mock_rl.on_success.called
+
     def test_rate_limiter_called_in_do_request(self, mock_urllib):
         """_do_request calls rate limiter before making request."""
         with patch("fm_review.confluence_utils._rate_limiter") as mock_rl:
@@ -533,13 +821,12 @@ class TestLockErrorPaths:
             assert lock.lock_fd is None
 
     def test_release_handles_unlink_error(self, tmp_path):
-        """release handles exception on file cleanup."""
+        """release handles exception on ticket cleanup."""
         with patch("fm_review.confluence_utils.LOCK_DIR", tmp_path):
             lock = ConfluenceLock("unlink_page", timeout=5)
             lock.acquire()
-            lock_file = lock.lock_file
-            # Remove the file before release tries to unlink it
-            lock_file.unlink()
+            # Remove the ticket before release tries to unlink it
+            lock._ticket.unlink()
             lock.release()  # Should not raise
             assert lock.lock_fd is None
 
@@ -616,3 +903,165 @@ class TestAuditLogError:
                 client = ConfluenceClient("https://test.example.com", "token", "12345")
                 # Should not raise despite audit log failure
                 client.update_page("<p>New</p>", "test", agent_name="test")
+
+
+# ── Batch Publish Tests ───────────────────────────────────
+
+
+class TestBatchPublish:
+    ENV = {
+        "CONFLUENCE_URL": "https://test.example.com",
+        "CONFLUENCE_TOKEN": "test-token",
+    }
+
+    def _urlopen(self, confluence_response, fail_put_for=(), calls=None):
+        """Fake urlopen: GET/PUT per page id, PUT fails for pages in fail_put_for."""
+        import urllib.error
+
+        def side_effect(req, *args, **kwargs):
+            page_id = req.full_url.split("/rest/api/content/")[1].split("?")[0]
+            if calls is not None:
+                calls.append((req.get_method(), page_id, req.data))
+            if req.data is not None and page_id in fail_put_for:
+                error = urllib.error.HTTPError(req.full_url, 403, "Forbidden", {}, MagicMock())
+                error.read = MagicMock(return_value=b"Forbidden")
+                raise error
+            resp = MagicMock()
+            version = 43 if req.data is not None else 42
+            resp.read.return_value = json.dumps(
+                confluence_response(page_id=page_id, version=version)
+            ).encode()
+            resp.__enter__ = MagicMock(return_value=resp)
+            resp.__exit__ = MagicMock(return_value=False)
+            return resp
+
+        return side_effect
+
+    def test_batch_publish_success(self, tmp_path, confluence_response):
+        """All pages are backed up and updated; results keep input order."""
+        from fm_review.confluence_utils import batch_publish
+        calls = []
+        with patch.dict(os.environ, self.ENV), \
+                patch("urllib.request.urlopen", side_effect=self._urlopen(confluence_response, calls=calls)), \
+                patch("fm_review.confluence_utils.BACKUP_DIR", tmp_path / "backup"), \
+                patch("fm_review.confluence_utils.AUDIT_LOG_DIR", tmp_path / "audit"), \
+                patch("fm_review.confluence_utils.LOCK_DIR", tmp_path / "locks"):
+            results = batch_publish(
+                [("222", "<p>B</p>", "b"), ("111", "<p>A</p>", "a")],
+                agent_name="Agent7_Publisher"
+            )
+        assert [r["id"] for r in results] == ["222", "111"]
+        puts = [c for c in calls if c[0] == "PUT"]
+        assert sorted(c[1] for c in puts) == ["111", "222"]
+        assert (tmp_path / "backup" / "111").exists()
+        assert (tmp_path / "backup" / "222").exists()
+
+    def test_batch_publish_rolls_back_on_failure(self, tmp_path, confluence_response):
+        """If one PUT fails, already updated pages are rolled back."""
+        from fm_review.confluence_utils import batch_publish
+        calls = []
+        side_effect = self._urlopen(confluence_response, fail_put_for={"222"}, calls=calls)
+        with patch.dict(os.environ, self.ENV), \
+                patch("urllib.request.urlopen", side_effect=side_effect), \
+                patch("fm_review.confluence_utils.BACKUP_DIR", tmp_path / "backup"), \
+                patch("fm_review.confluence_utils.AUDIT_LOG_DIR", tmp_path / "audit"), \
+                patch("fm_review.confluence_utils.LOCK_DIR", tmp_path / "locks"):
+            with pytest.raises(ConfluenceAPIError, match="Batch publish failed"):
+                batch_publish([("111", "<p>A</p>", "a"), ("222", "<p>B</p>", "b")])
+        rollbacks = [
+            json.loads(c[2]) for c in calls
+            if c[0] == "PUT" and c[1] == "111" and c[2] is not None
+        ]
+        assert any(r["version"]["message"].startswith("ROLLBACK") for r in rollbacks)
+        log = (tmp_path / "audit" / "confluence_111.jsonl").read_text().splitlines()
+        assert json.loads(log[-1])["action"] == "rollback"
+
+    def test_batch_publish_duplicate_page_ids(self):
+        """Duplicate page ids are rejected before any lock or request."""
+        from fm_review.confluence_utils import batch_publish
+        with pytest.raises(ValueError, match="Duplicate"):
+            batch_publish([("111", "<p>A</p>", "a"), ("111", "<p>B</p>", "b")])
+
+    def test_batch_publish_locks_in_page_id_order(self, tmp_path, confluence_response):
+        """Locks are taken in sorted page_id order regardless of input order."""
+        from fm_review.confluence_utils import batch_publish
+        acquired = []
+        original_acquire = ConfluenceLock.acquire
+
+        def tracking_acquire(self):
+            acquired.append(self.page_id)
+            return original_acquire(self)
+
+        with patch.dict(os.environ, self.ENV), \
+                patch("urllib.request.urlopen", side_effect=self._urlopen(confluence_response)), \
+                patch("fm_review.confluence_utils.BACKUP_DIR", tmp_path / "backup"), \
+                patch("fm_review.confluence_utils.AUDIT_LOG_DIR", tmp_path / "audit"), \
+                patch("fm_review.confluence_utils.LOCK_DIR", tmp_path / "locks"), \
+                patch.object(ConfluenceLock, "acquire", tracking_acquire):
+            batch_publish([("333", "c", "c"), ("111", "a", "a"), ("222", "b", "b")])
+        assert acquired == ["111", "222", "333"]
+
+
+# ── Diff-aware Publish Tests ──────────────────────────────
+
+
+class TestDiffAwarePublish:
+    def test_normalize_ignores_whitespace_between_tags(self):
+        """body_hash is stable across Confluence whitespace normalization."""
+        from fm_review.confluence_utils import body_hash
+        assert body_hash("<p>A</p>\n  <br />\r\n<p>B</p>") == body_hash("<p>A</p><br/><p>B</p>")
+        assert body_hash("<p>A</p>") != body_hash("<p>B</p>")
+
+    def test_normalize_keeps_inline_and_cdata_whitespace(self):
+        """Spaces between inline elements and inside CDATA are content."""
+        from fm_review.confluence_utils import body_hash, normalize_body
+        assert body_hash("<p><strong>a</strong> <em>b</em></p>") != body_hash("<p><strong>a</strong><em>b</em></p>")
+        code = '<ac:plain-text-body><![CDATA[<a>\n  <b>]]></ac:plain-text-body>'
+        assert body_hash(code) != body_hash(code.replace("\n  ", ""))
+        assert normalize_body('<ac:structured-macro ac:name="code">\n  ' + code + "\n</ac:structured-macro>") == \
+            '<ac:structured-macro ac:name="code">' + code + "</ac:structured-macro>"
+
+    def test_section_diff(self):
+        """section_diff reports added, removed and changed h1/h2 sections."""
+        from fm_review.confluence_utils import section_diff
+        old = "<p>intro</p><h1>One</h1><p>1</p><h2>Two</h2><p>2</p><h2>Gone</h2><p>x</p>"
+        new = "<p>intro</p><h1>One</h1><p>1!</p><h2>Two</h2><p>2</p><h2>New</h2><p>y</p>"
+        diff = section_diff(old, new)
+        assert diff == {"added": ["New"], "removed": ["Gone"], "changed": ["One"]}
+
+    def test_skip_when_identical_to_live(self, tmp_path, mock_urllib, sample_xhtml):
+        """No PUT is sent when the body equals the live storage value."""
+        with patch("fm_review.confluence_utils.BACKUP_DIR", tmp_path / "backup"):
+            client = ConfluenceClient("https://test.example.com", "token", "12345")
+            result, backup_path = client.update_page(
+                sample_xhtml + "\n", "no-op", skip_unchanged=True
+            )
+        assert backup_path is None
+        assert result["version"]["number"] == 42
+        assert all(c[0][0].data is None for c in mock_urllib.call_args_list)
+
+    def test_skip_uses_recorded_hash(self, tmp_path, mock_urllib):
+        """A body matching the last published hash skips the full-body GET."""
+        from fm_review.confluence_utils import PUBLISH_STATE_DIR, body_hash
+        PUBLISH_STATE_DIR.mkdir(parents=True)
+        (PUBLISH_STATE_DIR / "confluence_12345.json").write_text(json.dumps(
+            {"hash": body_hash("<p>Published</p>"), "version_number": 42}
+        ))
+        client = ConfluenceClient("https://test.example.com", "token", "12345")
+        _, backup_path = client.update_page("<p>Published</p>", "no-op", skip_unchanged=True)
+        assert backup_path is None
+        assert mock_urllib.call_count == 1
+        assert "expand=version" in mock_urllib.call_args[0][0].full_url
+
+    def test_changed_body_is_published_and_recorded(self, tmp_path, mock_urllib, capsys):
+        """Changed body is PUT, section diff printed and hash recorded."""
+        from fm_review.confluence_utils import PUBLISH_STATE_DIR, body_hash
+        with patch("fm_review.confluence_utils.BACKUP_DIR", tmp_path / "backup"):
+            with patch("fm_review.confluence_utils.AUDIT_LOG_DIR", tmp_path / "audit"):
+                client = ConfluenceClient("https://test.example.com", "token", "12345")
+                client.update_page("<h2>3. Бизнес-правила</h2><p>New</p>", "edit",
+                                   skip_unchanged=True)
+        assert mock_urllib.call_args_list[-1][0][0].data is not None
+        assert "Sections changed: 3. Бизнес-правила" in capsys.readouterr().out
+        record = json.loads((PUBLISH_STATE_DIR / "confluence_12345.json").read_text())
+        assert record["hash"] == body_hash("<h2>3. Бизнес-правила</h2><p>New</p>")
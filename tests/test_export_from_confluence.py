@@ -15,10 +15,15 @@ SCRIPTS_DIR = Path(__file__).parent.parent / "scripts"
 sys.path.insert(0, str(SCRIPTS_DIR))
 
 from export_from_confluence import (
+    MACRO_HANDLERS,
     _urlopen_with_retry,
     api_request,
+    clean_body_html,
     confluence_to_clean_html,
+    iter_chunks,
+    macro_handler,
     setup_weasyprint_env,
+    write_clean_html,
 )
 
 from fm_review.confluence_utils import _get_page_id, _make_ssl_context
@@ -110,6 +115,83 @@ class TestConfluenceToCleanHtml:
         assert "bold" in result
 
 
+# ── Chunked conversion ───────────────────────────────
+
+class TestChunkedConversion:
+    XHTML = (
+        '<p>one</p><ac:structured-macro ac:name="code"><ac:plain-text-body>'
+        '<![CDATA[if a < b > c <p>]]></ac:plain-text-body></ac:structured-macro>'
+        '<p title="a>b">two<br/></p><!-- <div> --><hr/>'
+        '<ac:structured-macro ac:name="note"><ac:rich-text-body><p>n</p>'
+        '</ac:rich-text-body></ac:structured-macro><p>three</p>'
+    )
+
+    def test_chunks_split_at_top_level(self):
+        """Chunks concatenate back to the input and never cut an element."""
+        chunks = list(iter_chunks(self.XHTML, chunk_chars=1))
+        assert "".join(chunks) == self.XHTML
+        assert chunks[0] == "<p>one</p>"
+        assert '<p title="a>b">two<br/></p>' in chunks
+
+    def test_chunked_output_matches_single_parse(self):
+        """Small chunks produce the same HTML as one chunk."""
+        with patch("export_from_confluence.EXPORT_CHUNK_CHARS", 1):
+            chunked = clean_body_html(self.XHTML)
+        with patch("export_from_confluence.EXPORT_CHUNK_CHARS", 10**9):
+            whole = clean_body_html(self.XHTML)
+        assert chunked == whole
+        assert "panel-note" in chunked and "ac:" not in chunked
+
+    def test_nested_macros_converted(self):
+        """A macro inside a panel body is converted too."""
+        xhtml = ('<ac:structured-macro ac:name="warning"><ac:rich-text-body>'
+                 '<ac:structured-macro ac:name="info"><ac:rich-text-body><p>in</p>'
+                 '</ac:rich-text-body></ac:structured-macro></ac:rich-text-body></ac:structured-macro>')
+        result = clean_body_html(xhtml)
+        assert result.index("panel-warning") < result.index("panel-info") < result.index("in</p>")
+
+    def test_write_clean_html_matches_string(self, tmp_path):
+        """The progressively written file equals confluence_to_clean_html."""
+        path = tmp_path / "out.html"
+        with patch("export_from_confluence.EXPORT_CHUNK_CHARS", 1):
+            write_clean_html(self.XHTML, "T", str(path))
+        assert path.read_text(encoding="utf-8") == confluence_to_clean_html(self.XHTML, "T")
+
+
+# ── Macro handler registry ───────────────────────────
+
+class TestMacroHandlers:
+    def test_builtin_handlers_registered(self):
+        assert {"warning", "note", "info", "toc"} <= set(MACRO_HANDLERS)
+
+    def test_custom_handler(self):
+        """A registered handler replaces its macro; the walk continues into the result."""
+        @macro_handler("expand")
+        def expand(soup, macro, body):
+            details = soup.new_tag("details")
+            details.extend(list(body.contents))
+            return [details]
+
+        xhtml = ('<ac:structured-macro ac:name="expand"><ac:rich-text-body>'
+                 '<ac:structured-macro ac:name="note"><ac:rich-text-body><p>n</p>'
+                 '</ac:rich-text-body></ac:structured-macro></ac:rich-text-body></ac:structured-macro>')
+        try:
+            result = clean_body_html(xhtml)
+        finally:
+            del MACRO_HANDLERS["expand"]
+        assert result.startswith('<details><div class="panel-note"')
+
+    def test_body_nodes_moved_not_reparsed(self):
+        """Panel children are the original nodes moved from the macro body."""
+        import export_from_confluence as mod
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup('<ac:structured-macro ac:name="info"><ac:rich-text-body>'
+                             '<p id="x">i</p></ac:rich-text-body></ac:structured-macro>', "html.parser")
+        original = soup.find("p")
+        mod._transform(soup)
+        assert soup.find("div", class_="panel-info").find("p") is original
+
+
 # ── api_request ──────────────────────────────────────
 
 class TestApiRequest:
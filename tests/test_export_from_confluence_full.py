@@ -2,8 +2,10 @@
 Comprehensive unit tests for export_from_confluence.py.
 Target: 95-100% coverage. Mocks external deps (weasyprint, subprocess, API).
 """
+import json
 import os
 import sys
+import urllib.request
 from pathlib import Path
 from unittest.mock import MagicMock, patch
 
@@ -92,7 +94,7 @@ class TestUrlopenWithRetry:
         mock_resp.__exit__ = MagicMock(return_value=False)
 
         with patch("export_from_confluence.urllib.request.urlopen", return_value=mock_resp):
-            result = mod._urlopen_with_retry(MagicMock())
+            result = mod._urlopen_with_retry(urllib.request.Request(f"{mod.CONFLUENCE_URL}/rest/api/x"))
         assert result is mock_resp
 
 
@@ -322,6 +324,226 @@ class TestExportDocx:
         assert path.exists()
 
 
+# ── document model / render_formats ─────────────────────────────────────────
+
+class TestRenderFormats:
+    PAGE = {"title": "FM", "version": 2,
+            "html": '<ac:structured-macro ac:name="note"><ac:rich-text-body><p>n</p>'
+                    '</ac:rich-text-body></ac:structured-macro><h1>H</h1><p>text</p>'}
+
+    def test_build_document_converts_once(self):
+        with patch.object(mod, "clean_body_html", wraps=mod.clean_body_html) as spy:
+            document = mod.build_document(self.PAGE)
+        assert spy.call_count == 1
+        assert document["title"] == "FM" and "panel-note" in document["body_html"]
+
+    def test_parallel_docx_and_html(self, tmp_path):
+        """Several formats render in worker processes from one document model."""
+        document = mod.build_document(self.PAGE)
+        outputs = {"docx": str(tmp_path / "a.docx"), "html": str(tmp_path / "a.html")}
+        results = mod.render_formats(document, outputs)
+        assert results == {"docx": True, "html": True}
+        assert (tmp_path / "a.docx").stat().st_size > 0
+        html = (tmp_path / "a.html").read_text(encoding="utf-8")
+        assert html == mod.confluence_to_clean_html(self.PAGE["html"], "FM")
+
+    def test_renderer_exception_is_failure(self, tmp_path, capsys):
+        document = mod.build_document(self.PAGE)
+        with patch.object(mod, "export_docx", side_effect=RuntimeError("boom")):
+            results = mod.render_formats(document, {"docx": str(tmp_path / "a.docx")})
+        assert results == {"docx": False}
+        assert "boom" in capsys.readouterr().out
+
+    def test_unknown_format_raises(self):
+        with pytest.raises(ValueError, match="Unknown export format"):
+            mod.render_document("odt", {"title": "T", "body_html": ""}, "x.odt")
+
+
+# ── batch / tree export ─────────────────────────────────────────────────────
+
+class TestBatchExport:
+    def test_project_page_ids(self, tmp_path):
+        proj_dir = tmp_path / "projects" / "PROJ"
+        proj_dir.mkdir(parents=True)
+        (proj_dir / "CONFLUENCE_PAGE_ID").write_text("111\n")
+        (proj_dir / "CONFLUENCE_PAGE_ID_ARC").write_text("# arc\n222\n")
+        (proj_dir / "CONFLUENCE_PAGE_ID_TS").write_text("none\n")
+        with patch.object(cu, "_PROJECT_ROOT", tmp_path):
+            assert cu._get_project_page_ids("PROJ") == {"CONFLUENCE_PAGE_ID": "111", "CONFLUENCE_PAGE_ID_ARC": "222"}
+
+    def test_list_child_pages_paginates(self):
+        pages = [{"results": [{"id": i} for i in range(100)]}, {"results": [{"id": 100}]}]
+        with patch.object(mod, "api_request", side_effect=pages) as mock_api:
+            children = mod.list_child_pages("1")
+        assert len(children) == 101 and children[-1] == "100"
+        assert "start=100" in mock_api.call_args_list[1][0][1]
+
+    def test_collect_page_tree_breadth_first(self):
+        tree = {"1": ["2", "3"], "2": ["4"], "3": ["4"], "4": []}
+        with patch.object(mod, "list_child_pages", side_effect=lambda pid: tree[pid]):
+            result = mod.collect_page_tree(["1"])
+        assert result == [("1", None), ("2", "1"), ("3", "1"), ("4", "2")]
+
+    def test_export_batch_manifest(self, tmp_path):
+        """Pages render into the batch dir; failures are recorded, not raised."""
+        def fetch(pid):
+            if pid == "3":
+                return None
+            return {"id": pid, "title": f"Page {pid}", "version": 7, "html": f"<p>{pid}</p>"}
+
+        with patch.object(mod, "_fetch_page_data", side_effect=fetch):
+            manifest = mod.export_batch([("1", None), ("2", "1"), ("3", "1")], ["html", "docx"], str(tmp_path))
+
+        assert manifest["summary"] == {"pages": 3, "ok": 2, "failed": 1}
+        first, second, third = manifest["pages"]
+        assert first["files"]["html"]["path"] == "1_Page_1_v7.html"
+        assert (tmp_path / "2_Page_2_v7.docx").exists()
+        assert second["parent_id"] == "1" and second["status"] == "ok"
+        assert third["status"] == "error" and third["error"] == "fetch failed"
+        on_disk = json.loads((tmp_path / "manifest.json").read_text(encoding="utf-8"))
+        assert on_disk["summary"]["ok"] == 2
+
+    def test_throttle_reported_to_rate_limiter(self):
+        import urllib.error
+        err = urllib.error.HTTPError("u", 429, "Too Many", {"Retry-After": "3"}, None)
+        with patch("export_from_confluence.urllib.request.urlopen", side_effect=err), \
+                patch.object(mod, "_rate_limiter") as limiter, \
+                patch.object(mod._urlopen_with_retry.retry, "sleep"):
+            with pytest.raises(urllib.error.HTTPError):
+                mod._urlopen_with_retry(urllib.request.Request(f"{mod.CONFLUENCE_URL}/rest/api/x"))
+        limiter.on_throttle.assert_called_with(3.0)
+        assert limiter.acquire.call_count == 3
+
+    def test_external_host_bypasses_rate_limiter(self):
+        """A throttling third-party image host is retried but does not slow Confluence traffic."""
+        import urllib.error
+        err = urllib.error.HTTPError("u", 503, "Unavailable", {"Retry-After": "30"}, None)
+        with patch("export_from_confluence.urllib.request.urlopen", side_effect=err) as urlopen, \
+                patch.object(mod, "_rate_limiter") as limiter, \
+                patch.object(mod._urlopen_with_retry.retry, "sleep"):
+            with pytest.raises(urllib.error.HTTPError):
+                mod._urlopen_with_retry(urllib.request.Request("https://images.example.com/a.png"))
+        assert urlopen.call_count == 3
+        limiter.acquire.assert_not_called()
+        limiter.on_throttle.assert_not_called()
+
+    def test_main_batch_uses_project_pages(self, tmp_path, capsys):
+        manifest = {"summary": {"pages": 2, "ok": 2, "failed": 0}}
+        with patch.dict(os.environ, {"CONFLUENCE_TOKEN": "t"}, clear=False):
+            with patch.object(mod, "setup_weasyprint_env"):
+                with patch.object(mod, "_get_page_id", return_value="1"):
+                    with patch.object(mod, "_get_project_page_ids", return_value={"A": "11", "B": "22"}):
+                        with patch.object(mod, "export_batch", return_value=manifest) as mock_batch:
+                            with patch.object(mod, "OUTPUT_DIR", str(tmp_path)):
+                                with patch.object(sys, "argv", ["script", "--project=P", "--batch", "--docx"]):
+                                    mod.main()
+        pages, formats, batch_dir = mock_batch.call_args[0]
+        assert pages == [("11", None), ("22", None)]
+        assert formats == ["docx"]
+        assert os.path.basename(batch_dir).startswith("batch_")
+        assert "Успешно: 2" in capsys.readouterr().out
+
+
+# ── attachment cache ───────────────────────────────────────────────────────
+
+def _png(width=2, height=1):
+    """Minimal valid PNG (python-docx reads the size from the header)."""
+    import struct
+    import zlib
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    raw = b"".join(b"\x00" + b"\xff\x00\x00" * width for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b""))
+
+
+class TestAttachmentCache:
+    IMAGES = ('<p><ac:image ac:width="300"><ri:attachment ri:filename="chart.png" /></ac:image></p>'
+              '<ac:image><ri:url ri:value="https://img.example/x.png" /></ac:image>'
+              '<ac:image><ri:attachment ri:filename="other.png"><ri:page ri:content-title="P" />'
+              '</ri:attachment></ac:image>')
+    LISTING = {"chart.png": {"id": "900", "version": 2, "download": "/download/chart.png", "media_type": "image/png"}}
+
+    def test_images_become_img_tags(self):
+        body = mod.clean_body_html(self.IMAGES)
+        assert '<img src="attachment:chart.png" width="300"/>' in body
+        assert '<img src="https://img.example/x.png"/>' in body
+        assert "other.png" not in body
+
+    def test_image_attachment_names_own_page_only(self):
+        assert mod.image_attachment_names(self.IMAGES + self.IMAGES) == ["chart.png"]
+
+    def test_image_attachment_names_match_transform(self):
+        """Extra attributes and entities: prefetch names are the ones the transform emits."""
+        html = ('<ac:image><ri:attachment ri:filename="a.png" ri:version-at-save="2" /></ac:image>'
+                '<ac:image><ri:attachment ri:version-at-save="1" ri:filename="R&amp;D.png"/></ac:image>')
+        assert mod.image_attachment_names(html) == ["a.png", "R&D.png"]
+        body = mod.clean_body_html(html)
+        assert 'src="attachment:a.png"' in body and 'src="attachment:R&amp;D.png"' in body
+
+    def test_repeat_prefetch_downloads_nothing(self, tmp_path):
+        cache = mod.AttachmentCache(str(tmp_path))
+        with patch.object(mod, "list_attachments", return_value=self.LISTING), \
+                patch.object(mod, "_download", return_value=_png()) as mock_download:
+            first = cache.prefetch_page("1", ["chart.png", "missing.png"])
+            second = mod.AttachmentCache(str(tmp_path)).prefetch_page("1", ["chart.png"])
+        assert mock_download.call_count == 1
+        assert first == second == {"chart.png": first["chart.png"]}
+        assert first["chart.png"].endswith(".png")
+
+    def test_token_only_sent_to_confluence_host(self):
+        opened = []
+        response = MagicMock()
+        response.__enter__.return_value.read.return_value = b"x"
+        with patch.object(mod, "CONFLUENCE_URL", "https://confluence.ekf.su"), \
+                patch.object(mod, "_urlopen_with_retry", side_effect=lambda req: opened.append(req) or response):
+            mod._download("https://confluence.ekf.su/download/a.png")
+            mod._download("https://confluence.ekf.su.evil.example/x.png")
+            mod._download("http://confluence.ekf.su/download/a.png")
+        assert [req.has_header("Authorization") for req in opened] == [True, False, False]
+
+    def test_new_version_is_new_key_same_blob(self, tmp_path):
+        cache = mod.AttachmentCache(str(tmp_path))
+        a = cache.store("900@1", b"same", "a.png")
+        b = cache.store("900@2", b"same", "a.png")
+        assert a == b
+        assert cache.path_for("900@1") == cache.path_for("900@2") == a
+        assert cache.path_for("900@3") is None
+
+    def test_url_fetcher(self, tmp_path):
+        path = tmp_path / "c.png"
+        path.write_bytes(_png())
+        cache = mod.AttachmentCache(str(tmp_path / "cache"))
+        fetcher = mod.make_url_fetcher({"my chart.png": str(path)}, cache)
+        result = fetcher("attachment:my%20chart.png")
+        assert result["string"] == _png() and result["mime_type"] == "image/png"
+        with patch.object(mod, "_download", return_value=b"remote") as mock_download:
+            assert fetcher("https://img.example/x.png")["string"] == b"remote"
+            assert fetcher("https://img.example/x.png")["string"] == b"remote"
+        assert mock_download.call_count == 1
+        with pytest.raises(ValueError, match="not cached"):
+            fetcher("attachment:nope.png")
+
+    def test_docx_embeds_cached_image(self, tmp_path):
+        from docx import Document
+        path = tmp_path / "chart.png"
+        path.write_bytes(_png())
+        out = tmp_path / "out.docx"
+        mod.export_docx('<p><img src="attachment:chart.png"/></p><img src="attachment:gone.png"/>',
+                        "T", str(out), {"chart.png": str(path)})
+        assert len(Document(str(out)).inline_shapes) == 1
+
+    def test_html_points_at_cache(self, tmp_path):
+        path = tmp_path / "chart.png"
+        path.write_bytes(_png())
+        document = {"title": "T", "body_html": '<p><img src="attachment:chart.png"/></p>',
+                    "attachments": {"chart.png": str(path)}}
+        mod.render_document("html", document, str(tmp_path / "out.html"))
+        assert f'src="{path.as_uri()}"' in (tmp_path / "out.html").read_text(encoding="utf-8")
+
+
 # ── main ────────────────────────────────────────────────────────────────────
 
 class TestMain:
@@ -421,6 +643,33 @@ class TestMain:
                                         with patch.object(sys, "argv", ["script", "--both"]):
                                             mod.main()
 
+    def test_html_flag_writes_html(self, tmp_path, capsys):
+        page_data = {"title": "X", "version": 3, "html": "<p>x</p>"}
+        with patch.dict(os.environ, {"CONFLUENCE_TOKEN": "t"}, clear=False):
+            with patch.object(mod, "setup_weasyprint_env"):
+                with patch.object(mod, "fetch_page", return_value=page_data):
+                    with patch.object(mod, "OUTPUT_DIR", str(tmp_path)):
+                        with patch.object(mod, "_get_page_id", return_value="1"):
+                            with patch.object(sys, "argv", ["script", "--html"]):
+                                mod.main()
+        written = list(tmp_path.glob("X_v3_*.html"))
+        assert len(written) == 1
+        assert "<p>x</p>" in written[0].read_text(encoding="utf-8")
+        assert "HTML:" in capsys.readouterr().out
+
+    def test_flags_accumulate_and_fetch_once(self, tmp_path):
+        page_data = {"title": "X", "version": 1, "html": "<p>x</p>"}
+        with patch.dict(os.environ, {"CONFLUENCE_TOKEN": "t"}, clear=False):
+            with patch.object(mod, "setup_weasyprint_env"):
+                with patch.object(mod, "fetch_page", return_value=page_data) as mock_fetch:
+                    with patch.object(mod, "render_formats", return_value={"pdf": False, "html": False}) as mock_render:
+                        with patch.object(mod, "OUTPUT_DIR", str(tmp_path)):
+                            with patch.object(mod, "_get_page_id", return_value="1"):
+                                with patch.object(sys, "argv", ["script", "--html", "--pdf"]):
+                                    mod.main()
+        mock_fetch.assert_called_once()
+        assert list(mock_render.call_args[0][1]) == ["pdf", "html"]
+
     def test_pdf_error_path_prints_error(self, tmp_path, capsys):
         page_data = {"title": "X", "version": 1, "html": "<p>x</p>"}
         with patch.dict(os.environ, {"CONFLUENCE_TOKEN": "t"}, clear=False):
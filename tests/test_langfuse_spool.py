@@ -0,0 +1,246 @@
+"""
+Tests for src/fm_review/langfuse_spool.py
+
+Covers: recording client, enqueue, ingestion events, batched drain, offline and
+busy drains, rejected uploads / retry / dead-letter, resume of a claimed batch, CLI.
+"""
+import fcntl
+import json
+import os
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+from fm_review.langfuse_spool import LangfuseSpool, SpoolClient, main, record_events
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return LangfuseSpool(tmp_path / "spool")
+
+
+def _record_trace(spool, name="t"):
+    client = SpoolClient(spool)
+    root = client.start_span(name=name)
+    root.update_trace(name=name, session_id="s1", tags=["a"])
+    gen = root.start_generation(name="turn-1", model="m", usage_details={"input": 3})
+    gen.end()
+    child = root.start_span(name="tool:Read", metadata={"duration_ms": 5})
+    child.update(level="ERROR")
+    child.end()
+    root.end()
+    client.flush()
+
+
+def _client(reachable=True):
+    client = MagicMock()
+    client.auth_check.return_value = reachable
+    client.create_trace_id.side_effect = lambda seed: f"trace-{seed}"
+    client.api.ingestion.batch.return_value = SimpleNamespace(successes=[], errors=[])
+    return client
+
+
+def _sent(client):
+    """Events of every ingestion request, flattened."""
+    return [e for call in client.api.ingestion.batch.call_args_list for e in call.kwargs["batch"]]
+
+
+# ── Recording Tests ───────────────────────────────────────
+
+class TestSpoolClient:
+    def test_flush_enqueues_tree(self, spool):
+        """Calls are recorded as one observation tree per root span."""
+        _record_trace(spool)
+        (record,) = [json.loads(line) for line in spool.active_file.read_text().splitlines()]
+        trace = record["trace"]
+        assert record["attempts"] == 0
+        assert trace["kwargs"] == {"name": "t"}
+        assert trace["trace"]["session_id"] == "s1"
+        assert [c["type"] for c in trace["children"]] == ["generation", "span"]
+        assert trace["children"][1]["updates"] == [{"level": "ERROR"}]
+        assert trace["ended_at"] is not None
+
+    def test_nothing_to_flush(self, spool):
+        SpoolClient(spool).flush()
+        assert not spool.active_file.exists()
+
+    def test_checkpoint_keeps_recording(self, spool):
+        """checkpoint() spools a snapshot; later snapshots map to the same trace ids."""
+        client = SpoolClient(spool)
+        root = client.start_span(name="p")
+        root.start_span(name="agent-1").end()
+        client.checkpoint()
+        root.start_span(name="agent-2").end()
+        root.end()
+        client.flush()
+        first, final = [json.loads(line) for line in spool.active_file.read_text().splitlines()]
+        assert first["seed"] == final["seed"] and first["id"] != final["id"]
+        assert len(first["trace"]["children"]) == 1 and first["trace"]["ended_at"] is None
+        assert len(final["trace"]["children"]) == 2
+        early, late = record_events(_client(), first), record_events(_client(), final)
+        assert [e.body.id for e in early] == [e.body.id for e in late[:3]]
+        assert not {e.id for e in early} & {e.id for e in late}
+
+
+# ── Event Tests ───────────────────────────────────────────
+
+class TestRecordEvents:
+    def test_tree_to_events(self, spool):
+        """One trace event plus one event per observation, linked by parent id."""
+        _record_trace(spool)
+        record = json.loads(spool.active_file.read_text())
+        trace, root, gen, tool = record_events(_client(), record)
+        assert trace.type == "trace-create"
+        assert trace.body.id == f"trace-{record['seed']}"
+        assert (trace.body.name, trace.body.session_id, trace.body.tags) == ("t", "s1", ["a"])
+        assert [e.type for e in (root, gen, tool)] == ["span-create", "generation-create", "span-create"]
+        assert root.body.parent_observation_id is None
+        assert gen.body.parent_observation_id == tool.body.parent_observation_id == root.body.id
+        assert (gen.body.name, gen.body.model, gen.body.usage_details) == ("turn-1", "m", {"input": 3})
+        assert tool.body.metadata == {"duration_ms": 5}
+        assert tool.body.level.value == "ERROR"
+        assert root.body.start_time.isoformat() == record["trace"]["started_at"]
+        assert root.body.end_time is not None
+
+    def test_ids_stable(self, spool):
+        """The same record always maps to the same trace, observation and event ids."""
+        _record_trace(spool)
+        record = json.loads(spool.active_file.read_text())
+        first, second = record_events(_client(), record), record_events(_client(), record)
+        assert [(e.id, e.body.id) for e in first] == [(e.id, e.body.id) for e in second]
+        assert len({e.body.id for e in first[1:]}) == 3
+
+    def test_updates_merged(self, spool):
+        client = SpoolClient(spool)
+        root = client.start_span(name="p", metadata={"project": "x"})
+        root.update(metadata={"cost_usd": 1.5})
+        root.end()
+        client.flush()
+        record = json.loads(spool.active_file.read_text())
+        assert record_events(_client(), record)[1].body.metadata == {"project": "x", "cost_usd": 1.5}
+
+
+# ── Drain Tests ───────────────────────────────────────────
+
+class TestDrain:
+    def test_send_in_batches(self, spool):
+        """Records are uploaded through the ingestion endpoint, one request per batch."""
+        for name in ("a", "b", "c"):
+            _record_trace(spool, name)
+        client = _client()
+        result = spool.drain(client, batch_size=2)
+        assert result["sent"] == 3
+        assert client.api.ingestion.batch.call_count == 2
+        traces = [e.body.name for e in _sent(client) if e.type == "trace-create"]
+        assert traces == ["a", "b", "c"]
+        assert spool.status() == {"queued": 0, "dead": 0}
+        assert list(spool.spool_dir.glob("spool.*.draining*")) == []
+
+    def test_offline_keeps_queue(self, spool):
+        """An unreachable Langfuse leaves the queue untouched."""
+        _record_trace(spool)
+        client = _client(reachable=False)
+        assert spool.drain(client)["offline"] is True
+        client.api.ingestion.batch.assert_not_called()
+        assert spool.active_file.exists()
+
+    def test_failed_upload_requeued_then_dead(self, spool):
+        """An ingestion request that fails sends its records back to the queue, then to the dead-letter file."""
+        _record_trace(spool)
+        client = _client()
+        client.api.ingestion.batch.side_effect = ConnectionError("503")
+        assert spool.drain(client, max_attempts=2) == {
+            "sent": 0, "requeued": 1, "dead": 0, "busy": False, "offline": False}
+        assert json.loads(spool.active_file.read_text())["attempts"] == 1
+        assert spool.drain(client, max_attempts=2)["dead"] == 1
+        assert spool.status() == {"queued": 0, "dead": 1}
+
+    def test_rejected_events_requeued(self, spool):
+        """Only the records whose events the API rejected are re-queued."""
+        _record_trace(spool, "a")
+        _record_trace(spool, "b")
+        client = _client()
+
+        def batch(batch):
+            rejected = next(e for e in batch if e.type == "trace-create" and e.body.name == "b")
+            return SimpleNamespace(successes=[], errors=[SimpleNamespace(id=rejected.id, status=500)])
+
+        client.api.ingestion.batch.side_effect = batch
+        result = spool.drain(client)
+        assert (result["sent"], result["requeued"]) == (1, 1)
+        (requeued,) = [json.loads(line) for line in spool.active_file.read_text().splitlines()]
+        assert requeued["trace"]["kwargs"]["name"] == "b"
+
+    def test_flushed_during_drain_sent(self, spool):
+        """A trace queued while the drain runs is claimed by the same drain."""
+        _record_trace(spool, "a")
+        client = _client()
+        ok = SimpleNamespace(successes=[], errors=[])
+
+        def batch(batch):
+            if client.api.ingestion.batch.call_count == 1:
+                _record_trace(spool, "late")
+                assert spool.drain(_client())["busy"] is True
+            return ok
+
+        client.api.ingestion.batch.side_effect = batch
+        assert spool.drain(client)["sent"] == 2
+        assert [e.body.name for e in _sent(client) if e.type == "trace-create"] == ["a", "late"]
+        assert spool.status() == {"queued": 0, "dead": 0}
+
+    def test_failed_not_retried_in_same_drain(self, spool):
+        """Records that fail are held back until the drain ends, then queued again."""
+        _record_trace(spool)
+        client = _client()
+        client.api.ingestion.batch.side_effect = ConnectionError("503")
+        assert spool.drain(client)["requeued"] == 1
+        assert client.api.ingestion.batch.call_count == 1
+        assert not spool.retry_file.exists()
+        assert spool.status()["queued"] == 1
+
+    def test_invalid_record_dead_lettered(self, spool):
+        """A record that cannot be turned into events is not retried."""
+        spool._append(spool.active_file, [{"id": "x", "attempts": 0, "trace": {"kwargs": {}}}])
+        _record_trace(spool)
+        result = spool.drain(_client())
+        assert (result["sent"], result["dead"]) == (1, 1)
+        assert json.loads(spool.dead_file.read_text())["id"] == "x"
+
+    def test_resume_claimed_batch(self, spool):
+        """A batch left by a crashed drainer resumes after the recorded position."""
+        _record_trace(spool, "a")
+        _record_trace(spool, "b")
+        claimed = spool.spool_dir / "spool.1.draining"
+        os.rename(spool.active_file, claimed)
+        (spool.spool_dir / "spool.1.draining.pos").write_text("1")
+        assert spool.status()["queued"] == 1
+        client = _client()
+        assert spool.drain(client)["sent"] == 1
+        assert [e.body.name for e in _sent(client) if e.type == "trace-create"] == ["b"]
+        assert not claimed.exists()
+
+    def test_single_drainer(self, spool):
+        """A second drainer exits immediately while the first holds the lock."""
+        _record_trace(spool)
+        fd = os.open(spool.spool_dir / "drain.lock", os.O_RDWR | os.O_CREAT)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            assert spool.drain(_client())["busy"] is True
+        finally:
+            os.close(fd)
+        assert spool.active_file.exists()
+
+    def test_empty_spool(self, spool):
+        client = _client()
+        assert spool.drain(client)["sent"] == 0
+        client.auth_check.assert_not_called()
+
+
+# ── CLI Tests ─────────────────────────────────────────────
+
+class TestCli:
+    def test_status(self, spool, capsys):
+        _record_trace(spool)
+        assert main(["--dir", str(spool.spool_dir), "--status"]) == 0
+        assert "Queued: 1" in capsys.readouterr().out
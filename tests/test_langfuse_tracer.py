@@ -8,10 +8,10 @@ from fm_review.langfuse_tracer import (
     SessionStats,
     calculate_cost,
     detect_agent,
-    get_last_offset,
+    load_state,
     main,
     parse_transcript,
-    save_offset,
+    save_state,
     send_to_langfuse,
 )
 
@@ -22,19 +22,38 @@ def tmp_state_dir(tmp_path):
         yield tmp_path / ".langfuse_state"
 
 
-class TestOffsetManagement:
-    def test_get_last_offset_missing(self, tmp_state_dir):
-        assert get_last_offset("dummy.jsonl") == 0
+class TestStateManagement:
+    def test_load_state_missing(self, tmp_state_dir):
+        offset, stats = load_state("dummy.jsonl")
+        assert offset == 0
+        assert stats == SessionStats()
 
-    def test_save_and_get_offset(self, tmp_state_dir):
-        save_offset("dummy.jsonl", 42)
-        assert get_last_offset("dummy.jsonl") == 42
-        assert (tmp_state_dir / "dummy.offset").exists()
+    def test_save_and_load_state(self, tmp_state_dir, tmp_path):
+        transcript = tmp_path / "dummy.jsonl"
+        transcript.write_text("x" * 100)
+        stats = SessionStats(model="m", turn_count=3, tool_calls={"Read": 2}, seen_message_ids={"a", "b"})
+        save_state(str(transcript), 42, stats)
+        assert load_state(str(transcript)) == (42, stats)
+        assert (tmp_state_dir / "dummy.state.json").exists()
 
-    def test_get_last_offset_invalid(self, tmp_state_dir):
+    def test_load_state_invalid(self, tmp_state_dir):
+        tmp_state_dir.mkdir(parents=True, exist_ok=True)
+        (tmp_state_dir / "dummy.state.json").write_text("invalid")
+        assert load_state("dummy.jsonl") == (0, SessionStats())
+
+    def test_truncated_transcript_restarts(self, tmp_state_dir, tmp_path):
+        transcript = tmp_path / "dummy.jsonl"
+        transcript.write_text("short\n")
+        save_state(str(transcript), 1000, SessionStats(turn_count=5))
+        assert load_state(str(transcript)) == (0, SessionStats())
+
+    def test_legacy_line_offset_converted(self, tmp_state_dir, tmp_path):
+        """A line offset left by older versions is converted to a byte offset."""
+        transcript = tmp_path / "dummy.jsonl"
+        transcript.write_text("one\ntwo\nthree\n")
         tmp_state_dir.mkdir(parents=True, exist_ok=True)
-        (tmp_state_dir / "dummy.offset").write_text("invalid")
-        assert get_last_offset("dummy.jsonl") == 0
+        (tmp_state_dir / "dummy.offset").write_text("2")
+        assert load_state(str(transcript))[0] == len("one\ntwo\n")
 
 
 class TestDetectAgent:
@@ -78,7 +97,7 @@ class TestParseTranscript:
         entry = {"type": "user", "message": {"content": "Hello PROJECT_SHPMNT_PROFIT"}}
         transcript.write_text(json.dumps(entry) + "\n")
         stats, offset = parse_transcript(str(transcript))
-        assert offset == 1
+        assert offset == transcript.stat().st_size
         assert stats.project == "PROJECT_SHPMNT_PROFIT"
 
     def test_parse_transcript_assistant_usage(self, tmp_path):
@@ -103,7 +122,7 @@ class TestParseTranscript:
         }
         transcript.write_text(json.dumps(entry) + "\n")
         stats, offset = parse_transcript(str(transcript))
-        assert offset == 1
+        assert offset == transcript.stat().st_size
         assert stats.input_tokens == 100
         assert stats.output_tokens == 50
         assert stats.cache_creation_tokens == 10
@@ -125,10 +144,106 @@ class TestParseTranscript:
         # Write same message ID twice
         transcript.write_text(json.dumps(entry) + "\n" + json.dumps(entry) + "\n")
         stats, offset = parse_transcript(str(transcript))
-        assert offset == 2
+        assert offset == transcript.stat().st_size
         assert stats.input_tokens == 100
         assert stats.turn_count == 1
 
+    def test_parse_transcript_tail_follow(self, tmp_path):
+        """Parsing resumes at the byte offset; ids seen earlier stay deduplicated."""
+        transcript = tmp_path / "t.jsonl"
+        first = {"type": "assistant", "message": {"role": "assistant", "id": "msg_1", "usage": {"input_tokens": 100}}}
+        second = {"type": "assistant", "message": {"role": "assistant", "id": "msg_2", "usage": {"input_tokens": 7}}}
+        transcript.write_text(json.dumps(first) + "\n")
+        stats, offset = parse_transcript(str(transcript))
+        with open(transcript, "a") as f:
+            f.write(json.dumps(first) + "\n" + json.dumps(second) + "\n")
+        with patch("fm_review.langfuse_tracer._loads", wraps=json.loads) as loads:
+            stats, offset = parse_transcript(str(transcript), offset, stats)
+        assert loads.call_count == 2
+        assert offset == transcript.stat().st_size
+        assert stats.input_tokens == 107
+        assert stats.turn_count == 2
+
+    def test_parse_transcript_prefilter(self, tmp_path):
+        """Tool results and user lines are skipped without decoding once the project is known."""
+        transcript = tmp_path / "t.jsonl"
+        lines = [
+            {"type": "user", "message": {"content": "PROJECT_A"}},
+            {"type": "user", "message": {"content": [{"type": "tool_result", "content": "x" * 1000}]}},
+            {"type": "user", "message": {"content": "PROJECT_B, \"type\": \"assistant\""}},
+            {"type": "assistant", "message": {"role": "assistant", "id": "m", "usage": {"input_tokens": 1}}},
+        ]
+        transcript.write_text("".join(json.dumps(e) + "\n" for e in lines))
+        with patch("fm_review.langfuse_tracer._loads", wraps=json.loads) as loads:
+            stats, _ = parse_transcript(str(transcript))
+        assert loads.call_count == 2
+        assert stats.project == "PROJECT_A"
+        assert stats.turn_count == 1
+
+    def test_parse_transcript_partial_line_left(self, tmp_path):
+        """A line still being written is not consumed."""
+        transcript = tmp_path / "t.jsonl"
+        done = json.dumps({"type": "user", "message": {"content": "hi"}}) + "\n"
+        transcript.write_text(done + '{"type": "assist')
+        stats, offset = parse_transcript(str(transcript))
+        assert offset == len(done.encode())
+
+
+class TestTurnsAndToolSpans:
+    @staticmethod
+    def _line(entry_type, ts, **message):
+        return json.dumps({"type": entry_type, "message": message, "timestamp": ts}) + "\n"
+
+    def _tool_use(self, ts, msg_id, tool_id, name, tokens=10):
+        return self._line("assistant", ts, role="assistant", id=msg_id, model="claude-sonnet-4-6",
+                          usage={"input_tokens": tokens, "output_tokens": 1},
+                          content=[{"type": "tool_use", "id": tool_id, "name": name}])
+
+    def _result(self, ts, tool_id):
+        return self._line("user", ts, content=[{"type": "tool_result", "tool_use_id": tool_id, "content": "x"}])
+
+    def test_turns_and_tool_durations(self, tmp_path):
+        transcript = tmp_path / "t.jsonl"
+        transcript.write_text(
+            self._line("user", "2026-02-19T10:00:00.000Z", content="go")
+            + self._tool_use("2026-02-19T10:00:02.000Z", "m1", "t1", "Bash")
+            + self._result("2026-02-19T10:00:07.500Z", "t1")
+            + self._line("assistant", "2026-02-19T10:00:08.000Z", role="assistant", id="m2",
+                         usage={"input_tokens": 5}, content=[{"type": "text", "text": "done"}])
+        )
+        stats, _ = parse_transcript(str(transcript))
+        assert [(t["index"], t["duration_ms"], t["tools"]) for t in stats.turns] == [(1, 2000, ["Bash"]), (2, 500, [])]
+        assert stats.turns[0]["usage"]["input"] == 10
+        assert stats.tool_spans == [{"id": "t1", "name": "Bash", "turn": 1, "started_at": "2026-02-19T10:00:02.000Z",
+                                     "ended_at": "2026-02-19T10:00:07.500Z", "duration_ms": 5500}]
+        assert stats.pending_tools == {}
+
+    def test_tool_use_in_streamed_duplicate_line(self, tmp_path):
+        """A tool_use block on a later line of the same message is still recorded once."""
+        transcript = tmp_path / "t.jsonl"
+        text = self._line("assistant", "2026-02-19T10:00:01Z", role="assistant", id="m1",
+                          usage={"input_tokens": 10}, content=[{"type": "text", "text": "hi"}])
+        tool = self._tool_use("2026-02-19T10:00:01Z", "m1", "t1", "Read")
+        transcript.write_text(text + tool + tool)
+        stats, _ = parse_transcript(str(transcript))
+        assert stats.turn_count == 1
+        assert stats.tool_calls == {"Read": 1}
+        assert stats.turns[0]["tools"] == ["Read"]
+
+    def test_pending_call_closed_in_next_invocation(self, tmp_state_dir, tmp_path):
+        """Calls without a result are persisted and become spans once answered."""
+        transcript = tmp_path / "t.jsonl"
+        transcript.write_text(self._tool_use("2026-02-19T10:00:00Z", "m1", "t1", "Task"))
+        stats, offset = parse_transcript(str(transcript))
+        save_state(str(transcript), offset, stats)
+        with open(transcript, "a") as f:
+            f.write(self._result("2026-02-19T10:01:00Z", "t1"))
+
+        offset, stats = load_state(str(transcript))
+        assert stats.turns == [] and "t1" in stats.pending_tools
+        stats, _ = parse_transcript(str(transcript), offset, stats)
+        assert stats.tool_spans[0]["duration_ms"] == 60_000
+
 
 class TestCalculateCost:
     def test_calculate_cost_sonnet(self):
@@ -186,6 +301,50 @@ class TestSendToLangfuse:
         mock_root.end.assert_called_once()
         mock_client.flush.assert_called_once()
 
+    @patch("langfuse.get_client")
+    def test_send_per_turn(self, mock_get_client):
+        """With turn detail: one generation per turn and one span per tool call, one flush."""
+        mock_client = MagicMock()
+        mock_root = MagicMock()
+        mock_get_client.return_value = mock_client
+        mock_client.start_span.return_value = mock_root
+        usage = {"input": 1_000_000, "output": 0, "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
+        turns = [{"index": i, "message_id": f"m{i}", "model": "claude-sonnet-4-6", "started_at": "",
+                  "ended_at": "", "duration_ms": 10, "usage": usage, "tools": ["Read"]} for i in (1, 2)]
+        spans = [{"id": f"t{i}", "name": "Read", "turn": i, "started_at": "", "ended_at": "",
+                  "duration_ms": 100} for i in (1, 2)]
+
+        send_to_langfuse(SessionStats(turns=turns, tool_spans=spans), 6.0, "sess_1")
+
+        generations = mock_root.start_generation.call_args_list
+        assert [g.kwargs["name"] for g in generations] == ["turn-1", "turn-2"]
+        assert generations[0].kwargs["cost_details"]["input"] == 3.0
+        assert [c.kwargs["metadata"]["tool_use_id"] for c in mock_root.start_span.call_args_list] == ["t1", "t2"]
+        assert mock_root.update_trace.call_args.kwargs["metadata"]["tool_duration_ms"] == {"Read": 200}
+        assert generations[0].kwargs["metadata"]["duration_ms"] == 10  # SDK spans cannot be backdated
+        mock_client.flush.assert_called_once()
+
+    def test_send_spooled_keeps_transcript_times(self, tmp_path):
+        """In spool mode the transcript timestamps become the observations' start / end times."""
+        from fm_review.langfuse_spool import LangfuseSpool, SpoolClient
+        spool = LangfuseSpool(tmp_path / "spool")
+        usage = {"input": 1, "output": 0, "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
+        turns = [{"index": 1, "message_id": "m1", "model": "claude-sonnet-4-6",
+                  "started_at": "2026-02-19T10:00:00.000Z", "ended_at": "2026-02-19T10:00:02.000Z",
+                  "duration_ms": 2000, "usage": usage, "tools": ["Bash"]}]
+        spans = [{"id": "t1", "name": "Bash", "turn": 1, "started_at": "2026-02-19T10:00:02.000Z",
+                  "ended_at": "2026-02-19T10:00:07.500Z", "duration_ms": 5500}]
+
+        send_to_langfuse(SessionStats(turns=turns, tool_spans=spans), 0.1, "sess_1", SpoolClient(spool))
+
+        root = json.loads(spool.active_file.read_text())["trace"]
+        gen, tool = root["children"]
+        assert (root["started_at"], root["ended_at"]) == ("2026-02-19T10:00:00.000Z", "2026-02-19T10:00:07.500Z")
+        assert (gen["started_at"], gen["ended_at"]) == ("2026-02-19T10:00:00.000Z", "2026-02-19T10:00:02.000Z")
+        assert (tool["started_at"], tool["ended_at"]) == ("2026-02-19T10:00:02.000Z", "2026-02-19T10:00:07.500Z")
+        assert "duration_ms" not in gen["kwargs"]["metadata"]
+        assert tool["kwargs"]["metadata"] == {"tool_use_id": "t1", "turn": 1}
+
     @patch("langfuse.get_client")
     def test_send_to_langfuse_interactive(self, mock_get_client):
         mock_client = MagicMock()
@@ -226,48 +385,72 @@ class TestMain:
         mock_exit.assert_called_with(0)
 
     @patch("sys.stdin.read")
-    @patch("sys.exit")
-    @patch("os.environ.get")
-    @patch("fm_review.langfuse_tracer.parse_transcript")
-    @patch("fm_review.langfuse_tracer.save_offset")
-    def test_main_no_turns(self, mock_save, mock_parse, mock_env_get, mock_exit, mock_read, tmp_path):
+    @patch.dict("os.environ", {"LANGFUSE_PUBLIC_KEY": "pk"})
+    @patch("fm_review.langfuse_tracer.send_to_langfuse")
+    def test_main_no_turns(self, mock_send, mock_read, tmp_path):
         transcript = tmp_path / "t.jsonl"
-        transcript.write_text("")
+        transcript.write_text(json.dumps({"type": "user", "message": {"content": "hi"}}) + "\n")
         mock_read.return_value = json.dumps({"transcript_path": str(transcript)})
-        mock_env_get.return_value = "key"
-
-        stats = SessionStats(turn_count=0)
-        mock_parse.return_value = (stats, 5)
 
-        main()
+        with pytest.raises(SystemExit):
+            main()
 
-        mock_save.assert_called_with(str(transcript), 5)
-        mock_exit.assert_called_with(0)
+        mock_send.assert_not_called()
+        assert load_state(str(transcript))[0] == transcript.stat().st_size
 
     @patch("sys.stdin.read")
     @patch.dict("os.environ", {"LANGFUSE_PUBLIC_KEY": "pk", "LANGFUSE_BASE_URL": "http://lf"})
-    @patch("fm_review.langfuse_tracer.parse_transcript")
     @patch("fm_review.langfuse_tracer.detect_agent")
-    @patch("fm_review.langfuse_tracer.calculate_cost")
     @patch("fm_review.langfuse_tracer.send_to_langfuse")
-    @patch("fm_review.langfuse_tracer.save_offset")
-    @patch("fm_review.langfuse_tracer.get_last_offset")
-    def test_main_success(self, mock_get_offset, mock_save, mock_send, mock_calc, mock_detect, mock_parse, mock_read, tmp_path):
+    def test_main_success(self, mock_send, mock_detect, mock_read, tmp_path):
+        """Each invocation sends only new turns; running stats are persisted."""
+        def turn(msg_id, tokens, tool):
+            return json.dumps({"type": "assistant", "message": {
+                "role": "assistant", "id": msg_id, "model": "claude-sonnet-4-6",
+                "usage": {"input_tokens": tokens},
+                "content": [{"type": "tool_use", "name": tool}]}}) + "\n"
+
         transcript = tmp_path / "t.jsonl"
-        transcript.write_text("")
+        transcript.write_text(turn("m1", 100, "Read"))
         mock_read.return_value = json.dumps({"transcript_path": str(transcript), "session_id": "sess_1"})
-
-        mock_get_offset.return_value = 0
-        stats = SessionStats(turn_count=1)
-        mock_parse.return_value = (stats, 5)
         mock_detect.return_value = (1, "Architect")
-        mock_calc.return_value = 0.5
 
         main()
+        with open(transcript, "a") as f:
+            f.write(turn("m1", 100, "Read") + turn("m2", 30, "Bash"))
+        main()
+
+        mock_detect.assert_called_once_with(str(transcript))
+        first, second = (c.args[0] for c in mock_send.call_args_list)
+        assert (first.input_tokens, first.tool_calls) == (100, {"Read": 1})
+        assert (second.input_tokens, second.turn_count, second.tool_calls) == (30, 1, {"Bash": 1})
+        assert second.agent_name == "Architect" and second.session_id == "sess_1"
+        assert mock_send.call_args.args[2] == "sess_1"
+        offset, session = load_state(str(transcript))
+        assert offset == transcript.stat().st_size
+        assert session.input_tokens == 130 and {"m1", "m2"} <= session.seen_message_ids
+        assert [t["index"] for t in second.turns] == [2]
+        assert session.turns == []
+
+    @patch("sys.stdin.read")
+    @patch.dict("os.environ", {"LANGFUSE_PUBLIC_KEY": "pk"})
+    @patch("fm_review.langfuse_tracer.detect_agent", return_value=(None, "interactive"))
+    def test_main_spools_trace(self, mock_detect, mock_read, tmp_path):
+        """The hook writes the trace to the spool instead of calling Langfuse."""
+        from fm_review.langfuse_spool import LangfuseSpool
+        transcript = tmp_path / "t.jsonl"
+        transcript.write_text(json.dumps({"type": "assistant", "message": {
+            "role": "assistant", "id": "m1", "usage": {"input_tokens": 5}}}) + "\n")
+        mock_read.return_value = json.dumps({"transcript_path": str(transcript), "session_id": "sess_1"})
+
+        with patch("langfuse.get_client") as mock_get_client:
+            main()
 
-        mock_detect.assert_called_with(str(transcript))
-        mock_send.assert_called_with(stats, 0.5, "sess_1")
-        mock_save.assert_called_with(str(transcript), 5)
+        mock_get_client.assert_not_called()
+        record = json.loads((tmp_path / ".langfuse_state" / "spool.jsonl").read_text())
+        assert record["trace"]["trace"]["session_id"] == "sess_1"
+        assert [c["kwargs"]["name"] for c in record["trace"]["children"]] == ["turn-1"]
+        assert LangfuseSpool(tmp_path / ".langfuse_state").status()["queued"] == 1
 
     @patch("sys.stdin.read", side_effect=Exception("Crash"))
     @patch("sys.exit")
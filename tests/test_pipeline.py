@@ -450,7 +450,8 @@ class TestPipelineTracerInitReal:
         mock_client = MagicMock()
         # get_client is imported inline in _init, so patch via builtins __import__
         import langfuse
-        with patch.object(langfuse, "get_client", return_value=mock_client):
+        with patch.object(langfuse, "get_client", return_value=mock_client), \
+                patch("fm_review.langfuse_spool.SPOOL_ENABLED", False):
             from fm_review.pipeline_tracer import PipelineTracer as PT
             tracer = PT("TEST", "sonnet")
             assert os.environ.get("LANGFUSE_HOST") == "https://langfuse.test.com"
@@ -463,11 +464,43 @@ class TestPipelineTracerInitReal:
         os.environ.pop("LANGFUSE_BASE_URL", None)
         os.environ.pop("LANGFUSE_HOST", None)
         import langfuse
-        with patch.object(langfuse, "get_client", side_effect=ImportError("no langfuse")):
+        with patch.object(langfuse, "get_client", side_effect=ImportError("no langfuse")), \
+                patch("fm_review.langfuse_spool.SPOOL_ENABLED", False):
             from fm_review.pipeline_tracer import PipelineTracer as PT
             tracer = PT("TEST", "sonnet")
             assert tracer.enabled is False
 
+    @patch.dict(os.environ, {"LANGFUSE_PUBLIC_KEY": "pk"})
+    def test_spool_mode_records_to_spool(self, tmp_path):
+        """With the spool on, a pipeline run is spooled on finish() instead of sent."""
+        from fm_review.langfuse_spool import LangfuseSpool, SpoolClient
+        from fm_review.pipeline_tracer import PipelineTracer as PT
+        tracer = PT("TEST", "sonnet")
+        assert isinstance(tracer.langfuse, SpoolClient)
+        tracer.start_pipeline()
+        span = tracer.start_agent(1, "Architect")
+        tracer.end_agent(span, AgentResult(agent_id=1, status="completed", cost_usd=0.5))
+        tracer.finish(0.5, 10.0, {"1": {"status": "completed"}})
+        # checkpoints after start_pipeline and end_agent, then the final flush
+        assert LangfuseSpool(tmp_path / ".langfuse_state").status() == {"queued": 3, "dead": 0}
+
+    @patch.dict(os.environ, {"LANGFUSE_PUBLIC_KEY": "pk"})
+    def test_crash_before_finish_keeps_ended_agents(self, tmp_path):
+        """A run that dies before finish() has its ended agent spans in the spool."""
+        import json
+
+        from fm_review.pipeline_tracer import PipelineTracer as PT
+        tracer = PT("TEST", "sonnet")
+        tracer.start_pipeline()
+        span = tracer.start_agent(1, "Architect")
+        tracer.end_agent(span, AgentResult(agent_id=1, status="completed"))
+        tracer.start_agent(2, "Defender")  # still running when the process dies
+        lines = (tmp_path / ".langfuse_state" / "spool.jsonl").read_text().splitlines()
+        last = json.loads(lines[-1])
+        assert [c["kwargs"]["name"] for c in last["trace"]["children"]] == ["agent-1-Architect"]
+        assert last["trace"]["children"][0]["ended_at"] is not None
+        assert {json.loads(line)["seed"] for line in lines} == {last["seed"]}
+
     @patch.dict(os.environ, {
         "LANGFUSE_PUBLIC_KEY": "pk",
         "LANGFUSE_HOST": "https://existing.host.com",
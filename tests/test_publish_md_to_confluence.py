@@ -0,0 +1,305 @@
+"""
+Tests for publish_md_to_confluence.py — Markdown to Confluence publisher.
+
+Covers: section splitting, incremental (per-section cached) conversion,
+cross-reference linker and its data file, directory publish.
+"""
+import json
+import re
+import sys
+import threading
+import urllib.error
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+pytest.importorskip("markdown")
+
+# Add scripts to path
+SCRIPTS_DIR = Path(__file__).parent.parent / "scripts"
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+import publish_md_to_confluence as md_publish  # noqa: E402
+from publish_md_to_confluence import (  # noqa: E402
+    TOC_MACRO,
+    CrossRefLinker,
+    SectionCache,
+    linkify_cross_refs,
+    load_cross_refs,
+    md_to_confluence_xhtml,
+    publish_directory,
+    record_cross_ref,
+    split_sections,
+)
+
+DOC = """# ТЗ
+
+Вступление, см. phase1a_domain_model.md и [ссылку][ref].
+
+## Содержание
+
+1. [Раздел](#razdel)
+
+## Раздел
+
+| A | B |
+|---|---|
+| 1 | 2 |
+
+```python
+## not a heading
+print(1)
+```
+
+## Раздел
+
+Второй раздел с тем же заголовком.
+
+[ref]: https://example.com
+"""
+
+
+# ── Section Tests ─────────────────────────────────────────
+
+class TestSplitSections:
+    def test_split_at_headings_outside_fences(self):
+        """Sections start at # / ## headings; headings inside code fences do not split."""
+        sections = split_sections(DOC)
+        assert [s.splitlines()[0] for s in sections] == ["# ТЗ", "## Содержание", "## Раздел", "## Раздел"]
+        assert "".join(sections) == DOC
+
+    def test_no_headings(self):
+        assert split_sections("text\nmore\n") == ["text\nmore\n"]
+
+    def test_fence_with_info_string_does_not_close(self):
+        """A fence line with an info string inside a block is code, as in the converter."""
+        doc = "```\nouter\n```markdown\n## Inner\n```\n"
+        assert split_sections(doc) == [doc]
+        assert "<h2" not in md_to_confluence_xhtml(doc)
+
+    def test_unclosed_fence_is_not_code(self):
+        """Without a closing fence the converter renders headings, so they split."""
+        assert len(split_sections("# A\n```\nx\n## B\n")) == 2
+
+
+# ── Incremental Conversion Tests ──────────────────────────
+
+class TestIncrementalConversion:
+    def test_page_layout(self):
+        """TOC macro once at the top, cross-refs and shared reference links resolved."""
+        html = md_to_confluence_xhtml(DOC)
+        assert html.startswith(TOC_MACRO + "\n")
+        assert html.count('ac:name="toc"') == 1
+        assert "Phase 1A: Domain Model" in html
+        assert 'href="https://example.com"' in html
+        assert "Содержание" not in html
+        assert 'ac:name="code"' in html and "## not a heading" in html
+
+    def test_duplicate_heading_ids_across_sections(self):
+        """Heading ids stay unique across separately converted sections."""
+        html = md_to_confluence_xhtml(DOC + "\n## Раздел\n\nТретий.\n")
+        ids = re.findall(r'<h[1-6] id="([^"]*)"', html)
+        assert len(ids) == 4 and len(set(ids)) == 4
+
+    def test_cached_equals_uncached(self, tmp_path):
+        assert md_to_confluence_xhtml(DOC, cache=SectionCache(tmp_path)) == md_to_confluence_xhtml(DOC)
+
+    def test_only_changed_sections_rendered(self, tmp_path):
+        """Second run renders only the edited section."""
+        md_to_confluence_xhtml(DOC, cache=SectionCache(tmp_path))
+        edited = DOC.replace("Второй раздел", "Изменённый раздел")
+        cache = SectionCache(tmp_path)
+        with patch.object(md_publish, "convert_section", wraps=md_publish.convert_section) as convert:
+            html = md_to_confluence_xhtml(edited, cache=cache)
+        assert convert.call_count == 1
+        assert (cache.hits, cache.misses) == (3, 1)
+        assert html == md_to_confluence_xhtml(edited)
+
+    def test_cross_ref_change_invalidates(self, tmp_path):
+        """A changed cross-reference map re-renders every section."""
+        md_to_confluence_xhtml(DOC, cache=SectionCache(tmp_path))
+        refs = dict(md_publish.CROSS_REFS, **{"phase1a_domain_model.md": ("1", "Renamed")})
+        cache = SectionCache(tmp_path)
+        with patch.object(md_publish, "CROSS_REFS", refs):
+            html = md_to_confluence_xhtml(DOC, cache=cache)
+        assert cache.hits == 0
+        assert "Renamed" in html
+
+
+# ── Cross-Reference Linker Tests ──────────────────────────
+
+URL = "https://confluence.example"
+REFS = {"phase1a_domain_model.md": ("1", "Phase 1A"), "TZ-GO-v1.0.md": ("2", "ТЗ Go")}
+
+
+def _link(text):
+    return CrossRefLinker(REFS, {"83951683": "ФМ"}, URL).link(text)
+
+
+class TestCrossRefLinker:
+    def test_backticks_and_bare_names(self):
+        assert _link("см. `phase1a_domain_model.md` и TZ-GO-v1.0.md") == (
+            f"см. [Phase 1A]({URL}/pages/viewpage.action?pageId=1) и "
+            f"[ТЗ Go]({URL}/pages/viewpage.action?pageId=2)")
+
+    def test_existing_links_untouched(self):
+        text = "[doc](phase1a_domain_model.md) and `./phase1a_domain_model.md`"
+        assert _link(text) == text
+
+    def test_short_name_with_section(self):
+        assert _link("phase1a, секция 5.1") == f"[Phase 1A, секция 5.1]({URL}/pages/viewpage.action?pageId=1)"
+        assert _link("TZ-GO-v1.0, секции 2") == f"[ТЗ Go, секции 2]({URL}/pages/viewpage.action?pageId=2)"
+
+    def test_known_page_ids(self):
+        assert _link("Confluence PAGE_ID 83951683") == f"Confluence [ФМ]({URL}/pages/viewpage.action?pageId=83951683)"
+        assert _link("PAGE_ID 839516830") == "PAGE_ID 839516830"
+
+    def test_empty_map(self):
+        assert CrossRefLinker({}, {}, URL).link("phase1a_domain_model.md") == "phase1a_domain_model.md"
+
+    def test_path_keys_link_within_their_directory(self):
+        """Published files link from their own directory only; siblings beat bare names."""
+        refs = {"docs/README.md": ("10", "Docs"), "projects/A/README.md": ("11", "A"),
+                "README.md": ("12", "Global"), "docs/guide.md": ("13", "Guide")}
+        assert "pageId=10" in CrossRefLinker(refs, {}, URL, "docs").link("README.md")
+        assert "pageId=11" in CrossRefLinker(refs, {}, URL, "projects/A").link("README.md")
+        other = CrossRefLinker(refs, {}, URL, "projects/B")
+        assert "pageId=12" in other.link("README.md")
+        assert other.link("guide.md") == "guide.md"
+
+
+class TestCrossRefData:
+    def test_shipped_map_loaded(self):
+        """The module map comes from config/confluence_cross_refs.json."""
+        cross_refs, known_pages = load_cross_refs()
+        assert cross_refs["phase1a_domain_model.md"] == ("86049881", "Phase 1A: Domain Model")
+        assert known_pages["83951683"] == "ФМ FM-LS-PROFIT"
+
+    def test_record_updates_file_and_linker(self, tmp_path):
+        """A recorded page is written to the data file and linked immediately."""
+        path = tmp_path / "refs.json"
+        with patch.object(md_publish, "CROSS_REFS", {}), patch.object(md_publish, "KNOWN_PAGES", {}):
+            assert linkify_cross_refs("new_doc.md") == "new_doc.md"
+            record_cross_ref("new_doc.md", "42", "New Doc", path=path)
+            assert "[New Doc](" in linkify_cross_refs("см. new_doc.md")
+        assert load_cross_refs(path) == ({"new_doc.md": ("42", "New Doc")}, {"42": "New Doc"})
+
+    def test_record_refuses_other_page(self, tmp_path):
+        """An entry is never silently remapped to a different page."""
+        path = tmp_path / "refs.json"
+        with patch.object(md_publish, "CROSS_REFS", {}), patch.object(md_publish, "KNOWN_PAGES", {}):
+            record_cross_ref("docs/README.md", "42", "Docs", path=path)
+            record_cross_ref("docs/README.md", "42", "Docs v2", path=path)
+            with pytest.raises(ValueError, match="already mapped to page 42"):
+                record_cross_ref("docs/README.md", "43", "Other", path=path)
+        assert load_cross_refs(path)[0] == {"docs/README.md": ("42", "Docs v2")}
+
+    def test_doc_key(self, tmp_path):
+        assert md_publish.doc_key(md_publish.REPO_ROOT / "docs" / "CHANGELOG.md") == "docs/CHANGELOG.md"
+        assert md_publish.doc_key(md_publish.REPO_ROOT / "README.md") == "./README.md"
+        assert md_publish.doc_key(tmp_path / "x.md") == (tmp_path / "x.md").resolve().as_posix()
+
+    def test_missing_file(self, tmp_path):
+        assert load_cross_refs(tmp_path / "none.json") == ({}, {})
+
+
+# ── Directory Publish Tests ───────────────────────────────
+
+class FakeConfluence:
+    """_api_request stand-in: POST creates pages, GET returns versions, PUT bumps them."""
+
+    def __init__(self, fail_titles=()):
+        self.lock = threading.Lock()
+        self.pages = {"500": {"title": "Existing", "version": 3}}
+        self.bodies = {}
+        self.fail_titles = set(fail_titles)
+        self.next_id = 900
+
+    def __call__(self, url, data=None, method="GET"):
+        payload = json.loads(data) if data else None
+        with self.lock:
+            if method == "POST":
+                if payload["title"] in self.fail_titles:
+                    raise urllib.error.HTTPError(url, 400, "Bad Request", {}, None)
+                self.next_id += 1
+                page_id = str(self.next_id)
+                self.pages[page_id] = {"title": payload["title"], "version": 1}
+                return {"id": page_id, "title": payload["title"], "version": {"number": 1}}
+            page_id = url.rsplit("/", 1)[1].split("?")[0]
+            if method == "GET":
+                return {"id": page_id, "version": {"number": self.pages[page_id]["version"]}}
+            self.pages[page_id]["version"] = payload["version"]["number"]
+            self.bodies[page_id] = payload["body"]["storage"]["value"]
+            return {"id": page_id, "title": payload["title"], "version": payload["version"]}
+
+
+@pytest.fixture
+def docs_dir(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "existing.md").write_text("# Existing\n\nСм. new_doc.md\n", encoding="utf-8")
+    (docs / "new_doc.md").write_text("# New Doc\n\nСм. existing.md\n", encoding="utf-8")
+    return docs
+
+
+@pytest.fixture
+def refs_file(tmp_path):
+    path = tmp_path / "refs.json"
+    key = md_publish.doc_key(tmp_path / "docs" / "existing.md")
+    path.write_text(json.dumps({"cross_refs": {key: {"page_id": "500", "title": "Existing"}}}),
+                    encoding="utf-8")
+    cross_refs, known_pages = load_cross_refs(path)
+    with patch.object(md_publish, "CROSS_REFS_FILE", path), \
+            patch.object(md_publish, "CROSS_REFS", cross_refs), \
+            patch.object(md_publish, "KNOWN_PAGES", known_pages):
+        yield path
+
+
+class TestPublishDirectory:
+    def test_creates_missing_then_updates_all(self, docs_dir, refs_file):
+        """New pages exist before conversion, so links to them carry their IDs."""
+        fake = FakeConfluence()
+        with patch.object(md_publish, "_api_request", side_effect=fake):
+            summary = publish_directory(str(docs_dir), "EW", parent_id="1", workers=2)
+        assert summary["created"] == ["new_doc.md"]
+        assert [(r["file"], r["id"], r["version"]) for r in summary["updated"]] == [
+            ("existing.md", "500", 4), ("new_doc.md", "901", 2)]
+        assert not summary["failed"]
+        assert "pageId=901" in fake.bodies["500"]
+        assert "pageId=500" in fake.bodies["901"]
+        assert load_cross_refs(refs_file)[0][md_publish.doc_key(docs_dir / "new_doc.md")] == ("901", "New Doc")
+
+    def test_second_run_creates_nothing(self, docs_dir, refs_file):
+        fake = FakeConfluence()
+        with patch.object(md_publish, "_api_request", side_effect=fake):
+            publish_directory(str(docs_dir), "EW", workers=2)
+            summary = publish_directory(str(docs_dir), "EW", workers=2)
+        assert summary["created"] == []
+        assert len(summary["updated"]) == 2
+
+    def test_failed_create_reported(self, docs_dir, refs_file):
+        """A page that cannot be created is reported; the others are still updated."""
+        fake = FakeConfluence(fail_titles={"New Doc"})
+        with patch.object(md_publish, "_api_request", side_effect=fake):
+            summary = publish_directory(str(docs_dir), "EW", workers=2)
+        assert list(summary["failed"]) == ["new_doc.md"]
+        assert [r["file"] for r in summary["updated"]] == ["existing.md"]
+
+    def test_same_file_name_in_two_directories(self, tmp_path, docs_dir, refs_file):
+        """A same-named file in another directory gets its own page; neither page is overwritten."""
+        other = tmp_path / "other"
+        other.mkdir()
+        (other / "existing.md").write_text("# Other Existing\n", encoding="utf-8")
+        fake = FakeConfluence()
+        with patch.object(md_publish, "_api_request", side_effect=fake):
+            publish_directory(str(docs_dir), "EW", workers=2)
+            summary = publish_directory(str(other), "EW", workers=2)
+        assert summary["created"] == ["existing.md"]
+        (updated,) = summary["updated"]
+        assert updated["id"] not in ("500", "901")
+        assert fake.pages["500"]["version"] == 4
+        assert "pageId=901" in fake.bodies["500"]
+        cross_refs = load_cross_refs(refs_file)[0]
+        assert cross_refs[md_publish.doc_key(other / "existing.md")][0] == updated["id"]
+        assert cross_refs[md_publish.doc_key(docs_dir / "existing.md")][0] == "500"
@@ -565,7 +565,7 @@ class TestMainDocxMode:
                         with patch("fm_review.xhtml_sanitizer.sanitize_xhtml") as mock_sanitize:
                             def sanitize_identity(body, *a, **k):
                                 return (body, [])
-                            mock_sanitize.side_effect = lambda x: (x, [])
+                            mock_sanitize.side_effect = lambda x, **k: (x, [])
                             from publish_to_confluence import main
                             main()
         assert mock_client.update_page.called
@@ -612,12 +612,81 @@ class TestMainDocxMode:
                 with patch("publish_to_confluence._get_page_id", return_value="99999"):
                     with patch("fm_review.confluence_utils.ConfluenceClient", return_value=mock_client):
                         with patch("fm_review.xhtml_sanitizer.sanitize_xhtml") as mock_sanitize:
-                            mock_sanitize.side_effect = lambda x: (x, [])
+                            mock_sanitize.side_effect = lambda x, **k: (x, [])
                             from publish_to_confluence import main
                             main()
         assert mock_client.update_page.called
 
 
+# ── Single-scan table classification and streaming conversion ───────────
+
+class TestScanAndClassify:
+    def _rows(self, *texts):
+        return [[(t, None) for t in row] for row in texts]
+
+    def test_classify_meta_before_history(self):
+        from publish_to_confluence import classify_table
+        rows = self._rows(["Версия", "0.1"], ["Дата", "x"], ["Статус", "D"])
+        assert classify_table(rows) == "meta"
+
+    def test_classify_history_needs_three_rows(self):
+        from publish_to_confluence import classify_table
+        assert classify_table(self._rows(["Версия", "Дата"], ["1", "2"], ["3", "4"])) == "history"
+        assert classify_table(self._rows(["Версия", "Дата"], ["1", "2"])) is None
+
+    def test_classify_panels(self):
+        from publish_to_confluence import classify_table
+        assert classify_table(self._rows(["Критичная зависимость"])) == "warning"
+        assert classify_table(self._rows(["⚠ Важно"])) == "note"
+        assert classify_table(self._rows(["plain"])) is None
+        assert classify_table([]) is None
+
+    def test_code_system_table(self):
+        from publish_to_confluence import is_code_system_table
+        assert is_code_system_table(self._rows(["Код", "Описание"]))
+        assert not is_code_system_table(self._rows(["Код", "Значение"]))
+
+    def test_scan_reads_merged_cell_once(self):
+        """A <w:tc> repeated by a horizontal merge is read once."""
+        with patch("publish_to_confluence.get_cell_color", return_value="DCFCE7") as mock_gcc:
+            from publish_to_confluence import scan_table
+            cell = MagicMock()
+            cell.text = " merged "
+            row = MagicMock()
+            row.cells = [cell, cell, cell]
+            table = MagicMock()
+            table.rows = [row]
+            assert scan_table(table) == [[("merged", "DCFCE7")] * 3]
+        assert mock_gcc.call_count == 1
+
+
+class TestIterDocxXhtml:
+    def test_matches_built_content(self, capsys):
+        """_build_content_from_docx is the joined stream; tables render by kind."""
+        docx = pytest.importorskip("docx")
+        from publish_to_confluence import _build_content_from_docx, iter_docx_xhtml
+        doc = docx.Document()
+        doc.add_paragraph("Заголовок", style="Heading 1")
+        doc.add_paragraph("* пункт")
+        history = doc.add_table(rows=3, cols=2)
+        history.rows[0].cells[0].text = "История"
+        panel = doc.add_table(rows=1, cols=1)
+        panel.rows[0].cells[0].text = "⛔ Критично"
+        codes = doc.add_table(rows=2, cols=2)
+        codes.rows[0].cells[0].text = "Код"
+        codes.rows[0].cells[1].text = "Описание"
+        doc.add_paragraph("Маршруты согласования")
+        doc.add_paragraph("Обычный текст")
+
+        parts = list(iter_docx_xhtml(doc, "FM-T"))
+        assert parts[1:4] == ["<h1><strong>Заголовок</strong></h1>", "<ul>", "<li>пункт</li>"]
+        assert "Первая публикация в Confluence" in parts[5]
+        assert parts[6].startswith('<ac:structured-macro ac:name="warning">')
+        assert "Маршруты согласования" not in "".join(parts)
+        assert parts[-1] == "<p>Обычный текст</p>"
+        assert _build_content_from_docx(doc, "FM-T") == "\n".join(parts)
+
+
 # ── __main__ block ────────────────────────────────────────────────────────
 
 class TestMainBlock:
@@ -0,0 +1,86 @@
+"""
+Tests for src/fm_review/sanitize_cache.py
+
+Covers: hit/miss, ruleset invalidation, LRU eviction, per-page warnings, CLI.
+"""
+import json
+import os
+from unittest.mock import patch
+
+import pytest
+
+from fm_review import sanitize_cache
+from fm_review.sanitize_cache import SanitizeCache, body_hash, main, sanitize_xhtml_cached
+
+DIRTY = '<p onclick="x()">Claude</p>'
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SanitizeCache(tmp_path / "cache")
+
+
+class TestSanitizeCache:
+    def test_repeat_is_served_from_cache(self, tmp_path):
+        """Second sanitization of the same body does not run the sanitizer, even in a new process."""
+        first = SanitizeCache(tmp_path).sanitize(DIRTY, mode="tokens")
+        assert first[0] == "<p>Claude</p>"
+        with patch("fm_review.xhtml_sanitizer.sanitize_xhtml") as sanitizer:
+            assert SanitizeCache(tmp_path).sanitize(DIRTY, mode="tokens") == first
+        sanitizer.assert_not_called()
+
+    def test_unchanged_body_not_stored_twice(self, cache):
+        """Clean bodies are stored as 'unchanged' and returned as the input."""
+        body = "<p>Clean</p>"
+        cache.sanitize(body, mode="tokens")
+        entry = json.loads(cache._entry_file(body_hash(body), "tokens").read_text())
+        assert entry["unchanged"] is True and entry["body"] is None
+        assert SanitizeCache(cache.cache_dir).get(body, "tokens") == (body, [])
+
+    def test_other_ruleset_is_miss(self, cache):
+        """An entry written under another ruleset version is ignored."""
+        cache.sanitize(DIRTY, mode="tokens")
+        with patch("fm_review.xhtml_sanitizer.RULESET_VERSION", "other"):
+            assert SanitizeCache(cache.cache_dir).get(DIRTY, "tokens") is None
+
+    def test_modes_cached_separately(self, cache):
+        cache.sanitize("<p><foo>x</foo></p>", mode="tokens")
+        assert SanitizeCache(cache.cache_dir).get("<p><foo>x</foo></p>", "stream") is None
+
+    def test_lru_eviction(self, tmp_path):
+        """Least recently used entries are evicted above max_entries."""
+        cache = SanitizeCache(tmp_path, max_entries=2)
+        for i, body in enumerate(["<p>a</p>", "<p>b</p>"]):
+            cache.sanitize(body, mode="tokens")
+            os.utime(cache._entry_file(body_hash(body), "tokens"), (1000 + i, 1000 + i))
+        SanitizeCache(tmp_path).get("<p>a</p>", "tokens")  # touch a: b is now oldest
+        cache.sanitize("<p>c</p>", mode="tokens")
+        assert not cache._entry_file(body_hash("<p>b</p>"), "tokens").exists()
+        assert cache._entry_file(body_hash("<p>a</p>"), "tokens").exists()
+
+    def test_page_warnings(self, cache):
+        """Warnings of the last body sanitized for a page are readable without the body."""
+        assert cache.page_warnings("p1") is None
+        cache.sanitize(DIRTY, mode="tokens", page_id="p1")
+        assert cache.page_warnings("p1") == ["Removed 1 event handler(s)", "AI/Agent mentions detected: Claude"]
+        with patch("fm_review.xhtml_sanitizer.RULESET_VERSION", "other"):
+            assert cache.page_warnings("p1") is None
+
+    def test_default_cache_dir(self, tmp_path):
+        """sanitize_xhtml_cached uses SANITIZE_CACHE_DIR (isolated by conftest)."""
+        sanitize_xhtml_cached(DIRTY, mode="tokens")
+        assert list(sanitize_cache.SANITIZE_CACHE_DIR.glob("*.tokens.json"))
+
+
+class TestCli:
+    def test_page_id(self, cache, capsys):
+        cache.sanitize(DIRTY, mode="tokens", page_id="p1")
+        assert main(["--dir", str(cache.cache_dir), "--page-id", "p1"]) == 0
+        assert "Removed 1 event handler(s)" in capsys.readouterr().out
+        assert main(["--dir", str(cache.cache_dir), "--page-id", "p2"]) == 3
+
+    def test_file(self, cache, tmp_path, capsys):
+        path = tmp_path / "body.xhtml"
+        path.write_text(DIRTY, encoding="utf-8")
+        assert main(["--dir", str(cache.cache_dir), "--file", str(path), "--mode", "tokens"]) == 0
+        assert "AI/Agent mentions detected: Claude" in capsys.readouterr().out
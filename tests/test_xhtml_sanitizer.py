@@ -1,4 +1,9 @@
-from fm_review.xhtml_sanitizer import sanitize_xhtml
+from fm_review.xhtml_sanitizer import (
+    iter_sanitized_xhtml,
+    sanitize_xhtml,
+    sanitize_xhtml_parallel,
+    split_top_level,
+)
 
 
 def test_sanitize_clean_body():
@@ -46,6 +51,13 @@ def test_sanitize_ai_mentions():
     assert result == body
     assert any("AI/Agent mentions detected" in w for w in warnings)
 
+def test_sanitize_ai_mentions_in_attributes_and_comments():
+    body = '<p title="Claude">a</p><!-- GPT --><p onclick="LLM()">b</p>'
+    for mode in ("tokens", "stream"):
+        _, warnings = sanitize_xhtml(body, mode=mode)
+        found = {"tokens": "Claude, GPT", "stream": "Claude"}[mode]  # stream drops comments
+        assert f"AI/Agent mentions detected: {found}" in warnings
+
 def test_sanitize_blue_header():
     body = '<th style="color: rgb(59, 115, 175)">Header</th>'
     result, warnings = sanitize_xhtml(body)
@@ -124,3 +136,105 @@ def test_multiple_unknown_elements():
     assert len(non_wl) == 1
     assert "audio" in non_wl[0]
     assert "canvas" in non_wl[0]
+
+def test_sanitize_unchanged_body_is_same_object():
+    body = '<h2>Title</h2><p class="x">A &amp; B</p><ac:structured-macro ac:name="info"/>'
+    result, warnings = sanitize_xhtml(body)
+    assert result is body
+    assert not warnings
+
+def test_sanitize_js_url_value_removed_whole():
+    body = '<a href=" javascript:alert(1)" title="t">Link</a>'
+    result, _ = sanitize_xhtml(body)
+    assert result == '<a href="" title="t">Link</a>'
+
+def test_sanitize_handler_keeps_other_attributes():
+    body = '<p onmouseover="x()" class="note" ONCLICK=\'y\'>Text</p>'
+    result, warnings = sanitize_xhtml(body)
+    assert result == '<p class="note">Text</p>'
+    assert "Removed 2 event handler(s)" in warnings
+
+def test_sanitize_macro_parameter_names_not_flagged():
+    body = ('<ac:structured-macro ac:name="expand"><ac:parameter ac:name="title">T</ac:parameter>'
+            '</ac:structured-macro>')
+    _, warnings = sanitize_xhtml(body)
+    assert not warnings
+
+def test_sanitize_rules_not_applied_inside_cdata():
+    body = '<ac:plain-text-body><![CDATA[<script>x</script> onclick="y"]]></ac:plain-text-body>'
+    result, warnings = sanitize_xhtml(body)
+    assert result is body
+    assert not any("Removed" in w for w in warnings)
+
+def test_sanitize_wellformedness_error_position():
+    _, warnings = sanitize_xhtml("<p>a</p>\n<p>b &nbsp;</p>")
+    assert warnings == ["XHTML well-formedness error: undefined entity &nbsp;: line 2, column 5"]
+
+def test_stream_forbidden_element_dropped_with_content():
+    body = '<p onclick="x()" class="c">A<script>alert(1)<b>b</b></script>B</p><a href="javascript:x">L</a>'
+    result, warnings = sanitize_xhtml(body, mode="stream")
+    assert result == '<p class="c">AB</p><a href="">L</a>'
+    assert warnings == ["Removed forbidden tags: script", "Removed 1 event handler(s)",
+                        "Removed javascript: URL(s)"]
+
+def test_stream_unknown_macro_removed():
+    body = ('<ac:structured-macro ac:name="bogus"><ac:rich-text-body><p>x</p></ac:rich-text-body>'
+            '</ac:structured-macro><ac:structured-macro ac:name="info"><ac:parameter ac:name="title">T'
+            '</ac:parameter></ac:structured-macro>')
+    result, warnings = sanitize_xhtml(body, mode="stream")
+    assert result == ('<ac:structured-macro ac:name="info"><ac:parameter ac:name="title">T'
+                      '</ac:parameter></ac:structured-macro>')
+    assert warnings == ["Unknown Confluence macros: bogus"]
+
+def test_stream_non_whitelisted_element_unwrapped():
+    result, warnings = sanitize_xhtml("<p>a <audio>b <b>c</b></audio> d</p>", mode="stream")
+    assert result == "<p>a b <b>c</b> d</p>"
+    assert warnings == ["Removed non-whitelisted elements: audio"]
+
+def test_stream_code_body_kept_as_cdata_and_not_flagged():
+    body = ('<ac:structured-macro ac:name="code"><ac:plain-text-body>'
+            '<![CDATA[if a < b: print("Claude") # <script>]]></ac:plain-text-body></ac:structured-macro>')
+    result, warnings = sanitize_xhtml(body, mode="stream")
+    assert result == body
+    assert not warnings
+
+def test_stream_empty_elements_self_close():
+    body = '<p>a<br/>b</p><ac:image><ri:attachment ri:filename="x.png"/></ac:image>'
+    result, _ = sanitize_xhtml(body, mode="stream")
+    assert result == '<p>a<br />b</p><ac:image><ri:attachment ri:filename="x.png" /></ac:image>'
+
+def test_stream_pieces_split_anywhere():
+    body = '<h2>T</h2><p class="x">Agent 3 &amp; <em>text</em></p>'
+    warnings = []
+    pieces = list(iter_sanitized_xhtml([body[i:i + 5] for i in range(0, len(body), 5)], warnings))
+    assert len(pieces) > 1
+    assert "".join(pieces) == body
+    assert warnings == ["AI/Agent mentions detected: Agent 3"]
+
+def test_stream_malformed_falls_back_to_tokens():
+    result, warnings = sanitize_xhtml("<p onclick='x'>a &nbsp;</p>", mode="stream")
+    assert result == "<p>a &nbsp;</p>"
+    assert any("XHTML well-formedness error: undefined entity &nbsp;" in w for w in warnings)
+
+PAGE = "".join(
+    f'<h2>Раздел {i}</h2><p class="x" onclick="f()">Текст {i}</p>'
+    f'<table><tbody><tr><td><p>ячейка</p><ul><li>пункт</li></ul></td></tr></tbody></table>'
+    for i in range(40)
+) + '<p>Claude</p><foo>x</foo><ac:structured-macro ac:name="bogus"/>'
+
+def test_split_top_level_at_block_ends():
+    chunks = split_top_level(PAGE, chunk_chars=500)
+    assert len(chunks) > 3
+    assert "".join(chunks) == PAGE
+    assert all(c.endswith(("</p>", "</table>")) for c in chunks[:-1])
+
+def test_parallel_matches_serial():
+    for mode in ("tokens", "stream"):
+        assert sanitize_xhtml_parallel(PAGE, mode=mode, workers=2, chunk_chars=500) == \
+            sanitize_xhtml(PAGE, mode=mode)
+
+def test_parallel_unbalanced_falls_back_to_serial():
+    body = PAGE[:len(PAGE) // 2] + "<div>" + PAGE[len(PAGE) // 2:]
+    result = sanitize_xhtml_parallel(body, workers=2, chunk_chars=500)
+    assert result == sanitize_xhtml(body)
+    assert any("well-formedness error" in w for w in result[1])